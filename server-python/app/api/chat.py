@@ -2,8 +2,9 @@
 Endpoints de la API para chat con IA
 """
 import logging
-from typing import Dict, Any
-from fastapi import APIRouter, HTTPException, Depends
+import math
+from typing import Dict, Any, Optional
+from fastapi import APIRouter, HTTPException, Depends, Request
 from fastapi.responses import StreamingResponse
 from app.models import (
     ChatRequest, 
@@ -13,6 +14,8 @@ from app.models import (
     ErrorResponse
 )
 from app.services.chat_service import ChatService
+from app.services.scheduler_service import SchedulerOverloadedError
+from app.services.model_router import UnknownModelError
 from app.dependencies import get_chat_service
 
 logger = logging.getLogger(__name__)
@@ -20,9 +23,33 @@ logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/chat", tags=["chat"])
 
 
+def _overloaded_exception(error: SchedulerOverloadedError) -> HTTPException:
+    """
+    Convierte un rechazo del planificador en una respuesta 429
+    
+    Args:
+        error: Error de sobrecarga del planificador
+        
+    Returns:
+        HTTPException con cabecera Retry-After
+    """
+    logger.warning(f"Petición de chat rechazada por sobrecarga: {str(error)}")
+    return HTTPException(
+        status_code=429,
+        detail=f"Servidor de IA saturado: {str(error)}",
+        headers={"Retry-After": str(max(1, math.ceil(error.retry_after)))}
+    )
+
+
+def _client_id(http_request: Request) -> Optional[str]:
+    """Obtiene el identificador del cliente para el reparto equitativo"""
+    return http_request.client.host if http_request.client else None
+
+
 @router.post("/", response_model=ChatResponse)
 async def chat(
     request: ChatRequest,
+    http_request: Request,
     chat_service: ChatService = Depends(get_chat_service)
 ):
     """
@@ -30,6 +57,7 @@ async def chat(
     
     Args:
         request: Petición de chat
+        http_request: Petición HTTP (identifica al cliente)
         chat_service: Servicio de chat inyectado
         
     Returns:
@@ -38,11 +66,19 @@ async def chat(
     try:
         logger.info(f"Procesando petición de chat: {request.message[:50]}...")
         
-        response = await chat_service.process_chat_request(request)
+        chat_service.check_admission(streaming=False, model=request.model)
+        response = await chat_service.process_chat_request(
+            request,
+            client_id=_client_id(http_request)
+        )
         
         logger.info(f"Chat procesado exitosamente para conversación: {response.conversation_id}")
         return response
         
+    except UnknownModelError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except SchedulerOverloadedError as e:
+        raise _overloaded_exception(e)
     except Exception as e:
         logger.error(f"Error en endpoint de chat: {str(e)}")
         raise HTTPException(
@@ -54,6 +90,7 @@ async def chat(
 @router.post("/stream")
 async def chat_stream(
     request: ChatRequest,
+    http_request: Request,
     chat_service: ChatService = Depends(get_chat_service)
 ):
     """
@@ -61,6 +98,7 @@ async def chat_stream(
     
     Args:
         request: Petición de chat
+        http_request: Petición HTTP (identifica al cliente)
         chat_service: Servicio de chat inyectado
         
     Returns:
@@ -69,13 +107,27 @@ async def chat_stream(
     try:
         logger.info(f"Procesando petición de chat streaming: {request.message[:50]}...")
         
+        # Rechazar antes de abrir el stream si no hay capacidad
+        chat_service.check_admission(streaming=True, model=request.model)
+        client_id = _client_id(http_request)
+        
         async def generate_response():
+            stream = chat_service.process_streaming_chat_request(
+                request,
+                client_id=client_id
+            )
             try:
-                async for chunk_data in chat_service.process_streaming_chat_request(request):
+                async for chunk_data in stream:
+                    # Si el cliente se fue, cerrar el stream cancela la generación
+                    if await http_request.is_disconnected():
+                        logger.info("Cliente desconectado, cancelando generación streaming")
+                        break
                     yield f"data: {chunk_data['chunk']}\n\n"
             except Exception as e:
                 logger.error(f"Error en streaming: {str(e)}")
                 yield f"data: [ERROR] {str(e)}\n\n"
+            finally:
+                await stream.aclose()
         
         return StreamingResponse(
             generate_response(),
@@ -87,6 +139,10 @@ async def chat_stream(
             }
         )
         
+    except UnknownModelError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except SchedulerOverloadedError as e:
+        raise _overloaded_exception(e)
     except Exception as e:
         logger.error(f"Error en endpoint de chat streaming: {str(e)}")
         raise HTTPException(
@@ -1,11 +1,16 @@
 """
 Endpoints de la API para gestión de documentos
 """
+import asyncio
+import json
 import logging
-from typing import Dict, Any
-from fastapi import APIRouter, HTTPException, Depends
+from typing import Dict, Any, AsyncIterator, Optional
+from fastapi import APIRouter, HTTPException, Depends, File, Form, Request, UploadFile
+from fastapi.responses import StreamingResponse
+from starlette.types import Receive, Scope, Send
 from app.models import DocumentRequest, DocumentResponse
 from app.services.chat_service import ChatService
+from app.services.document_loader import UnsupportedDocumentError, detect_format, iter_file_text
 from app.dependencies import get_chat_service
 
 logger = logging.getLogger(__name__)
@@ -34,13 +39,16 @@ async def add_document(
         result = await chat_service.add_document_to_context(
             content=request.content,
             metadata=request.metadata,
-            conversation_id=request.conversation_id
+            conversation_id=request.conversation_id,
+            document_key=request.document_key
         )
         
         return DocumentResponse(
             message="Documento añadido exitosamente",
             document_id=result["document_id"],
-            chunks_created=result["chunks_created"]
+            chunks_created=result["chunks_created"],
+            chunks_unchanged=result["chunks_unchanged"],
+            chunks_deleted=result["chunks_deleted"]
         )
         
     except Exception as e:
@@ -51,6 +59,134 @@ async def add_document(
         )
 
 
+@router.post("/upload", response_model=DocumentResponse)
+async def upload_document(
+    file: UploadFile = File(..., description="Fichero de texto, markdown o PDF"),
+    conversation_id: Optional[str] = Form(None),
+    document_key: Optional[str] = Form(None),
+    metadata: Optional[str] = Form(None, description="Metadatos en JSON"),
+    chat_service: ChatService = Depends(get_chat_service)
+):
+    """
+    Añade al contexto un fichero subido como multipart
+    
+    El parser multipart vuelca el fichero a disco mientras llega; después se
+    lee con mmap por secciones y el texto pasa al divisor según se decodifica,
+    sin cargar el fichero entero en memoria.
+    
+    Args:
+        file: Fichero subido (.txt, .md o .pdf)
+        conversation_id: ID de la conversación (opcional)
+        document_key: Clave de origen; al volver a subirlo se reemplazan sus chunks
+        metadata: Metadatos del documento como objeto JSON (opcional)
+        chat_service: Servicio de chat inyectado
+        
+    Returns:
+        Información sobre el documento añadido
+    """
+    try:
+        document_format = detect_format(file.filename, file.content_type)
+        document_metadata = json.loads(metadata) if metadata else {}
+        if not isinstance(document_metadata, dict):
+            raise ValueError("los metadatos deben ser un objeto JSON")
+    except UnsupportedDocumentError as e:
+        raise HTTPException(status_code=415, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Metadatos inválidos: {str(e)}")
+    
+    try:
+        logger.info(f"Añadiendo fichero '{file.filename}' de {file.size} bytes ({document_format})")
+        
+        # Los ficheros pequeños siguen en memoria: pasarlos a disco para mapearlos
+        await asyncio.to_thread(file.file.rollover)
+        result = await chat_service.add_document_to_context(
+            content="",
+            metadata={
+                **document_metadata,
+                "source": file.filename,
+                "format": document_format
+            },
+            conversation_id=conversation_id,
+            document_key=document_key,
+            parts=iter_file_text(file.file, document_format)
+        )
+        if result["document_id"] is None:
+            raise UnsupportedDocumentError(f"'{file.filename}' no contiene texto extraíble")
+        
+        return DocumentResponse(
+            message="Fichero añadido exitosamente",
+            document_id=result["document_id"],
+            chunks_created=result["chunks_created"],
+            chunks_unchanged=result["chunks_unchanged"],
+            chunks_deleted=result["chunks_deleted"]
+        )
+        
+    except UnsupportedDocumentError as e:
+        raise HTTPException(status_code=415, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error añadiendo fichero: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error añadiendo fichero: {str(e)}"
+        )
+
+
+class _DuplexStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse que no consume mensajes de la petición
+
+    Con ASGI < 2.4, StreamingResponse escucha la desconexión del cliente con
+    receive(), que compite con request.stream() por los fragmentos del cuerpo.
+    Aquí el cuerpo se sigue leyendo mientras se envía la respuesta, así que
+    la desconexión se detecta al leer el cuerpo o al enviar.
+    """
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await self.stream_response(send)
+
+
+async def _iter_lines(request: Request) -> AsyncIterator[str]:
+    """Recorre el cuerpo de la petición línea a línea según va llegando"""
+    pending = b""
+    async for data in request.stream():
+        pending += data
+        *lines, pending = pending.split(b"\n")
+        for line in lines:
+            yield line.decode("utf-8", errors="replace")
+    if pending:
+        yield pending.decode("utf-8", errors="replace")
+
+
+@router.post("/bulk")
+async def add_documents_bulk(
+    request: Request,
+    chat_service: ChatService = Depends(get_chat_service)
+):
+    """
+    Ingiere documentos en bloque desde un cuerpo NDJSON
+
+    Cada línea es un objeto {"key", "content", "metadata", "conversation_id"}
+    (solo "content" es obligatorio). La respuesta es NDJSON: una línea por
+    documento a medida que se completa y un resumen final. Repetir la misma
+    petición tras un fallo salta los documentos ya completados.
+
+    Args:
+        request: Petición con el cuerpo NDJSON
+        chat_service: Servicio de chat inyectado
+
+    Returns:
+        Stream NDJSON con el resultado de cada documento
+    """
+    async def generate_results():
+        async for result in chat_service.ingestion_service.ingest(_iter_lines(request)):
+            yield json.dumps(result, ensure_ascii=False) + "\n"
+
+    return _DuplexStreamingResponse(
+        generate_results(),
+        media_type="application/x-ndjson"
+    )
+
+
 @router.get("/stats")
 async def get_document_stats(
     chat_service: ChatService = Depends(get_chat_service)
@@ -65,7 +201,7 @@ async def get_document_stats(
         Estadísticas de la base de datos de documentos
     """
     try:
-        stats = chat_service.vector_db_service.get_collection_stats()
+        stats = await chat_service.vector_db_service.get_collection_stats()
         return stats
         
     except Exception as e:
@@ -4,11 +4,13 @@ Endpoints de la API para health check y estado del sistema
 import logging
 from typing import Dict, Any
 from fastapi import APIRouter, HTTPException, Depends
+from fastapi.responses import JSONResponse
 from app.models import HealthResponse
 from app.services.chat_service import ChatService
 from app.services.kafka_service import kafka_service
 from app.dependencies import get_chat_service
 from app.config import settings
+from app.metrics import metrics
 
 logger = logging.getLogger(__name__)
 
@@ -33,10 +35,8 @@ async def health_check(
         
         health_status = await chat_service.health_check()
         
-        # Verificar estado de Kafka si está habilitado
-        kafka_status = "disabled"
-        if settings.kafka_enable:
-            kafka_status = "available" if kafka_service.is_healthy() else "unavailable"
+        # Estado de Kafka según el último sondeo
+        kafka_status = health_status.get("kafka", "disabled")
         
         # Determinar estado general
         if "error" in health_status:
@@ -45,12 +45,15 @@ async def health_check(
                 detail="Servicios no disponibles"
             )
         
-        # Verificar disponibilidad de modelos
-        models_available = []
-        if health_status.get("llm_service") == "available":
-            models_available.append("phi3:3.8b")
+        # Verificar disponibilidad de modelos: los niveles de generación
+        # configurados que algún backend sirve, más el de embeddings
+        model_status = health_status.get("models", {})
+        models_available = [
+            model for model in chat_service.llm_service.router.tiers
+            if model_status.get(model) == "available"
+        ]
         if health_status.get("embedding_service") == "available":
-            models_available.append("nomic-embed-text")
+            models_available.append(chat_service.embedding_service.backend.model)
         
         return HealthResponse(
             status="healthy" if models_available else "unhealthy",
@@ -69,6 +72,84 @@ async def health_check(
         )
 
 
+@router.get("/live")
+async def liveness_check():
+    """
+    Indica que el proceso está vivo y su event loop responde
+    
+    No consulta dependencias: un fallo de Ollama o ChromaDB no debe provocar
+    el reinicio del servidor.
+    
+    Returns:
+        Estado del proceso
+    """
+    return {"status": "alive"}
+
+
+@router.get("/ready")
+async def readiness_check(
+    chat_service: ChatService = Depends(get_chat_service)
+):
+    """
+    Indica si el servidor está listo para atender peticiones
+    
+    Usa la instantánea del sondeo en segundo plano: modelos instalados y
+    precargados y base de datos vectorial accesible.
+    
+    Args:
+        chat_service: Servicio de chat inyectado
+        
+    Returns:
+        Instantánea de salud (503 mientras el servidor no esté listo)
+    """
+    try:
+        snapshot = await chat_service.health_prober.get_snapshot()
+        content = {
+            "snapshot": snapshot,
+            "warmup": chat_service.warmup_service.get_status()
+        }
+        if not chat_service.health_prober.is_ready(snapshot):
+            return JSONResponse(status_code=503, content={"status": "not_ready", **content})
+        return {"status": "ready", **content}
+        
+    except Exception as e:
+        logger.error(f"Error en readiness check: {str(e)}")
+        return JSONResponse(
+            status_code=503,
+            content={"status": "not_ready", "error": str(e)}
+        )
+
+
+@router.get("/deep")
+async def deep_health_check(
+    chat_service: ChatService = Depends(get_chat_service)
+):
+    """
+    Verifica el modelo generando una respuesta corta
+    
+    Consume capacidad del modelo: usar solo bajo demanda, no en sondas periódicas.
+    
+    Args:
+        chat_service: Servicio de chat inyectado
+        
+    Returns:
+        Estado del modelo
+    """
+    try:
+        logger.info("Ejecutando health check profundo")
+        result = await chat_service.deep_health_check()
+        if result.get("llm_service") != "available":
+            return JSONResponse(status_code=503, content=result)
+        return result
+        
+    except Exception as e:
+        logger.error(f"Error en health check profundo: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error ejecutando health check profundo: {str(e)}"
+        )
+
+
 @router.get("/models")
 async def get_available_models(
     chat_service: ChatService = Depends(get_chat_service)
@@ -87,10 +168,7 @@ async def get_available_models(
         
         return {
             "llm_model": llm_info,
-            "embedding_model": {
-                "model": "nomic-embed-text",
-                "base_url": chat_service.embedding_service.embeddings.base_url
-            }
+            "embedding_model": chat_service.embedding_service.backend.get_stats()
         }
         
     except Exception as e:
@@ -134,3 +212,46 @@ async def get_kafka_status():
             status_code=500,
             detail=f"Error obteniendo estado de Kafka: {str(e)}"
         )
+
+
+@router.get("/metrics")
+async def get_metrics(
+    chat_service: ChatService = Depends(get_chat_service)
+):
+    """
+    Obtiene las métricas internas del servidor
+    
+    Args:
+        chat_service: Servicio de chat inyectado
+        
+    Returns:
+        Contadores, métricas instantáneas, histogramas y estado del planificador
+    """
+    try:
+        return {
+            "scheduler": chat_service.llm_service.scheduler.get_stats(),
+            "pools": {
+                "generation": chat_service.llm_service.pool.get_stats(),
+                "embedding": (
+                    chat_service.embedding_service.pool.get_stats()
+                    if chat_service.embedding_service.pool is not None else []
+                )
+            },
+            "http_connections": chat_service.http_client.get_stats(),
+            "embedding_cache": (
+                chat_service.embedding_service.cache.get_stats()
+                if chat_service.embedding_service.cache is not None else None
+            ),
+            "turn_dedup": (
+                chat_service.near_duplicates.get_stats()
+                if chat_service.near_duplicates is not None else None
+            ),
+            **metrics.snapshot()
+        }
+        
+    except Exception as e:
+        logger.error(f"Error obteniendo métricas: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error obteniendo métricas: {str(e)}"
+        )
@@ -2,7 +2,7 @@
 Configuración central de la aplicación
 """
 import os
-from typing import List
+from typing import Dict, List
 from pydantic_settings import BaseSettings
 
 
@@ -19,10 +19,133 @@ class Settings(BaseSettings):
     llm_model: str = "phi3:3.8b"
     embedding_model: str = "nomic-embed-text"
     
+    # Backend de embeddings: "ollama", "onnx" (ONNX Runtime en CPU, en proceso) o "stub" (pruebas)
+    embedding_backend: str = "ollama"
+    embedding_onnx_model_path: str = "./models/embedding"
+    embedding_onnx_workers: int = 2
+    embedding_onnx_intra_op_threads: int = 2
+    embedding_onnx_batch_size: int = 32
+    embedding_onnx_max_length: int = 512
+    embedding_stub_dimensions: int = 768
+    
+    # Niveles de modelos de generación, del más pequeño al más grande; vacío = solo llm_model
+    llm_model_tiers: List[str] = []
+    llm_router_short_message_chars: int = 120
+    llm_router_small_max_tokens: int = 256
+    
+    # Pools de backends de Ollama: {"url": peso}; vacío = solo ollama_base_url
+    ollama_generation_backends: Dict[str, int] = {}
+    ollama_embedding_backends: Dict[str, int] = {}
+    ollama_probe_interval_seconds: float = 10.0
+    ollama_ejection_failures: int = 3
+    ollama_ejection_seconds: float = 30.0
+    
+    # Cliente HTTP compartido hacia Ollama (pool de conexiones por backend)
+    ollama_http_max_connections_per_backend: int = 32
+    ollama_http_max_keepalive_per_backend: int = 16
+    ollama_http_keepalive_expiry_seconds: float = 60.0
+    ollama_http_connect_timeout_seconds: float = 5.0
+    ollama_http_read_timeout_seconds: float = 300.0
+    
+    # Precarga de modelos y keep_alive en segundos (negativo = mantener cargado siempre)
+    ollama_keep_alive: int = -1
+    ollama_warmup_enable: bool = True
+    ollama_warmup_interval_seconds: float = 30.0
+    ollama_warmup_timeout_seconds: float = 120.0
+    
+    # Sondeo de salud en segundo plano
+    health_probe_interval_seconds: float = 15.0
+    health_snapshot_ttl_seconds: float = 30.0
+    
+    # Hedging de embeddings de consulta
+    embedding_hedging_enable: bool = False
+    embedding_hedge_quantile: float = 0.95
+    embedding_hedge_max_rate: float = 0.05
+    embedding_hedge_min_samples: int = 20
+    
+    # Caché persistente de embeddings (memoria + SQLite mapeado en memoria)
+    embedding_cache_enable: bool = True
+    embedding_cache_db_path: str = "./embedding_cache/embeddings.sqlite3"
+    embedding_cache_memory_entries: int = 10000
+    embedding_cache_mmap_bytes: int = 268435456
+    
+    # Micro-batching de embeddings entre peticiones concurrentes
+    embedding_batch_enable: bool = True
+    embedding_batch_max_size: int = 32
+    embedding_batch_max_wait_seconds: float = 0.005
+    
+    # Límites de generación
+    llm_default_max_tokens: int = 512
+    llm_max_tokens_limit: int = 2048
+    llm_generation_timeout_seconds: float = 60.0
+    llm_stop_sequences: List[str] = ["\nUsuario:", "\nAsistente:", "\nPregunta:"]
+    
+    # Ventana de contexto (num_ctx) por petición, en escalones
+    llm_num_ctx_buckets: List[int] = [1024, 2048, 4096, 8192]
+    llm_num_ctx_shrink_seconds: float = 300.0
+    
+    # Planificador de generación
+    llm_max_concurrency_per_backend: int = 1
+    llm_max_queue_size: int = 32
+    llm_queue_slo_seconds: float = 60.0
+    llm_expected_generation_seconds: float = 15.0
+    
+    # Continuación de conversaciones con el contexto KV de Ollama
+    # "off" = prompt completo en cada turno; "context" = reenviar el array context
+    llm_continuation_mode: str = "off"
+    llm_continuation_cache_size: int = 256
+    llm_continuation_max_tokens: int = 3072
+    llm_continuation_ttl_seconds: float = 1800.0
+    
     # ChromaDB
     chroma_persist_directory: str = "./chroma_db"
     collection_name: str = "conversation_context"
     
+    # Llamadas a ChromaDB fuera del event loop (pool de hilos acotado)
+    # vector_store_workers: 0 = en el event loop (solo para comparar en benchmarks)
+    vector_store_workers: int = 4
+    vector_store_timeout_seconds: float = 30.0
+    
+    # División de documentos: procesos para los trabajos masivos (0 = solo hilos)
+    text_splitter_process_workers: int = 2
+    
+    # Ingesta masiva (POST /documents/bulk): concurrencia y tamaño de lote por etapa
+    bulk_split_concurrency: int = 2
+    bulk_embed_concurrency: int = 2
+    bulk_embed_batch_size: int = 64
+    bulk_queue_size: int = 16
+    ingestion_ledger_path: str = "./history_db/ingestion.sqlite3"
+    
+    # Precisión de almacenamiento de los embeddings
+    # embedding_dimensions: 0 = completas; 256 o 512 = truncado Matryoshka (requiere colección nueva)
+    # vector_index_quantization: "none" (HNSW de ChromaDB), "int8" o "binary"
+    # (índice en memoria con reordenado float32 de n_results * rescore_factor candidatos)
+    embedding_dimensions: int = 0
+    vector_index_quantization: str = "none"
+    vector_index_rescore_factor: int = 4
+    
+    # Historial de conversaciones
+    history_db_path: str = "./history_db/history.sqlite3"
+    history_buffer_size: int = 50
+    history_max_active_conversations: int = 1000
+    history_context_turns: int = 8
+    
+    # Supresión de turnos casi duplicados (MinHash/LSH) antes de vectorizarlos
+    # Umbrales de similitud de Jaccard estimada; 0 = ámbito desactivado
+    turn_dedup_enable: bool = True
+    turn_dedup_threshold: float = 0.8
+    turn_dedup_global_threshold: float = 0.0
+    turn_dedup_num_perm: int = 128
+    turn_dedup_max_entries: int = 100000
+    
+    # Resumen incremental de conversaciones
+    # El contexto incluye todos los turnos aún no resumidos (al menos
+    # history_context_turns), aunque el resumen vaya con retraso
+    summary_enable: bool = True
+    summary_every_turns: int = 4
+    summary_keep_recent_turns: int = 4
+    summary_max_tokens: int = 256
+    
     # Server
     host: str = "0.0.0.0"
     port: int = 8000
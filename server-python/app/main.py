@@ -26,12 +26,9 @@ async def lifespan(app: FastAPI):
     # Inicializar servicios
     try:
         chat_service = get_chat_service()
-        health_status = await chat_service.health_check()
-        
-        if "error" in health_status:
-            logger.warning(f"Algunos servicios no están disponibles: {health_status}")
-        else:
-            logger.info("Todos los servicios inicializados correctamente")
+        # Los modelos se precargan en segundo plano; /health/ready indica cuándo están listos
+        await chat_service.start()
+        logger.info("Servicios inicializados; precargando modelos")
         
         # Verificar estado de Kafka si está habilitado
         if settings.kafka_enable:
@@ -49,6 +46,12 @@ async def lifespan(app: FastAPI):
     
     logger.info("Cerrando aplicación...")
     
+    # Detener tareas en segundo plano y cerrar servicios
+    try:
+        await get_chat_service().shutdown()
+    except Exception as e:
+        logger.error(f"Error cerrando servicios: {str(e)}")
+    
     # Cerrar conexiones de Kafka
     if settings.kafka_enable:
         try:
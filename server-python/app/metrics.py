@@ -0,0 +1,111 @@
+"""
+Métricas en proceso de la aplicación
+
+Registro ligero de contadores, valores instantáneos e histogramas que los
+servicios actualizan y que se exponen en /health/metrics.
+"""
+import bisect
+import threading
+from typing import Dict, Any, Optional, Tuple, Sequence
+
+# Límites por defecto de los histogramas (segundos)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Optional[Dict[str, Any]]) -> _LabelKey:
+    """Normaliza las etiquetas para usarlas como clave"""
+    if not labels:
+        return ()
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_name(name: str, key: _LabelKey) -> str:
+    """Construye el nombre de la serie con sus etiquetas"""
+    if not key:
+        return name
+    labels = ",".join(f'{k}="{v}"' for k, v in key)
+    return f"{name}{{{labels}}}"
+
+
+class _Histogram:
+    """Histograma acumulativo con límites fijos"""
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.total += value
+
+    def snapshot(self) -> Dict[str, Any]:
+        cumulative = 0
+        buckets = {}
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            buckets[str(bound)] = cumulative
+        buckets["+Inf"] = self.count
+        return {
+            "count": self.count,
+            "sum": self.total,
+            "avg": self.total / self.count if self.count else 0.0,
+            "buckets": buckets
+        }
+
+
+class MetricsRegistry:
+    """Registro de métricas seguro entre hilos"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, float] = {}
+        self._gauges: Dict[str, float] = {}
+        self._histograms: Dict[str, _Histogram] = {}
+
+    def increment(self, name: str, value: float = 1, labels: Optional[Dict[str, Any]] = None):
+        """Incrementa un contador"""
+        series = _format_name(name, _label_key(labels))
+        with self._lock:
+            self._counters[series] = self._counters.get(series, 0) + value
+
+    def set_gauge(self, name: str, value: float, labels: Optional[Dict[str, Any]] = None):
+        """Fija el valor de una métrica instantánea"""
+        series = _format_name(name, _label_key(labels))
+        with self._lock:
+            self._gauges[series] = value
+
+    def observe(
+        self,
+        name: str,
+        value: float,
+        labels: Optional[Dict[str, Any]] = None,
+        buckets: Sequence[float] = DEFAULT_BUCKETS
+    ):
+        """Registra una observación en un histograma"""
+        series = _format_name(name, _label_key(labels))
+        with self._lock:
+            histogram = self._histograms.get(series)
+            if histogram is None:
+                histogram = self._histograms[series] = _Histogram(buckets)
+            histogram.observe(value)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Devuelve una copia de todas las métricas"""
+        with self._lock:
+            return {
+                "counters": dict(self._counters),
+                "gauges": dict(self._gauges),
+                "histograms": {
+                    name: histogram.snapshot()
+                    for name, histogram in self._histograms.items()
+                }
+            }
+
+
+# Instancia global del registro de métricas
+metrics = MetricsRegistry()
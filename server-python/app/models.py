@@ -17,15 +17,16 @@ class ChatRequest(BaseModel):
     message: str = Field(..., description="Mensaje del usuario")
     conversation_id: Optional[str] = Field(None, description="ID de la conversación")
     use_context: bool = Field(True, description="Si usar contexto previo")
-    max_tokens: Optional[int] = Field(None, description="Máximo número de tokens")
+    max_tokens: Optional[int] = Field(None, gt=0, description="Máximo número de tokens")
     temperature: Optional[float] = Field(0.4, description="Temperatura del modelo")
+    model: Optional[str] = Field(None, description="Modelo a usar (por defecto, elección automática por niveles)")
 
 
 class ChatResponse(BaseModel):
     """Modelo para la respuesta de chat"""
     response: str = Field(..., description="Respuesta del modelo")
     conversation_id: str = Field(..., description="ID de la conversación")
-    usage: Optional[Dict[str, Any]] = Field(None, description="Información de uso")
+    usage: Optional[Dict[str, Any]] = Field(None, description="Información de uso (tokens y motivo de finalización)")
     context_used: bool = Field(False, description="Si se utilizó contexto")
 
 
@@ -34,6 +35,9 @@ class DocumentRequest(BaseModel):
     content: str = Field(..., description="Contenido del documento")
     metadata: Optional[Dict[str, Any]] = Field(None, description="Metadatos del documento")
     conversation_id: Optional[str] = Field(None, description="ID de la conversación")
+    document_key: Optional[str] = Field(
+        None, description="Clave de origen; al reenviar el documento se reemplazan sus chunks"
+    )
 
 
 class DocumentResponse(BaseModel):
@@ -41,6 +45,8 @@ class DocumentResponse(BaseModel):
     message: str = Field(..., description="Mensaje de confirmación")
     document_id: str = Field(..., description="ID del documento")
     chunks_created: int = Field(..., description="Número de chunks creados")
+    chunks_unchanged: int = Field(0, description="Número de chunks ya almacenados")
+    chunks_deleted: int = Field(0, description="Número de chunks obsoletos eliminados")
 
 
 class HealthResponse(BaseModel):
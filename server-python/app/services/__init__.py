@@ -4,11 +4,17 @@ Inicializador de servicios
 from .llm_service import LLMService
 from .embedding_service import EmbeddingService
 from .vector_db_service import VectorDatabaseService
+from .history_service import ConversationHistoryService
+from .summary_service import ConversationSummaryService
+from .warmup_service import ModelWarmupService
 from .chat_service import ChatService
 
 __all__ = [
     "LLMService",
     "EmbeddingService", 
     "VectorDatabaseService",
+    "ConversationHistoryService",
+    "ConversationSummaryService",
+    "ModelWarmupService",
     "ChatService"
 ]
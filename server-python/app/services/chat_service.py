@@ -1,34 +1,98 @@
 """
 Servicio principal de chat que orquesta todos los componentes
 """
+import asyncio
 import logging
+import time
 import uuid
-from typing import List, Optional, Dict, Any
+from datetime import datetime, timezone
+from typing import Iterable, List, Optional, Dict, Any
 from langchain_core.documents import Document
 from app.services.llm_service import LLMService
 from app.services.embedding_service import EmbeddingService
 from app.services.vector_db_service import VectorDatabaseService
+from app.services.history_service import ConversationHistoryService
+from app.services.ingestion_service import BulkIngestionService
+from app.services.near_duplicate import NearDuplicateDetector
+from app.services.summary_service import ConversationSummaryService
+from app.services.warmup_service import ModelWarmupService
+from app.services.health_service import HealthProber
+from app.services.model_router import configured_models
 from app.services.kafka_service import kafka_service
-from app.models import ChatRequest, ChatResponse
+from app.services.http_client import ollama_http_client
+from app.services.scheduler_service import PRIORITY_INTERACTIVE, PRIORITY_STANDARD
+from app.models import ChatMessage, ChatRequest, ChatResponse
 from app.config import settings
 
 logger = logging.getLogger(__name__)
 
+# Chunks por lote de embeddings al añadir un documento
+DOCUMENT_EMBED_BATCH_CHUNKS = 32
+
 
 class ChatService:
     """Servicio principal que orquesta el chat con IA"""
     
     def __init__(self):
-        self.llm_service = LLMService()
-        self.embedding_service = EmbeddingService()
+        # Un único cliente HTTP (pool de conexiones por backend) para todo el tráfico a Ollama
+        self.http_client = ollama_http_client
+        self.llm_service = LLMService(http_client=self.http_client)
+        self.embedding_service = EmbeddingService(http_client=self.http_client)
         self.vector_db_service = VectorDatabaseService()
+        self.history_service = ConversationHistoryService()
+        self.near_duplicates = NearDuplicateDetector() if settings.turn_dedup_enable else None
+        self.ingestion_service = BulkIngestionService(
+            embedding_service=self.embedding_service,
+            vector_db_service=self.vector_db_service
+        )
+        self.summary_service = ConversationSummaryService(
+            llm_service=self.llm_service,
+            history_service=self.history_service
+        )
+        self.warmup_service = ModelWarmupService(
+            generation_urls=self.llm_service.pool.urls,
+            embedding_urls=(
+                self.embedding_service.pool.urls if self.embedding_service.pool is not None else []
+            ),
+            http_client=self.http_client
+        )
+        self.health_prober = HealthProber(
+            generation_pool=self.llm_service.pool,
+            embedding_pool=self.embedding_service.pool,
+            vector_db_service=self.vector_db_service,
+            warmup_service=self.warmup_service
+        )
+    
+    async def start(self):
+        """Inicia las tareas en segundo plano de los servicios"""
+        await self.llm_service.pool.start()
+        await self.embedding_service.start()
+        await self.warmup_service.start()
+        await self.health_prober.start()
     
-    async def process_chat_request(self, request: ChatRequest) -> ChatResponse:
+    async def shutdown(self):
+        """Detiene las tareas en segundo plano y libera recursos"""
+        await self.health_prober.close()
+        await self.warmup_service.close()
+        await self.summary_service.shutdown()
+        await self.llm_service.pool.close()
+        await self.embedding_service.close()
+        self.history_service.close()
+        self.ingestion_service.close()
+        self.vector_db_service.close()
+        await self.http_client.aclose()
+    
+    async def process_chat_request(
+        self, 
+        request: ChatRequest,
+        client_id: Optional[str] = None
+    ) -> ChatResponse:
         """
         Procesa una petición de chat completa
         
         Args:
             request: Petición de chat
+            client_id: Identificador del cliente para el reparto equitativo
             
         Returns:
             Respuesta de chat
@@ -40,19 +104,31 @@ class ChatService:
             # Obtener contexto si se solicita
             context = None
             context_used = False
+            continuation = None
             
             if request.use_context:
+                # Con estado de continuación el historial ya está en el contexto KV
+                continuation = self.llm_service.get_continuation(conversation_id, model=request.model)
                 context = await self._get_context_for_query(
                     request.message, 
-                    conversation_id
+                    conversation_id,
+                    include_history=continuation is None
                 )
-                context_used = bool(context)
+                context_used = bool(context) or continuation is not None
             
             # Generar respuesta
+            usage: Dict[str, Any] = {}
             response = await self.llm_service.generate_response(
                 question=request.message,
                 context=context,
-                temperature=request.temperature
+                temperature=request.temperature,
+                max_tokens=request.max_tokens,
+                priority=PRIORITY_STANDARD,
+                fairness_key=self._fairness_key(request, client_id),
+                usage=usage,
+                conversation_id=conversation_id if request.use_context else None,
+                continuation=continuation,
+                model=request.model
             )
             
             # Almacenar la conversación en el contexto
@@ -72,8 +148,9 @@ class ChatService:
                         context_used=context_used,
                         metadata={
                             "temperature": request.temperature,
-                            "model": "ollama",
-                            "use_context": request.use_context
+                            "model": usage.get("model", "ollama"),
+                            "use_context": request.use_context,
+                            "usage": usage
                         }
                     )
                 except Exception as e:
@@ -82,6 +159,7 @@ class ChatService:
             return ChatResponse(
                 response=response,
                 conversation_id=conversation_id,
+                usage=usage,
                 context_used=context_used
             )
             
@@ -89,12 +167,17 @@ class ChatService:
             logger.error(f"Error procesando petición de chat: {str(e)}")
             raise
     
-    async def process_streaming_chat_request(self, request: ChatRequest):
+    async def process_streaming_chat_request(
+        self, 
+        request: ChatRequest,
+        client_id: Optional[str] = None
+    ):
         """
         Procesa una petición de chat con respuesta streaming
         
         Args:
             request: Petición de chat
+            client_id: Identificador del cliente para el reparto equitativo
             
         Yields:
             Chunks de la respuesta
@@ -105,40 +188,73 @@ class ChatService:
             
             # Obtener contexto si se solicita
             context = None
+            continuation = None
             if request.use_context:
+                continuation = self.llm_service.get_continuation(conversation_id, model=request.model)
                 context = await self._get_context_for_query(
                     request.message, 
-                    conversation_id
+                    conversation_id,
+                    include_history=continuation is None
                 )
             
             # Generar respuesta streaming
             response_chunks = []
             chunk_index = 0
-            async for chunk in self.llm_service.generate_streaming_response(
+            usage: Dict[str, Any] = {}
+            llm_stream = self.llm_service.generate_streaming_response(
                 question=request.message,
                 context=context,
-                temperature=request.temperature
-            ):
-                response_chunks.append(chunk)
-                
-                # Enviar chunk a Kafka si está habilitado
+                temperature=request.temperature,
+                max_tokens=request.max_tokens,
+                priority=PRIORITY_INTERACTIVE,
+                fairness_key=self._fairness_key(request, client_id),
+                usage=usage,
+                conversation_id=conversation_id if request.use_context else None,
+                continuation=continuation,
+                model=request.model
+            )
+            try:
+                async for chunk in llm_stream:
+                    response_chunks.append(chunk)
+                    
+                    # Enviar chunk a Kafka si está habilitado
+                    if settings.kafka_enable:
+                        try:
+                            await kafka_service.send_streaming_response_chunk(
+                                conversation_id=conversation_id,
+                                chunk=chunk,
+                                chunk_index=chunk_index,
+                                is_final=False
+                            )
+                        except Exception as e:
+                            logger.warning(f"Error enviando chunk streaming a Kafka: {str(e)}")
+                    
+                    chunk_index += 1
+                    yield {
+                        "chunk": chunk,
+                        "conversation_id": conversation_id,
+                        "context_used": bool(context) or continuation is not None
+                    }
+            except (GeneratorExit, asyncio.CancelledError):
+                # El cliente se desconectó: no se almacena la respuesta parcial
+                logger.info(
+                    f"Streaming cancelado para conversación {conversation_id} "
+                    f"tras {chunk_index} chunks; no se almacena el turno"
+                )
                 if settings.kafka_enable:
                     try:
                         await kafka_service.send_streaming_response_chunk(
                             conversation_id=conversation_id,
-                            chunk=chunk,
+                            chunk="",
                             chunk_index=chunk_index,
-                            is_final=False
+                            is_final=True,
+                            cancelled=True
                         )
                     except Exception as e:
-                        logger.warning(f"Error enviando chunk streaming a Kafka: {str(e)}")
-                
-                chunk_index += 1
-                yield {
-                    "chunk": chunk,
-                    "conversation_id": conversation_id,
-                    "context_used": bool(context)
-                }
+                        logger.warning(f"Error enviando cancelación a Kafka: {str(e)}")
+                raise
+            finally:
+                await llm_stream.aclose()
             
             # Almacenar la conversación completa
             full_response = "".join(response_chunks)
@@ -162,13 +278,14 @@ class ChatService:
                         conversation_id=conversation_id,
                         user_message=request.message,
                         ai_response=full_response,
-                        context_used=bool(context),
+                        context_used=bool(context) or continuation is not None,
                         metadata={
                             "temperature": request.temperature,
-                            "model": "ollama",
+                            "model": usage.get("model", "ollama"),
                             "use_context": request.use_context,
                             "streaming": True,
-                            "total_chunks": chunk_index
+                            "total_chunks": chunk_index,
+                            "usage": usage
                         }
                     )
                 except Exception as e:
@@ -178,49 +295,119 @@ class ChatService:
             logger.error(f"Error procesando petición de chat streaming: {str(e)}")
             raise
     
+    def check_admission(self, streaming: bool = False, model: Optional[str] = None):
+        """
+        Verifica que haya capacidad de generación antes de aceptar una petición
+        
+        Args:
+            streaming: Si la petición es de chat streaming (interactiva)
+            model: Modelo solicitado por el cliente (opcional)
+            
+        Raises:
+            UnknownModelError: Si el modelo solicitado no está configurado
+            SchedulerOverloadedError: Si la espera estimada supera el SLO
+        """
+        self.llm_service.router.validate(model)
+        priority = PRIORITY_INTERACTIVE if streaming else PRIORITY_STANDARD
+        self.llm_service.scheduler.check_admission(priority)
+    
+    @staticmethod
+    def _fairness_key(request: ChatRequest, client_id: Optional[str]) -> str:
+        """Clave de reparto equitativo: conversación, cliente o anónimo"""
+        return request.conversation_id or client_id or "anonymous"
+    
     async def add_document_to_context(
         self, 
         content: str, 
         metadata: Optional[Dict[str, Any]] = None,
-        conversation_id: Optional[str] = None
+        conversation_id: Optional[str] = None,
+        document_key: Optional[str] = None,
+        parts: Optional[Iterable[str]] = None
     ) -> Dict[str, Any]:
         """
         Añade un documento al contexto de la conversación
         
+        Los chunks tienen IDs derivados de su contenido: los que ya están
+        almacenados no se vuelven a vectorizar. Con document_key, al volver a
+        añadir el documento se eliminan los chunks que ya no forman parte de él.
+        
         Args:
-            content: Contenido del documento
+            content: Contenido del documento (ignorado si se indica parts)
             metadata: Metadatos del documento
             conversation_id: ID de la conversación
+            document_key: Clave de origen del documento (opcional)
+            parts: Partes del texto leídas de forma incremental (p. ej. de un
+                fichero subido), en lugar de content
             
         Returns:
             Información sobre el documento añadido
         """
         try:
+            metadata = dict(metadata or {})
+            if document_key:
+                metadata["document_key"] = document_key
+            
             # Crear documento
             document = self.embedding_service.create_document_from_text(
                 content=content,
-                metadata=metadata or {}
+                metadata=metadata
             )
             
-            # Dividir en chunks si es necesario
-            chunks = self.embedding_service.split_documents([document])
-            
-            # Generar embeddings
-            texts = [chunk.page_content for chunk in chunks]
-            embeddings = await self.embedding_service.generate_embeddings(texts)
+            # Dividir en un hilo mientras se generan embeddings y se almacenan
+            # los chunks ya producidos, por lotes
+            document_ids: List[str] = []
+            seen_ids = set()
+            created = 0
+            batch: List[Document] = []
+            
+            async def store(chunks: List[Document]):
+                nonlocal created
+                chunk_ids = self.vector_db_service.chunk_ids(chunks, conversation_id)
+                existing = await self.vector_db_service.get_existing_ids(chunk_ids)
+                new_chunks = []
+                for chunk, chunk_id in zip(chunks, chunk_ids):
+                    if chunk_id in seen_ids:
+                        continue
+                    seen_ids.add(chunk_id)
+                    document_ids.append(chunk_id)
+                    # Chunk sin cambios: ni embedding ni escritura
+                    if chunk_id not in existing:
+                        new_chunks.append(chunk)
+                if not new_chunks:
+                    return
+                embeddings = await self.embedding_service.generate_embeddings(
+                    [chunk.page_content for chunk in new_chunks]
+                )
+                created += len(await self.vector_db_service.add_documents(
+                    documents=new_chunks,
+                    embeddings=embeddings,
+                    conversation_id=conversation_id
+                ))
+            
+            async for chunk in self.embedding_service.aiter_document_chunks(document, parts=parts):
+                batch.append(chunk)
+                if len(batch) >= DOCUMENT_EMBED_BATCH_CHUNKS:
+                    await store(batch)
+                    batch = []
+            if batch:
+                await store(batch)
+            
+            deleted = 0
+            if document_key:
+                deleted = await self.vector_db_service.delete_stale_chunks(
+                    document_key, document_ids, conversation_id
+                )
             
-            # Almacenar en base de datos vectorial
-            document_ids = await self.vector_db_service.add_documents(
-                documents=chunks,
-                embeddings=embeddings,
-                conversation_id=conversation_id
+            logger.info(
+                f"Documento añadido con {len(document_ids)} chunks "
+                f"({created} nuevos, {deleted} eliminados)"
             )
             
-            logger.info(f"Documento añadido con {len(chunks)} chunks")
-            
             return {
                 "document_id": document_ids[0] if document_ids else None,
-                "chunks_created": len(chunks),
+                "chunks_created": created,
+                "chunks_unchanged": len(document_ids) - created,
+                "chunks_deleted": deleted,
                 "conversation_id": conversation_id
             }
             
@@ -232,7 +419,8 @@ class ChatService:
         self, 
         query: str, 
         conversation_id: str,
-        max_results: int = 5
+        max_results: int = 5,
+        include_history: bool = True
     ) -> Optional[str]:
         """
         Obtiene contexto relevante para una consulta
@@ -241,6 +429,8 @@ class ChatService:
             query: Consulta del usuario
             conversation_id: ID de la conversación
             max_results: Número máximo de resultados
+            include_history: Si se incluyen resumen y turnos de la conversación
+                (False cuando el modelo ya los tiene en su contexto de continuación)
             
         Returns:
             Contexto formateado o None si no hay contexto
@@ -256,16 +446,50 @@ class ChatService:
                 conversation_id=conversation_id
             )
             
-            # Obtener contexto de la conversación
-            conversation_context = await self.vector_db_service.get_conversation_context(
+            if not include_history:
+                documents = [
+                    doc for doc in similar_docs
+                    if doc.get("metadata", {}).get("type") != "conversation"
+                ]
+                return self.llm_service.format_context(documents) or None
+            
+            # Resumen acumulado + todos los turnos aún no resumidos: si el resumen
+            # va con retraso, la ventana crece en lugar de perder turnos
+            summary_state = await self.history_service.get_summary(conversation_id)
+            limit = settings.history_context_turns
+            if settings.summary_enable:
+                pending = summary_state["next_index"] - summary_state["summarized_until"]
+                if pending > limit:
+                    logger.warning(
+                        f"Resumen de la conversación {conversation_id} con retraso: "
+                        f"{pending} turnos sin resumir en el contexto"
+                    )
+                limit = max(limit, pending)
+            recent_turns = await self.history_service.get_recent_turns(
                 conversation_id=conversation_id,
-                limit=max_results
+                limit=limit
             )
-            
-            # Combinar contextos
-            all_docs = similar_docs + conversation_context
-            
-            # Eliminar duplicados y formatear
+            conversation_context = [
+                self._turn_to_context_document(turn)
+                for turn in recent_turns
+                if turn["turn_index"] >= summary_state["summarized_until"]
+            ]
+            if summary_state["summary"]:
+                conversation_context.insert(0, {
+                    "content": summary_state["summary"],
+                    "metadata": {
+                        "type": "summary",
+                        "summarized_turns": summary_state["summarized_until"]
+                    }
+                })
+            
+            # Combinar contextos: los turnos recientes van al final, junto a la pregunta
+            recent_contents = {doc["content"] for doc in conversation_context}
+            all_docs = [
+                doc for doc in similar_docs if doc["content"] not in recent_contents
+            ] + conversation_context
+            
+            # Formatear
             if all_docs:
                 return self.llm_service.format_context(all_docs)
             
@@ -290,14 +514,43 @@ class ChatService:
             assistant_response: Respuesta del asistente
         """
         try:
+            # Registrar el turno en el historial ordenado
+            turn = await self.history_service.append_turn(
+                conversation_id=conversation_id,
+                user_message=user_message,
+                assistant_response=assistant_response
+            )
+            
+            # Plegar turnos antiguos en el resumen en segundo plano
+            summary_state = await self.history_service.get_summary(conversation_id)
+            self.summary_service.schedule(
+                conversation_id,
+                summary_state["next_index"],
+                summary_state["summarized_until"]
+            )
+            
             # Crear documentos para el intercambio
-            conversation_text = f"Usuario: {user_message}\nAsistente: {assistant_response}"
+            conversation_text = self._format_turn(user_message, assistant_response)
+            
+            # Un turno casi idéntico a otro ya indexado queda en el historial,
+            # pero no se vectoriza ni se almacena de nuevo
+            if self.near_duplicates is not None:
+                duplicate = await asyncio.to_thread(
+                    self.near_duplicates.check, conversation_id, conversation_text
+                )
+                if duplicate is not None:
+                    logger.info(
+                        f"Turno {turn['turn_index']} de '{conversation_id}' casi duplicado "
+                        f"({duplicate['scope']}, similitud {duplicate['similarity']}); no se indexa"
+                    )
+                    return
             
             # Añadir al contexto
             await self.add_document_to_context(
                 content=conversation_text,
                 metadata={
                     "type": "conversation",
+                    "turn_index": turn["turn_index"],
                     "user_message": user_message,
                     "assistant_response": assistant_response
                 },
@@ -308,6 +561,29 @@ class ChatService:
             logger.error(f"Error almacenando conversación: {str(e)}")
             # No lanzar excepción aquí para no interrumpir el flujo principal
     
+    @staticmethod
+    def _format_turn(user_message: str, assistant_response: str) -> str:
+        """Formatea un intercambio usuario/asistente como texto"""
+        return f"Usuario: {user_message}\nAsistente: {assistant_response}"
+    
+    def _turn_to_context_document(self, turn: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Convierte un turno del historial en un documento de contexto
+        
+        Args:
+            turn: Turno del historial
+            
+        Returns:
+            Documento con contenido y metadatos para format_context
+        """
+        return {
+            "content": self._format_turn(turn["user_message"], turn["assistant_response"]),
+            "metadata": {
+                "type": "conversation",
+                "turn_index": turn["turn_index"]
+            }
+        }
+    
     async def get_conversation_history(
         self, 
         conversation_id: str,
@@ -321,15 +597,30 @@ class ChatService:
             limit: Límite de mensajes
             
         Returns:
-            Lista de mensajes de la conversación
+            Lista de mensajes de la conversación en orden cronológico
         """
         try:
-            context = await self.vector_db_service.get_conversation_context(
+            # Cada turno aporta dos mensajes (usuario y asistente)
+            turns = await self.history_service.get_recent_turns(
                 conversation_id=conversation_id,
-                limit=limit
+                limit=(limit + 1) // 2
             )
             
-            return context
+            messages = []
+            for turn in turns:
+                timestamp = datetime.fromtimestamp(turn["created_at"], tz=timezone.utc).isoformat()
+                messages.append(ChatMessage(
+                    role="user",
+                    content=turn["user_message"],
+                    timestamp=timestamp
+                ).model_dump())
+                messages.append(ChatMessage(
+                    role="assistant",
+                    content=turn["assistant_response"],
+                    timestamp=timestamp
+                ).model_dump())
+            
+            return messages[-limit:] if limit > 0 else []
             
         except Exception as e:
             logger.error(f"Error obteniendo historial: {str(e)}")
@@ -337,27 +628,58 @@ class ChatService:
     
     async def health_check(self) -> Dict[str, Any]:
         """
-        Verifica el estado de todos los servicios
+        Verifica el estado de todos los servicios a partir de la instantánea
+        del sondeo en segundo plano (sin generar con el LLM)
         
         Returns:
             Estado de los servicios
         """
         try:
-            # Verificar modelo LLM
-            llm_available = await self.llm_service.check_model_availability()
+            snapshot = await self.health_prober.get_snapshot()
+            vector_db = snapshot["vector_database"]
+            
+            return {
+                "llm_service": (
+                    "available"
+                    if all(snapshot["models"][model] == "available" for model in configured_models())
+                    else "unavailable"
+                ),
+                "vector_database": vector_db["status"],
+                "embedding_service": snapshot["embedding_service"],
+                "models": snapshot["models"],
+                "kafka": snapshot["kafka"],
+                "database_stats": {
+                    "total_documents": vector_db.get("total_documents"),
+                    "collection_name": settings.collection_name
+                },
+                "checked_at": snapshot["checked_at"]
+            }
             
-            # Verificar base de datos
-            db_stats = self.vector_db_service.get_collection_stats()
+        except Exception as e:
+            logger.error(f"Error en health check: {str(e)}")
+            return {
+                "error": str(e),
+                "status": "unhealthy"
+            }
+    
+    async def deep_health_check(self) -> Dict[str, Any]:
+        """
+        Verifica el modelo generando una respuesta corta (solo bajo demanda)
+        
+        Returns:
+            Estado del modelo y duración de la generación de prueba
+        """
+        try:
+            started_at = time.monotonic()
+            llm_available = await self.llm_service.check_model_availability()
             
             return {
                 "llm_service": "available" if llm_available else "unavailable",
-                "vector_database": "available" if "error" not in db_stats else "unavailable",
-                "embedding_service": "available",  # Asumimos que está disponible si LLM está disponible
-                "database_stats": db_stats
+                "generation_seconds": round(time.monotonic() - started_at, 3)
             }
             
         except Exception as e:
-            logger.error(f"Error en health check: {str(e)}")
+            logger.error(f"Error en health check profundo: {str(e)}")
             return {
                 "error": str(e),
                 "status": "unhealthy"
@@ -0,0 +1,104 @@
+"""
+Dimensionado adaptativo de la ventana de contexto (num_ctx) de Ollama
+
+Cada petición necesita un num_ctx de al menos la longitud del prompt más los
+tokens a generar. Un valor fijo grande desperdicia memoria y ralentiza la
+atención en CPU, y uno pequeño trunca los prompts con contexto. Como Ollama
+recarga el modelo cada vez que cambia num_ctx, el tamaño se redondea a unos
+pocos escalones y, por backend y modelo, solo crece cuando hace falta y solo
+decrece tras un tiempo sin peticiones que necesiten el escalón actual.
+"""
+import logging
+import math
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+from app.config import settings
+from app.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Caracteres por token para estimar la longitud del prompt (estimación conservadora)
+CHARS_PER_TOKEN = 3.5
+
+
+def estimate_tokens(text: str) -> int:
+    """Estima el número de tokens de un texto"""
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+class ContextWindowSizer:
+    """Elige num_ctx por petición minimizando las recargas del modelo"""
+
+    def __init__(self, buckets: Optional[List[int]] = None, shrink_seconds: Optional[float] = None):
+        self.buckets = sorted(buckets or settings.llm_num_ctx_buckets)
+        self.shrink_seconds = (
+            shrink_seconds if shrink_seconds is not None else settings.llm_num_ctx_shrink_seconds
+        )
+        # (backend, modelo) -> (num_ctx actual, última vez que se necesitó ese escalón)
+        self._current: Dict[Tuple[str, str], Tuple[int, float]] = {}
+        self._lock = threading.Lock()
+
+    def bucket_for(self, required_tokens: int) -> int:
+        """
+        Redondea los tokens necesarios al escalón superior
+
+        Args:
+            required_tokens: Tokens de prompt más tokens a generar
+
+        Returns:
+            Escalón de num_ctx (el mayor si ninguno alcanza)
+        """
+        for bucket in self.buckets:
+            if bucket >= required_tokens:
+                return bucket
+        return self.buckets[-1]
+
+    def select(self, backend: str, model: str, required_tokens: int) -> int:
+        """
+        Elige num_ctx para una petición en un backend y modelo
+
+        Si el escalón actual ya es suficiente se mantiene (sin recarga), salvo
+        que lleve más de shrink_seconds sin necesitarse: entonces se reduce
+        para liberar memoria.
+
+        Args:
+            backend: URL del backend
+            model: Modelo de Ollama
+            required_tokens: Tokens de prompt más tokens a generar
+
+        Returns:
+            num_ctx a enviar en las opciones
+        """
+        needed = self.bucket_for(required_tokens)
+        now = time.monotonic()
+        key = (backend, model)
+
+        with self._lock:
+            # Sin estado: el warm-up carga el modelo con el escalón más pequeño
+            current, last_needed_at = self._current.get(key, (self.buckets[0], now))
+
+            if needed == current:
+                chosen = current
+                last_needed_at = now
+            elif needed > current:
+                chosen = needed
+                last_needed_at = now
+            elif now - last_needed_at > self.shrink_seconds:
+                chosen = needed
+                last_needed_at = now
+            else:
+                chosen = current
+
+            self._current[key] = (chosen, last_needed_at)
+
+        if chosen != current:
+            metrics.increment("llm_num_ctx_reloads_total",
+                              labels={"backend": backend, "model": model})
+            logger.info(
+                f"Recarga de {model} en {backend}: num_ctx {current} -> {chosen} "
+                f"({required_tokens} tokens necesarios)"
+            )
+        metrics.observe("llm_num_ctx_required_tokens", required_tokens,
+                        labels={"model": model}, buckets=tuple(self.buckets))
+        return chosen
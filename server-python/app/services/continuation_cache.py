@@ -0,0 +1,87 @@
+"""
+Caché acotada del estado de continuación de conversaciones en Ollama
+
+Guarda por conversación el array `context` que Ollama devuelve al terminar
+una generación y el backend que la atendió, para que el siguiente turno
+envíe solo el mensaje nuevo sobre un prefijo estable y el runtime reutilice
+su caché KV en lugar de volver a procesar toda la conversación.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional
+from app.config import settings
+from app.metrics import metrics
+
+
+class ContinuationCache:
+    """Caché LRU con caducidad del contexto de Ollama por conversación"""
+
+    def __init__(
+        self,
+        max_entries: Optional[int] = None,
+        max_tokens: Optional[int] = None,
+        ttl_seconds: Optional[float] = None
+    ):
+        self.max_entries = max_entries or settings.llm_continuation_cache_size
+        self.max_tokens = max_tokens or settings.llm_continuation_max_tokens
+        self.ttl_seconds = ttl_seconds or settings.llm_continuation_ttl_seconds
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, conversation_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Obtiene el estado de continuación de una conversación
+
+        Args:
+            conversation_id: ID de la conversación
+
+        Returns:
+            Diccionario con "context", "backend" y "model", o None si no hay estado válido
+        """
+        with self._lock:
+            entry = self._entries.get(conversation_id)
+            if entry is None:
+                metrics.increment("llm_continuation_misses_total")
+                return None
+            if time.monotonic() - entry["updated_at"] > self.ttl_seconds:
+                del self._entries[conversation_id]
+                metrics.increment("llm_continuation_misses_total")
+                return None
+            self._entries.move_to_end(conversation_id)
+            metrics.increment("llm_continuation_hits_total")
+            return entry
+
+    def put(self, conversation_id: str, context: List[int], backend: str, model: str):
+        """
+        Guarda el contexto devuelto por Ollama tras un turno
+
+        Si el contexto supera el máximo de tokens se descarta: el siguiente
+        turno volverá a construir el prompt completo (resumen + turnos recientes).
+
+        Args:
+            conversation_id: ID de la conversación
+            context: Array de tokens `context` devuelto por Ollama
+            backend: URL del backend que atendió la generación
+            model: Modelo que generó el contexto
+        """
+        with self._lock:
+            if not context or len(context) > self.max_tokens:
+                self._entries.pop(conversation_id, None)
+                return
+            self._entries[conversation_id] = {
+                "context": context,
+                "backend": backend,
+                "model": model,
+                "updated_at": time.monotonic()
+            }
+            self._entries.move_to_end(conversation_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                metrics.increment("llm_continuation_evictions_total")
+            metrics.set_gauge("llm_continuation_entries", len(self._entries))
+
+    def discard(self, conversation_id: str):
+        """Elimina el estado de continuación de una conversación"""
+        with self._lock:
+            self._entries.pop(conversation_id, None)
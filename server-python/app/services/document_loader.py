@@ -0,0 +1,116 @@
+"""
+Lectura incremental de ficheros subidos (texto, markdown y PDF)
+
+El fichero ya está en disco (volcado por el parser multipart) y se mapea en
+memoria con mmap: el texto se decodifica por secciones de tamaño acotado y se
+entrega al divisor a medida que avanza, así que la memoria del proceso no
+crece con el tamaño del fichero. Los PDF se leen página a página con pypdf,
+una dependencia opcional.
+"""
+import codecs
+import logging
+import mmap
+import os
+from typing import BinaryIO, Iterator, Optional
+from app.services.text_splitter import SECTION_CHARS
+
+logger = logging.getLogger(__name__)
+
+FORMAT_TEXT = "text"
+FORMAT_MARKDOWN = "markdown"
+FORMAT_PDF = "pdf"
+
+_EXTENSIONS = {
+    ".txt": FORMAT_TEXT,
+    ".text": FORMAT_TEXT,
+    ".md": FORMAT_MARKDOWN,
+    ".markdown": FORMAT_MARKDOWN,
+    ".pdf": FORMAT_PDF,
+}
+_CONTENT_TYPES = {
+    "text/plain": FORMAT_TEXT,
+    "text/markdown": FORMAT_MARKDOWN,
+    "text/x-markdown": FORMAT_MARKDOWN,
+    "application/pdf": FORMAT_PDF,
+}
+
+
+class UnsupportedDocumentError(ValueError):
+    """El fichero no es de un formato soportado o no puede leerse"""
+
+
+def detect_format(filename: Optional[str], content_type: Optional[str]) -> str:
+    """
+    Determina el formato de un fichero por su extensión o su tipo MIME
+
+    Args:
+        filename: Nombre del fichero
+        content_type: Tipo MIME declarado en la parte multipart
+
+    Returns:
+        FORMAT_TEXT, FORMAT_MARKDOWN o FORMAT_PDF
+    """
+    extension = os.path.splitext(filename or "")[1].lower()
+    if extension in _EXTENSIONS:
+        return _EXTENSIONS[extension]
+    media_type = (content_type or "").split(";")[0].strip().lower()
+    if media_type in _CONTENT_TYPES:
+        return _CONTENT_TYPES[media_type]
+    raise UnsupportedDocumentError(
+        f"Formato no soportado ('{filename}', {content_type}); se admiten texto, markdown y PDF"
+    )
+
+
+def _iter_mapped_text(mapped: mmap.mmap, section_bytes: int) -> Iterator[str]:
+    """Decodifica UTF-8 por secciones; los caracteres partidos pasan a la siguiente"""
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    for start in range(0, len(mapped), section_bytes):
+        text = decoder.decode(mapped[start:start + section_bytes])
+        if text:
+            yield text
+    tail = decoder.decode(b"", final=True)
+    if tail:
+        yield tail
+
+
+def _iter_pdf_text(mapped: mmap.mmap) -> Iterator[str]:
+    """Extrae el texto de un PDF página a página"""
+    try:
+        from pypdf import PdfReader
+        from pypdf.errors import PdfReadError
+    except ImportError as e:
+        raise UnsupportedDocumentError(f"La lectura de PDF requiere pypdf: {e}")
+
+    try:
+        reader = PdfReader(mapped)
+        for page in reader.pages:
+            text = page.extract_text() or ""
+            if text.strip():
+                yield text + "\n\n"
+    except PdfReadError as e:
+        raise UnsupportedDocumentError(f"PDF no válido: {e}")
+
+
+def iter_file_text(file: BinaryIO, document_format: str, section_chars: int = SECTION_CHARS) -> Iterator[str]:
+    """
+    Recorre el texto de un fichero en disco por partes, sin cargarlo entero
+
+    Es un generador síncrono: se consume desde el hilo de división
+    (DocumentSplitter.aiter_chunks), fuera del event loop.
+
+    Args:
+        file: Fichero abierto en modo binario, respaldado por disco
+        document_format: Formato devuelto por detect_format
+        section_chars: Tamaño aproximado de cada parte
+
+    Yields:
+        Partes consecutivas del texto
+    """
+    file.flush()
+    if os.fstat(file.fileno()).st_size == 0:
+        return
+    with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        if document_format == FORMAT_PDF:
+            yield from _iter_pdf_text(mapped)
+        else:
+            yield from _iter_mapped_text(mapped, section_chars)
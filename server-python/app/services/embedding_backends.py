@@ -0,0 +1,398 @@
+"""
+Backends de embeddings intercambiables
+
+EmbeddingService delega el cálculo de vectores en un backend:
+
+- "ollama": HTTP contra el pool de backends de Ollama (reintentos y hedging).
+- "onnx": inferencia en proceso con ONNX Runtime en CPU, por lotes en un pool
+  de hilos, a partir de un modelo exportado en un directorio local. Los
+  embeddings dejan de hacer cola detrás de la generación de texto.
+- "stub": vectores deterministas derivados del hash del texto, para pruebas
+  sin Ollama ni modelos.
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional
+import numpy as np
+from langchain_ollama import OllamaEmbeddings
+from app.config import settings
+from app.metrics import metrics
+from app.services.embedding_cache import normalize_text
+from app.services.http_client import OllamaHttpClient
+from app.services.ollama_pool import OllamaBackendPool
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_BACKEND_OLLAMA = "ollama"
+EMBEDDING_BACKEND_ONNX = "onnx"
+EMBEDDING_BACKEND_STUB = "stub"
+
+# Intentos máximos (en backends distintos) por llamada de embeddings
+EMBEDDING_MAX_ATTEMPTS = 2
+# Tamaño de las ventanas de latencia y de decisiones de hedging
+HEDGE_WINDOW_SIZE = 200
+# Ficheros esperados en el directorio del modelo ONNX
+ONNX_MODEL_FILE = "model.onnx"
+ONNX_TOKENIZER_FILE = "tokenizer.json"
+
+
+def as_matrix(vectors: Any) -> np.ndarray:
+    """Convierte vectores a una matriz float32 contigua (una fila por texto)"""
+    return np.ascontiguousarray(vectors, dtype=np.float32)
+
+
+class EmbeddingBackend(ABC):
+    """
+    Interfaz común de los backends de embeddings
+
+    Los vectores viajan como matrices NumPy float32 contiguas (n_textos x
+    dimensiones) hasta la base vectorial, sin listas de floats de Python.
+    """
+
+    name = ""
+    # Identificador del modelo (forma parte de la clave de la caché)
+    model = ""
+    # Pool de Ollama del backend, si lo usa
+    pool: Optional[OllamaBackendPool] = None
+
+    @abstractmethod
+    async def embed(self, texts: List[str]) -> np.ndarray:
+        """
+        Calcula los embeddings de un lote de textos
+
+        Args:
+            texts: Lista de textos
+
+        Returns:
+            Matriz float32 con una fila por texto
+        """
+
+    async def embed_query(self, query: str) -> np.ndarray:
+        """
+        Calcula el embedding de una consulta
+
+        Args:
+            query: Texto de la consulta
+
+        Returns:
+            Vector float32 de la consulta
+        """
+        return (await self.embed([query]))[0]
+
+    def hedges_queries(self) -> bool:
+        """Indica si embed_query debe usarse en lugar del lote (hedging activo)"""
+        return False
+
+    def observe_query_latency(self, seconds: float):
+        """Registra la latencia de una consulta resuelta por lotes"""
+
+    async def start(self):
+        """Inicia las tareas en segundo plano del backend"""
+
+    async def close(self):
+        """Libera los recursos del backend"""
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Estado del backend para las métricas"""
+        return {"backend": self.name, "model": self.model}
+
+
+class OllamaEmbeddingBackend(EmbeddingBackend):
+    """Embeddings por HTTP contra el pool de backends de Ollama"""
+
+    name = EMBEDDING_BACKEND_OLLAMA
+
+    def __init__(self, http_client: Optional[OllamaHttpClient] = None):
+        self.model = settings.embedding_model
+        self.pool = OllamaBackendPool.from_settings(
+            "embedding",
+            settings.ollama_embedding_backends,
+            http_client
+        )
+        # Un cliente de embeddings por backend del pool, sobre el pool de conexiones compartido
+        self.embeddings = {
+            url: OllamaEmbeddings(
+                model=self.model,
+                base_url=url,
+                keep_alive=settings.ollama_keep_alive,
+                async_client_kwargs=self.pool.http_client.client_kwargs(url)
+            )
+            for url in self.pool.urls
+        }
+        # Ventanas de latencias de consultas y decisiones de duplicado (hedging)
+        self._query_latencies = deque(maxlen=HEDGE_WINDOW_SIZE)
+        self._hedge_decisions = deque(maxlen=HEDGE_WINDOW_SIZE)
+
+    async def _embed_on_backend(
+        self,
+        texts: List[str],
+        exclude: Iterable[str] = (),
+        chosen: Optional[List[str]] = None
+    ) -> np.ndarray:
+        """
+        Envía los textos al backend menos cargado del pool
+
+        Args:
+            texts: Lista de textos
+            exclude: URLs de backends a descartar
+            chosen: Lista opcional donde se anota la URL del backend elegido
+
+        Returns:
+            Matriz float32 de embeddings
+        """
+        async with self.pool.lease(exclude=exclude) as backend:
+            if chosen is not None:
+                chosen.append(backend.url)
+            # La respuesta JSON se convierte a float32 en cuanto llega
+            return as_matrix(await self.embeddings[backend.url].aembed_documents(texts))
+
+    async def embed(self, texts: List[str], exclude: Iterable[str] = ()) -> np.ndarray:
+        """
+        Envía los textos a un backend del pool, reintentando en otro si falla
+
+        Args:
+            texts: Lista de textos
+            exclude: URLs de backends a descartar
+
+        Returns:
+            Matriz float32 de embeddings
+        """
+        failed = list(exclude)
+        attempts = max(1, min(EMBEDDING_MAX_ATTEMPTS, len(self.pool.backends) - len(failed)))
+        for attempt in range(attempts):
+            chosen: List[str] = []
+            try:
+                return await self._embed_on_backend(texts, exclude=failed, chosen=chosen)
+            except Exception as e:
+                if attempt == attempts - 1:
+                    raise
+                failed.extend(chosen)
+                logger.warning(f"Error de embeddings en {', '.join(chosen)}, reintentando: {str(e)}")
+
+    def _hedge_delay(self) -> Optional[float]:
+        """
+        Calcula a partir de cuánto tiempo se envía una petición duplicada
+
+        Returns:
+            Percentil configurado de la latencia observada, o None si no debe
+            cubrirse la petición (desactivado, un solo backend o pocas muestras)
+        """
+        if not settings.embedding_hedging_enable or len(self.pool.backends) < 2:
+            return None
+        if len(self._query_latencies) < settings.embedding_hedge_min_samples:
+            return None
+
+        # Presupuesto de duplicados: no superar la tasa máxima configurada
+        if self._hedge_decisions and (
+            sum(self._hedge_decisions) / len(self._hedge_decisions)
+            >= settings.embedding_hedge_max_rate
+        ):
+            return None
+
+        latencies = sorted(self._query_latencies)
+        index = min(len(latencies) - 1, int(len(latencies) * settings.embedding_hedge_quantile))
+        return latencies[index]
+
+    def hedges_queries(self) -> bool:
+        return self._hedge_delay() is not None
+
+    def observe_query_latency(self, seconds: float):
+        self._query_latencies.append(seconds)
+        self._hedge_decisions.append(False)
+
+    async def _embed_query_hedged(self, query: str, delay: float) -> np.ndarray:
+        """
+        Genera el embedding de una consulta enviando un duplicado a otro backend
+        si el primero no responde dentro del plazo, y se queda con el más rápido
+
+        Args:
+            query: Texto de la consulta
+            delay: Segundos de espera antes de enviar el duplicado
+
+        Returns:
+            Vector float32 de la consulta
+        """
+        primary_backends: List[str] = []
+        primary = asyncio.create_task(
+            self._embed_on_backend([query], chosen=primary_backends)
+        )
+        pending = {primary}
+        try:
+            done, pending = await asyncio.wait(pending, timeout=delay)
+            if done:
+                if primary.exception() is None:
+                    self._hedge_decisions.append(False)
+                    return primary.result()[0]
+                # Fallo rápido del primero: reintentar en otro backend
+                return (await self.embed([query], exclude=primary_backends))[0]
+
+            self._hedge_decisions.append(True)
+            metrics.increment("embedding_hedges_total")
+            hedge = asyncio.create_task(
+                self._embed_on_backend([query], exclude=primary_backends)
+            )
+            pending.add(hedge)
+
+            errors = []
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            metrics.increment("embedding_hedge_wins_total")
+                        return task.result()[0]
+                    errors.append(task.exception())
+            raise errors[0]
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def embed_query(self, query: str) -> np.ndarray:
+        started_at = time.monotonic()
+        hedge_delay = self._hedge_delay()
+        if hedge_delay is None:
+            embedding = (await self.embed([query]))[0]
+            self._hedge_decisions.append(False)
+        else:
+            embedding = await self._embed_query_hedged(query, hedge_delay)
+        self._query_latencies.append(time.monotonic() - started_at)
+        return embedding
+
+    async def start(self):
+        await self.pool.start()
+
+    async def close(self):
+        await self.pool.close()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**super().get_stats(), "backends": self.pool.get_stats()}
+
+
+class OnnxEmbeddingBackend(EmbeddingBackend):
+    """Embeddings en proceso con ONNX Runtime en CPU"""
+
+    name = EMBEDDING_BACKEND_ONNX
+
+    def __init__(self, model_path: Optional[str] = None):
+        try:
+            import onnxruntime
+            from tokenizers import Tokenizer
+        except ImportError as e:
+            raise RuntimeError(
+                f"El backend de embeddings 'onnx' requiere onnxruntime y tokenizers: {e}"
+            )
+
+        self.model_path = model_path or settings.embedding_onnx_model_path
+        self.model = f"onnx:{os.path.basename(os.path.normpath(self.model_path))}"
+        self.batch_size = settings.embedding_onnx_batch_size
+
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = settings.embedding_onnx_intra_op_threads
+        self.session = onnxruntime.InferenceSession(
+            os.path.join(self.model_path, ONNX_MODEL_FILE),
+            sess_options=options,
+            providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {node.name for node in self.session.get_inputs()}
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(self.model_path, ONNX_TOKENIZER_FILE))
+        self.tokenizer.enable_truncation(max_length=settings.embedding_onnx_max_length)
+        self.tokenizer.enable_padding()
+
+        # Las sesiones de ONNX Runtime admiten llamadas concurrentes a run()
+        self.executor = ThreadPoolExecutor(
+            max_workers=settings.embedding_onnx_workers,
+            thread_name_prefix="onnx-embeddings"
+        )
+        logger.info(f"Modelo de embeddings ONNX cargado desde '{self.model_path}'")
+
+    def _embed_batch_sync(self, texts: List[str]) -> np.ndarray:
+        """Tokeniza y ejecuta un lote; pooling medio y normalización L2"""
+        encodings = self.tokenizer.encode_batch(texts)
+        input_ids = np.array([e.ids for e in encodings], dtype=np.int64)
+        attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        inputs = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self.input_names:
+            inputs["token_type_ids"] = np.zeros_like(input_ids)
+
+        hidden = self.session.run(None, inputs)[0]
+        mask = attention_mask[..., None].astype(np.float32)
+        pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+        return as_matrix(pooled)
+
+    async def embed(self, texts: List[str]) -> np.ndarray:
+        loop = asyncio.get_running_loop()
+        batches = [
+            texts[start:start + self.batch_size]
+            for start in range(0, len(texts), self.batch_size)
+        ]
+        started_at = time.monotonic()
+        results = await asyncio.gather(*(
+            loop.run_in_executor(self.executor, self._embed_batch_sync, batch)
+            for batch in batches
+        ))
+        metrics.observe("embedding_onnx_seconds", time.monotonic() - started_at)
+        return results[0] if len(results) == 1 else np.concatenate(results)
+
+    async def close(self):
+        self.executor.shutdown(wait=False)
+
+
+class StubEmbeddingBackend(EmbeddingBackend):
+    """Vectores deterministas a partir del hash del texto (solo pruebas)"""
+
+    name = EMBEDDING_BACKEND_STUB
+
+    def __init__(self, dimensions: Optional[int] = None):
+        self.dimensions = dimensions or settings.embedding_stub_dimensions
+        self.model = f"stub:{self.dimensions}"
+
+    def _vector(self, text: str) -> np.ndarray:
+        """Vector unitario pseudoaleatorio sembrado con el hash del texto normalizado"""
+        seed = hashlib.sha256(normalize_text(text).encode("utf-8")).digest()
+        rng = np.random.default_rng(int.from_bytes(seed[:8], "big"))
+        vector = rng.standard_normal(self.dimensions).astype(np.float32)
+        return vector / np.linalg.norm(vector)
+
+    async def embed(self, texts: List[str]) -> np.ndarray:
+        matrix = np.empty((len(texts), self.dimensions), dtype=np.float32)
+        for row, text in enumerate(texts):
+            matrix[row] = self._vector(text)
+        return matrix
+
+
+def create_embedding_backend(
+    name: Optional[str] = None,
+    http_client: Optional[OllamaHttpClient] = None
+) -> EmbeddingBackend:
+    """
+    Crea el backend de embeddings configurado
+
+    Args:
+        name: Nombre del backend (ollama, onnx o stub); por defecto, el configurado
+        http_client: Cliente HTTP compartido para el backend de Ollama
+
+    Returns:
+        Backend de embeddings
+
+    Raises:
+        ValueError: Si el backend no existe
+    """
+    name = name or settings.embedding_backend
+    if name == EMBEDDING_BACKEND_OLLAMA:
+        return OllamaEmbeddingBackend(http_client)
+    if name == EMBEDDING_BACKEND_ONNX:
+        return OnnxEmbeddingBackend()
+    if name == EMBEDDING_BACKEND_STUB:
+        return StubEmbeddingBackend()
+    raise ValueError(
+        f"Backend de embeddings '{name}' desconocido; opciones: "
+        f"{EMBEDDING_BACKEND_OLLAMA}, {EMBEDDING_BACKEND_ONNX}, {EMBEDDING_BACKEND_STUB}"
+    )
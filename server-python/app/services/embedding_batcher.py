@@ -0,0 +1,118 @@
+"""
+Micro-batching de peticiones de embeddings entre peticiones concurrentes
+
+Las peticiones de embeddings (consultas y documentos) que llegan a la vez se
+acumulan durante unos milisegundos, o hasta alcanzar un tamaño máximo, y se
+envían a Ollama en una única llamada por lotes. Cada coroutine recibe después
+los vectores de sus propios textos.
+"""
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, List, Optional, Tuple
+import numpy as np
+from app.config import settings
+from app.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Límites de los histogramas de tamaño de lote (textos) y de espera (segundos)
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+BATCH_WAIT_BUCKETS = (0.001, 0.002, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25)
+
+EmbedFunction = Callable[[List[str]], Awaitable[np.ndarray]]
+
+
+class EmbeddingBatcher:
+    """Agrupa peticiones de embeddings concurrentes en llamadas por lotes"""
+
+    def __init__(
+        self,
+        embed: EmbedFunction,
+        max_batch_size: Optional[int] = None,
+        max_wait_seconds: Optional[float] = None
+    ):
+        self.embed_batch = embed
+        self.max_batch_size = max_batch_size or settings.embedding_batch_max_size
+        self.max_wait_seconds = (
+            max_wait_seconds if max_wait_seconds is not None
+            else settings.embedding_batch_max_wait_seconds
+        )
+        # Peticiones pendientes: (textos, futuro, instante de llegada)
+        self._pending: List[Tuple[List[str], asyncio.Future, float]] = []
+        self._pending_texts = 0
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: set = set()
+
+    async def embed(self, texts: List[str]) -> np.ndarray:
+        """
+        Encola unos textos en el lote en curso y espera sus embeddings
+
+        Args:
+            texts: Lista de textos
+
+        Returns:
+            Matriz float32 con una fila por texto (vista sobre la del lote)
+        """
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+
+        loop = asyncio.get_running_loop()
+        # Si no caben en el lote en curso, este sale antes para no superar el máximo
+        if self._pending and self._pending_texts + len(texts) > self.max_batch_size:
+            self._flush()
+
+        future = loop.create_future()
+        self._pending.append((texts, future, time.monotonic()))
+        self._pending_texts += len(texts)
+
+        if self._pending_texts >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait_seconds, self._flush)
+
+        return await future
+
+    def _flush(self):
+        """Saca el lote pendiente y lo envía en segundo plano"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+
+        batch, self._pending, self._pending_texts = self._pending, [], 0
+        task = asyncio.get_running_loop().create_task(self._run(batch))
+        # Referencia fuerte hasta que termine para que no la recolecte el GC
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: List[Tuple[List[str], asyncio.Future, float]]):
+        """Envía un lote a Ollama y reparte los vectores entre sus peticiones"""
+        dispatched_at = time.monotonic()
+        texts = [text for request_texts, _, _ in batch for text in request_texts]
+        metrics.observe("embedding_batch_size", len(texts), buckets=BATCH_SIZE_BUCKETS)
+        for _, _, enqueued_at in batch:
+            metrics.observe("embedding_batch_wait_seconds", dispatched_at - enqueued_at,
+                            buckets=BATCH_WAIT_BUCKETS)
+
+        try:
+            embeddings = await self.embed_batch(texts)
+        except Exception as e:
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        offset = 0
+        for request_texts, future, _ in batch:
+            # La petición puede haberse cancelado mientras esperaba
+            if not future.done():
+                future.set_result(embeddings[offset:offset + len(request_texts)])
+            offset += len(request_texts)
+
+    async def close(self):
+        """Envía lo pendiente y espera a los lotes en curso"""
+        self._flush()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
@@ -0,0 +1,238 @@
+"""
+Caché persistente de embeddings por contenido
+
+Los embeddings se indexan por (modelo, hash del texto normalizado) en dos
+niveles: un LRU en memoria del proceso delante de una tabla SQLite con la
+base de datos mapeada en memoria (PRAGMA mmap_size). Los textos repetidos
+(consultas frecuentes, documentos reindexados) no vuelven a Ollama, y el
+nivel en disco sobrevive a los reinicios.
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Tuple
+import numpy as np
+from app.config import settings
+from app.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Máximo de parámetros por consulta IN (límite de SQLite)
+SQLITE_MAX_PARAMS = 500
+
+
+def normalize_text(text: str) -> str:
+    """Normaliza un texto para la clave de caché (espacios colapsados)"""
+    return " ".join(text.split())
+
+
+def text_key(model: str, text: str) -> str:
+    """
+    Calcula la clave de caché de un texto
+
+    Args:
+        model: Modelo de embeddings
+        text: Texto original
+
+    Returns:
+        Hash SHA-256 del modelo y el texto normalizado
+    """
+    digest = hashlib.sha256()
+    digest.update(model.encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(normalize_text(text).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class EmbeddingCache:
+    """Caché de embeddings en dos niveles (memoria + SQLite mapeado en memoria)"""
+
+    def __init__(
+        self,
+        db_path: Optional[str] = None,
+        memory_entries: Optional[int] = None,
+        mmap_bytes: Optional[int] = None
+    ):
+        self.db_path = db_path or settings.embedding_cache_db_path
+        self.memory_entries = memory_entries or settings.embedding_cache_memory_entries
+        self.mmap_bytes = mmap_bytes if mmap_bytes is not None else settings.embedding_cache_mmap_bytes
+        self._memory: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+        self._connection = self._connect()
+
+    def _connect(self) -> sqlite3.Connection:
+        """Abre la base de datos SQLite y crea el esquema si no existe"""
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        connection = sqlite3.connect(self.db_path, check_same_thread=False)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.execute(f"PRAGMA mmap_size={int(self.mmap_bytes)}")
+        connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                dimensions INTEGER NOT NULL,
+                vector BLOB NOT NULL,
+                created_at REAL NOT NULL
+            ) WITHOUT ROWID
+            """
+        )
+        connection.commit()
+        logger.info(f"Caché de embeddings lista en '{self.db_path}'")
+        return connection
+
+    def _remember(self, key: str, vector: np.ndarray):
+        """Guarda un vector en el LRU en memoria. Debe llamarse con el lock adquirido."""
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _get_from_disk_sync(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        """Busca en SQLite un lote de claves y las sube al nivel en memoria"""
+        found: Dict[str, np.ndarray] = {}
+        with self._lock:
+            for start in range(0, len(keys), SQLITE_MAX_PARAMS):
+                batch = keys[start:start + SQLITE_MAX_PARAMS]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._connection.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})",
+                    batch
+                ).fetchall()
+                for key, blob in rows:
+                    # Vista float32 de solo lectura sobre el blob, sin copiar
+                    vector = np.frombuffer(blob, dtype=np.float32)
+                    found[key] = vector
+                    self._remember(key, vector)
+        return found
+
+    def _put_sync(self, model: str, entries: List[Tuple[str, np.ndarray]]):
+        """Persiste un lote de vectores en SQLite y en memoria"""
+        now = time.time()
+        with self._lock:
+            self._connection.executemany(
+                """
+                INSERT OR REPLACE INTO embeddings (key, model, dimensions, vector, created_at)
+                VALUES (?, ?, ?, ?, ?)
+                """,
+                [
+                    (key, model, vector.shape[0], vector.tobytes(), now)
+                    for key, vector in entries
+                ]
+            )
+            self._connection.commit()
+            for key, vector in entries:
+                self._remember(key, vector)
+
+    def _record(self, memory_hits: int, disk_hits: int, misses: int):
+        """Actualiza los contadores de aciertos y fallos"""
+        with self._lock:
+            self._stats["memory_hits"] += memory_hits
+            self._stats["disk_hits"] += disk_hits
+            self._stats["misses"] += misses
+        if memory_hits:
+            metrics.increment("embedding_cache_hits_total", memory_hits, labels={"level": "memory"})
+        if disk_hits:
+            metrics.increment("embedding_cache_hits_total", disk_hits, labels={"level": "disk"})
+        if misses:
+            metrics.increment("embedding_cache_misses_total", misses)
+
+    async def get_many(self, model: str, texts: List[str]) -> List[Optional[np.ndarray]]:
+        """
+        Busca los embeddings de un lote de textos
+
+        Primero en memoria; las claves que faltan se consultan en SQLite en una
+        sola pasada fuera del event loop.
+
+        Args:
+            model: Modelo de embeddings
+            texts: Textos a buscar
+
+        Returns:
+            Lista alineada con texts con el vector float32 o None si no está en caché
+        """
+        keys = [text_key(model, text) for text in texts]
+        results: List[Optional[np.ndarray]] = [None] * len(texts)
+        missing: Dict[str, List[int]] = {}
+
+        with self._lock:
+            for index, key in enumerate(keys):
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    results[index] = vector
+                else:
+                    missing.setdefault(key, []).append(index)
+        memory_hits = len(texts) - sum(len(indexes) for indexes in missing.values())
+
+        disk_hits = 0
+        if missing:
+            try:
+                found = await asyncio.to_thread(self._get_from_disk_sync, list(missing))
+            except Exception as e:
+                logger.error(f"Error leyendo la caché de embeddings: {str(e)}")
+                found = {}
+            for key, vector in found.items():
+                for index in missing[key]:
+                    results[index] = vector
+                    disk_hits += 1
+
+        self._record(memory_hits, disk_hits, len(texts) - memory_hits - disk_hits)
+        return results
+
+    async def put_many(self, model: str, texts: List[str], embeddings: np.ndarray):
+        """
+        Guarda los embeddings de un lote de textos
+
+        Args:
+            model: Modelo de embeddings
+            texts: Textos
+            embeddings: Matriz float32 con una fila por texto
+        """
+        # Copia por fila para no retener en memoria la matriz completa del lote
+        entries = list({
+            text_key(model, text): np.array(vector, dtype=np.float32)
+            for text, vector in zip(texts, embeddings)
+        }.items())
+        if not entries:
+            return
+        try:
+            await asyncio.to_thread(self._put_sync, model, entries)
+        except Exception as e:
+            # La caché es una optimización: un fallo al escribir no rompe la petición
+            logger.error(f"Error escribiendo en la caché de embeddings: {str(e)}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Obtiene los aciertos por nivel y la tasa de aciertos
+
+        Returns:
+            Diccionario con contadores, tasa de aciertos y entradas en memoria
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats["memory_entries"] = len(self._memory)
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = (
+            round((stats["memory_hits"] + stats["disk_hits"]) / lookups, 3) if lookups else None
+        )
+        return stats
+
+    def close(self):
+        """Cierra la conexión con la base de datos"""
+        with self._lock:
+            try:
+                self._connection.close()
+                logger.info("Caché de embeddings cerrada correctamente")
+            except Exception as e:
+                logger.error(f"Error cerrando la caché de embeddings: {str(e)}")
@@ -1,32 +1,101 @@
 """
-Servicio de embeddings usando LangChain y Ollama
+Servicio de embeddings con backend intercambiable (Ollama, ONNX Runtime o stub)
 """
 import logging
-from typing import List, Optional
-from langchain_ollama import OllamaEmbeddings
+import time
+from typing import AsyncIterator, Dict, Iterable, List, Optional
+import numpy as np
 from langchain_core.documents import Document
-from langchain_text_splitters import RecursiveCharacterTextSplitter
 from app.config import settings
+from app.services.embedding_backends import EmbeddingBackend, create_embedding_backend
+from app.services.embedding_batcher import EmbeddingBatcher
+from app.services.embedding_cache import EmbeddingCache, text_key
+from app.services.http_client import OllamaHttpClient
+from app.services.ollama_pool import OllamaBackendPool
+from app.services.text_splitter import DocumentSplitter, iter_sections, iter_split_text
+from app.services.vector_index import truncate_embeddings
 
 logger = logging.getLogger(__name__)
 
 
 class EmbeddingService:
-    """Servicio para generar embeddings usando Ollama"""
+    """Servicio para generar embeddings sobre un backend configurable"""
     
-    def __init__(self):
-        self.embeddings = OllamaEmbeddings(
-            model=settings.embedding_model,
-            base_url=settings.ollama_base_url
-        )
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000,
-            chunk_overlap=200,
-            length_function=len,
-            separators=["\n\n", "\n", " ", ""]
+    def __init__(
+        self,
+        http_client: Optional[OllamaHttpClient] = None,
+        backend: Optional[EmbeddingBackend] = None
+    ):
+        self.backend = backend or create_embedding_backend(http_client=http_client)
+        # Caché persistente de embeddings por contenido (opcional)
+        self.cache = EmbeddingCache() if settings.embedding_cache_enable else None
+        # Micro-batching de peticiones concurrentes (opcional)
+        self.batcher = (
+            EmbeddingBatcher(self.backend.embed) if settings.embedding_batch_enable else None
         )
+        # División por secciones fuera del event loop (hilo o pool de procesos)
+        self.splitter = DocumentSplitter()
+    
+    @property
+    def pool(self) -> Optional[OllamaBackendPool]:
+        """Pool de Ollama del backend (None si el backend no usa Ollama)"""
+        return self.backend.pool
+    
+    async def start(self):
+        """Inicia las tareas en segundo plano del backend"""
+        await self.backend.start()
+    
+    async def _embed_batched(self, texts: List[str]) -> np.ndarray:
+        """
+        Genera embeddings a través del micro-batcher, si está activo
+        
+        Args:
+            texts: Lista de textos
+            
+        Returns:
+            Matriz float32 con una fila por texto
+        """
+        if self.batcher is None:
+            return await self.backend.embed(texts)
+        return await self.batcher.embed(texts)
+    
+    async def _embed_cached(self, texts: List[str]) -> np.ndarray:
+        """
+        Genera embeddings consultando antes la caché
+        
+        Solo los textos que faltan en la caché (sin repetidos) se envían al
+        backend, en una única llamada por lotes.
+        
+        Args:
+            texts: Lista de textos
+            
+        Returns:
+            Matriz float32 con una fila por texto
+        """
+        if self.cache is None:
+            return await self._embed_batched(texts)
+        
+        model = self.backend.model
+        cached = await self.cache.get_many(model, texts)
+        # Un único texto por clave: los que solo difieren en espacios comparten vector
+        missing: Dict[str, str] = {}
+        for text, embedding in zip(texts, cached):
+            if embedding is None:
+                missing.setdefault(text_key(model, text), text)
+        if not missing:
+            return np.stack(cached)
+        
+        missing_texts = list(missing.values())
+        computed = await self._embed_batched(missing_texts)
+        await self.cache.put_many(model, missing_texts, computed)
+        rows = {key: row for key, row in zip(missing, computed)}
+        
+        embeddings = np.empty((len(texts), computed.shape[1]), dtype=np.float32)
+        for index, (text, embedding) in enumerate(zip(texts, cached)):
+            embeddings[index] = embedding if embedding is not None else rows[text_key(model, text)]
+        return embeddings
     
-    async def generate_embeddings(self, texts: List[str]) -> List[List[float]]:
+    async def generate_embeddings(self, texts: List[str]) -> np.ndarray:
         """
         Genera embeddings para una lista de textos
         
@@ -34,18 +103,21 @@ class EmbeddingService:
             texts: Lista de textos para generar embeddings
             
         Returns:
-            Lista de embeddings (vectores)
+            Matriz float32 contigua con un embedding por fila
         """
         try:
             logger.info(f"Generando embeddings para {len(texts)} textos")
-            embeddings = await self.embeddings.aembed_documents(texts)
+            # La caché guarda los vectores completos; el truncado se aplica al salir
+            embeddings = truncate_embeddings(
+                await self._embed_cached(texts), settings.embedding_dimensions
+            )
             logger.info(f"Embeddings generados exitosamente")
             return embeddings
         except Exception as e:
             logger.error(f"Error generando embeddings: {str(e)}")
             raise
     
-    async def generate_query_embedding(self, query: str) -> List[float]:
+    async def generate_query_embedding(self, query: str) -> np.ndarray:
         """
         Genera embedding para una consulta
         
@@ -53,17 +125,38 @@ class EmbeddingService:
             query: Texto de la consulta
             
         Returns:
-            Vector embedding de la consulta
+            Vector float32 de la consulta
         """
         try:
             logger.info(f"Generando embedding para consulta: {query[:50]}...")
-            embedding = await self.embeddings.aembed_query(query)
+            if self.cache is not None:
+                cached = (await self.cache.get_many(self.backend.model, [query]))[0]
+                if cached is not None:
+                    return truncate_embeddings(cached, settings.embedding_dimensions)
+            
+            if self.batcher is not None and not self.backend.hedges_queries():
+                started_at = time.monotonic()
+                embedding = (await self.batcher.embed([query]))[0]
+                self.backend.observe_query_latency(time.monotonic() - started_at)
+            else:
+                embedding = await self.backend.embed_query(query)
+            if self.cache is not None:
+                await self.cache.put_many(self.backend.model, [query], embedding[None, :])
             logger.info("Embedding de consulta generado exitosamente")
-            return embedding
+            return truncate_embeddings(embedding, settings.embedding_dimensions)
         except Exception as e:
             logger.error(f"Error generando embedding de consulta: {str(e)}")
             raise
     
+    async def close(self):
+        """Envía los lotes pendientes y cierra el backend y la caché de embeddings"""
+        if self.batcher is not None:
+            await self.batcher.close()
+        await self.backend.close()
+        self.splitter.close()
+        if self.cache is not None:
+            self.cache.close()
+    
     def split_documents(self, documents: List[Document]) -> List[Document]:
         """
         Divide documentos en chunks más pequeños
@@ -76,13 +169,51 @@ class EmbeddingService:
         """
         try:
             logger.info(f"Dividiendo {len(documents)} documentos en chunks")
-            chunks = self.text_splitter.split_documents(documents)
+            chunks = [
+                Document(page_content=chunk, metadata=dict(document.metadata))
+                for document in documents
+                for chunk in iter_split_text(iter_sections(document.page_content))
+            ]
             logger.info(f"Creados {len(chunks)} chunks")
             return chunks
         except Exception as e:
             logger.error(f"Error dividiendo documentos: {str(e)}")
             raise
     
+    async def aiter_document_chunks(
+        self,
+        document: Document,
+        parts: Optional[Iterable[str]] = None
+    ) -> AsyncIterator[Document]:
+        """
+        Divide un documento fuera del event loop, entregando los chunks según
+        se producen
+        
+        Args:
+            document: Documento a dividir (aporta los metadatos)
+            parts: Partes del texto si llega por trozos; por defecto, el
+                contenido del documento recorrido por secciones
+            
+        Yields:
+            Chunks del documento
+        """
+        if parts is None:
+            parts = iter_sections(document.page_content)
+        async for chunk in self.splitter.aiter_chunks(parts):
+            yield Document(page_content=chunk, metadata=dict(document.metadata))
+    
+    async def split_texts_bulk(self, texts: List[str]) -> List[List[str]]:
+        """
+        Divide varios textos en paralelo (pool de procesos si está configurado)
+        
+        Args:
+            texts: Textos a dividir
+            
+        Returns:
+            Chunks de cada texto, alineados con texts
+        """
+        return await self.splitter.split_many(texts)
+    
     def create_document_from_text(
         self, 
         content: str, 
@@ -0,0 +1,207 @@
+"""
+Sondeo de salud en segundo plano con señales baratas
+
+En lugar de generar una respuesta con el LLM en cada health check, un bucle en
+segundo plano consulta /api/tags y /api/ps de cada backend de Ollama, el
+número de documentos de la colección y el estado del productor de Kafka, y
+guarda el resultado en una instantánea con caducidad que sirven los endpoints
+de liveness y readiness.
+"""
+import asyncio
+import logging
+import time
+from typing import Dict, List, Optional, Any
+import httpx
+from app.config import settings
+from app.metrics import metrics
+from app.services.kafka_service import kafka_service
+from app.services.model_router import configured_models
+from app.services.ollama_pool import OllamaBackendPool
+from app.services.vector_db_service import VectorDatabaseService
+from app.services.warmup_service import ModelWarmupService
+
+logger = logging.getLogger(__name__)
+
+# Timeout de las consultas de salud a Ollama (segundos)
+PROBE_TIMEOUT_SECONDS = 2.0
+
+
+class HealthProber:
+    """Sondeo periódico de dependencias con instantánea cacheada"""
+
+    def __init__(
+        self,
+        generation_pool: OllamaBackendPool,
+        embedding_pool: Optional[OllamaBackendPool],
+        vector_db_service: VectorDatabaseService,
+        warmup_service: ModelWarmupService
+    ):
+        self.generation_pool = generation_pool
+        self.embedding_pool = embedding_pool
+        self.vector_db_service = vector_db_service
+        self.warmup_service = warmup_service
+        self.interval = settings.health_probe_interval_seconds
+        self.ttl = settings.health_snapshot_ttl_seconds
+        self._snapshot: Optional[Dict[str, Any]] = None
+        self._snapshot_at = 0.0
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def _has_model(names: List[str], model: str) -> bool:
+        """Comprueba si un modelo figura en una lista de Ollama (tag latest implícito)"""
+        return model in names or f"{model}:latest" in names
+
+    async def _probe_backend(self, client: httpx.AsyncClient, url: str) -> Dict[str, Any]:
+        """
+        Consulta los modelos instalados y cargados de un backend
+
+        Args:
+            client: Cliente HTTP
+            url: URL del backend
+
+        Returns:
+            Estado del backend
+        """
+        try:
+            tags, ps = await asyncio.gather(
+                client.get(f"{url}/api/tags", timeout=PROBE_TIMEOUT_SECONDS),
+                client.get(f"{url}/api/ps", timeout=PROBE_TIMEOUT_SECONDS)
+            )
+            tags.raise_for_status()
+            ps.raise_for_status()
+            return {
+                "url": url,
+                "reachable": True,
+                "models_installed": [m.get("name", "") for m in tags.json().get("models", [])],
+                "models_loaded": [m.get("name", "") for m in ps.json().get("models", [])]
+            }
+        except Exception as e:
+            return {"url": url, "reachable": False, "error": str(e)}
+
+    def _model_status(self, backends: Dict[str, Dict[str, Any]], pool: OllamaBackendPool, model: str) -> str:
+        """Un modelo está disponible si algún backend de su pool lo tiene instalado"""
+        for url in pool.urls:
+            backend = backends[url]
+            if backend["reachable"] and self._has_model(backend["models_installed"], model):
+                return "available"
+        return "unavailable"
+
+    async def _probe_vector_db(self) -> Dict[str, Any]:
+        """Cuenta los documentos de la colección (fuera del event loop)"""
+        try:
+            count = await self.vector_db_service.count_documents()
+            return {"status": "available", "total_documents": count}
+        except Exception as e:
+            return {"status": "unavailable", "error": str(e)}
+
+    def _is_fresh(self) -> bool:
+        """Indica si la instantánea actual no ha caducado"""
+        return self._snapshot is not None and time.monotonic() - self._snapshot_at <= self.ttl
+
+    async def refresh(self) -> Dict[str, Any]:
+        """
+        Sondea todas las dependencias y actualiza la instantánea
+
+        Returns:
+            Instantánea de salud
+        """
+        async with self._lock:
+            return await self._probe_all()
+
+    async def _probe_all(self) -> Dict[str, Any]:
+        """Sondea las dependencias; se llama con el lock adquirido"""
+        started_at = time.monotonic()
+        # Con un backend de embeddings en proceso no hay pool de Ollama de embeddings
+        embedding_urls = self.embedding_pool.urls if self.embedding_pool is not None else []
+        urls = list(dict.fromkeys(self.generation_pool.urls + embedding_urls))
+        # Mismo cliente compartido (y pools de conexiones) que el pool de generación
+        client = self.generation_pool.http_client.client
+        results = await asyncio.gather(
+            *(self._probe_backend(client, url) for url in urls)
+        )
+        backends = dict(zip(urls, results))
+        vector_db = await self._probe_vector_db()
+
+        kafka_status = "disabled"
+        if settings.kafka_enable:
+            kafka_status = "available" if kafka_service.is_healthy() else "unavailable"
+
+        models = {
+            model: self._model_status(backends, self.generation_pool, model)
+            for model in configured_models()
+        }
+        embedding_status = "available"
+        if self.embedding_pool is not None:
+            embedding_status = self._model_status(
+                backends, self.embedding_pool, settings.embedding_model
+            )
+            models[settings.embedding_model] = embedding_status
+
+        self._snapshot = {
+            "checked_at": time.time(),
+            "models": models,
+            "embedding_service": embedding_status,
+            "ollama_backends": results,
+            "vector_database": vector_db,
+            "kafka": kafka_status,
+            "models_warm": self.warmup_service.is_ready()
+        }
+        self._snapshot_at = time.monotonic()
+        metrics.observe("health_probe_seconds", self._snapshot_at - started_at)
+        return self._snapshot
+
+    async def get_snapshot(self) -> Dict[str, Any]:
+        """
+        Obtiene la última instantánea, sondeando solo si ha caducado
+
+        Las peticiones concurrentes con la instantánea caducada comparten un
+        único sondeo.
+
+        Returns:
+            Instantánea de salud
+        """
+        if self._is_fresh():
+            return self._snapshot
+        async with self._lock:
+            if self._is_fresh():
+                return self._snapshot
+            return await self._probe_all()
+
+    def is_ready(self, snapshot: Dict[str, Any]) -> bool:
+        """
+        Indica si el servidor puede atender peticiones
+
+        El estado de precarga se consulta en vivo (no espera al siguiente
+        sondeo). Kafka no forma parte de la readiness: sin él el chat sigue
+        funcionando.
+        """
+        return (
+            self.warmup_service.is_ready()
+            and all(status == "available" for status in snapshot["models"].values())
+            and snapshot["vector_database"]["status"] == "available"
+        )
+
+    async def _probe_loop(self):
+        """Bucle de sondeo en segundo plano"""
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.error(f"Error sondeando la salud de los servicios: {str(e)}")
+            await asyncio.sleep(self.interval)
+
+    async def start(self):
+        """Inicia el sondeo en segundo plano"""
+        if self._task is None and self.interval > 0:
+            self._task = asyncio.create_task(self._probe_loop())
+
+    async def close(self):
+        """Detiene el sondeo"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
@@ -0,0 +1,373 @@
+"""
+Servicio de historial ordenado de conversaciones
+
+Mantiene los turnos de cada conversación en una tabla SQLite indexada por
+(conversation_id, turn_index) y un buffer circular en memoria por cada
+conversación activa, de modo que los últimos N turnos se sirven sin recorrer
+la colección vectorial.
+"""
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import List, Dict, Any, Optional
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class _ConversationBuffer:
+    """Buffer circular con los turnos más recientes de una conversación"""
+
+    def __init__(self, maxlen: int, next_index: int):
+        self.turns = deque(maxlen=maxlen)
+        self.next_index = next_index
+        self.summary: Optional[str] = None
+        self.summarized_until = 0
+
+
+class ConversationHistoryService:
+    """Almacén ordenado de turnos de conversación (memoria + SQLite)"""
+
+    def __init__(
+        self,
+        db_path: Optional[str] = None,
+        buffer_size: Optional[int] = None,
+        max_active_conversations: Optional[int] = None
+    ):
+        self.db_path = db_path or settings.history_db_path
+        self.buffer_size = buffer_size or settings.history_buffer_size
+        self.max_active_conversations = (
+            max_active_conversations or settings.history_max_active_conversations
+        )
+        self._buffers: "OrderedDict[str, _ConversationBuffer]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._connection = self._connect()
+
+    def _connect(self) -> sqlite3.Connection:
+        """Abre la base de datos SQLite y crea el esquema si no existe"""
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        connection = sqlite3.connect(self.db_path, check_same_thread=False)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS conversation_turns (
+                conversation_id TEXT NOT NULL,
+                turn_index INTEGER NOT NULL,
+                user_message TEXT NOT NULL,
+                assistant_response TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (conversation_id, turn_index)
+            ) WITHOUT ROWID
+            """
+        )
+        connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS conversation_summaries (
+                conversation_id TEXT PRIMARY KEY,
+                summary TEXT NOT NULL,
+                summarized_until INTEGER NOT NULL,
+                updated_at REAL NOT NULL
+            )
+            """
+        )
+        connection.commit()
+        logger.info(f"Historial de conversaciones listo en '{self.db_path}'")
+        return connection
+
+    def _load_buffer(self, conversation_id: str) -> _ConversationBuffer:
+        """
+        Devuelve el buffer de una conversación, cargándolo desde SQLite si no
+        está en memoria. Debe llamarse con el lock adquirido.
+        """
+        buffer = self._buffers.get(conversation_id)
+        if buffer is not None:
+            self._buffers.move_to_end(conversation_id)
+            return buffer
+
+        rows = self._connection.execute(
+            """
+            SELECT turn_index, user_message, assistant_response, created_at
+            FROM conversation_turns
+            WHERE conversation_id = ?
+            ORDER BY turn_index DESC
+            LIMIT ?
+            """,
+            (conversation_id, self.buffer_size)
+        ).fetchall()
+
+        next_index = rows[0][0] + 1 if rows else 0
+        buffer = _ConversationBuffer(self.buffer_size, next_index)
+        for row in reversed(rows):
+            buffer.turns.append(self._row_to_turn(conversation_id, row))
+
+        summary_row = self._connection.execute(
+            "SELECT summary, summarized_until FROM conversation_summaries WHERE conversation_id = ?",
+            (conversation_id,)
+        ).fetchone()
+        if summary_row:
+            buffer.summary, buffer.summarized_until = summary_row
+
+        self._buffers[conversation_id] = buffer
+        while len(self._buffers) > self.max_active_conversations:
+            self._buffers.popitem(last=False)
+        return buffer
+
+    @staticmethod
+    def _row_to_turn(conversation_id: str, row) -> Dict[str, Any]:
+        """Convierte una fila de SQLite en un turno"""
+        turn_index, user_message, assistant_response, created_at = row
+        return {
+            "conversation_id": conversation_id,
+            "turn_index": turn_index,
+            "user_message": user_message,
+            "assistant_response": assistant_response,
+            "created_at": created_at
+        }
+
+    def _append_turn_sync(
+        self,
+        conversation_id: str,
+        user_message: str,
+        assistant_response: str
+    ) -> Dict[str, Any]:
+        """Inserta un turno en SQLite y en el buffer de la conversación"""
+        with self._lock:
+            buffer = self._load_buffer(conversation_id)
+            turn = {
+                "conversation_id": conversation_id,
+                "turn_index": buffer.next_index,
+                "user_message": user_message,
+                "assistant_response": assistant_response,
+                "created_at": time.time()
+            }
+            self._connection.execute(
+                """
+                INSERT INTO conversation_turns
+                    (conversation_id, turn_index, user_message, assistant_response, created_at)
+                VALUES (?, ?, ?, ?, ?)
+                """,
+                (
+                    conversation_id,
+                    turn["turn_index"],
+                    user_message,
+                    assistant_response,
+                    turn["created_at"]
+                )
+            )
+            self._connection.commit()
+            buffer.turns.append(turn)
+            buffer.next_index += 1
+            return turn
+
+    def _get_recent_turns_sync(self, conversation_id: str, limit: int) -> List[Dict[str, Any]]:
+        """Lee los últimos turnos desde el buffer o, si no alcanzan, desde SQLite"""
+        with self._lock:
+            buffer = self._load_buffer(conversation_id)
+            if limit <= len(buffer.turns) or len(buffer.turns) < self.buffer_size:
+                return list(buffer.turns)[-limit:] if limit > 0 else []
+
+            # Se piden más turnos de los que caben en el buffer: leer de SQLite
+            rows = self._connection.execute(
+                """
+                SELECT turn_index, user_message, assistant_response, created_at
+                FROM conversation_turns
+                WHERE conversation_id = ?
+                ORDER BY turn_index DESC
+                LIMIT ?
+                """,
+                (conversation_id, limit)
+            ).fetchall()
+            return [self._row_to_turn(conversation_id, row) for row in reversed(rows)]
+
+    async def append_turn(
+        self,
+        conversation_id: str,
+        user_message: str,
+        assistant_response: str
+    ) -> Dict[str, Any]:
+        """
+        Añade un turno al final de la conversación
+
+        Args:
+            conversation_id: ID de la conversación
+            user_message: Mensaje del usuario
+            assistant_response: Respuesta del asistente
+
+        Returns:
+            Turno almacenado, incluyendo su índice dentro de la conversación
+        """
+        try:
+            return await asyncio.to_thread(
+                self._append_turn_sync,
+                conversation_id,
+                user_message,
+                assistant_response
+            )
+        except Exception as e:
+            logger.error(f"Error añadiendo turno al historial: {str(e)}")
+            raise
+
+    async def get_recent_turns(
+        self,
+        conversation_id: str,
+        limit: int = 10
+    ) -> List[Dict[str, Any]]:
+        """
+        Obtiene los últimos turnos de una conversación en orden cronológico
+
+        Args:
+            conversation_id: ID de la conversación
+            limit: Número máximo de turnos a devolver
+
+        Returns:
+            Lista de turnos, del más antiguo al más reciente
+        """
+        try:
+            with self._lock:
+                buffer = self._buffers.get(conversation_id)
+                if buffer is not None and limit <= len(buffer.turns):
+                    # Camino rápido: la conversación está activa en memoria
+                    self._buffers.move_to_end(conversation_id)
+                    return list(buffer.turns)[-limit:] if limit > 0 else []
+
+            return await asyncio.to_thread(self._get_recent_turns_sync, conversation_id, limit)
+        except Exception as e:
+            logger.error(f"Error obteniendo turnos recientes: {str(e)}")
+            raise
+
+    def _get_turns_range_sync(
+        self,
+        conversation_id: str,
+        start: int,
+        end: int
+    ) -> List[Dict[str, Any]]:
+        """Lee de SQLite los turnos con índice en [start, end)"""
+        with self._lock:
+            rows = self._connection.execute(
+                """
+                SELECT turn_index, user_message, assistant_response, created_at
+                FROM conversation_turns
+                WHERE conversation_id = ? AND turn_index >= ? AND turn_index < ?
+                ORDER BY turn_index
+                """,
+                (conversation_id, start, end)
+            ).fetchall()
+            return [self._row_to_turn(conversation_id, row) for row in rows]
+
+    async def get_turns_range(
+        self,
+        conversation_id: str,
+        start: int,
+        end: int
+    ) -> List[Dict[str, Any]]:
+        """
+        Obtiene los turnos de una conversación con índice en [start, end)
+
+        Args:
+            conversation_id: ID de la conversación
+            start: Índice del primer turno (incluido)
+            end: Índice del último turno (excluido)
+
+        Returns:
+            Lista de turnos en orden cronológico
+        """
+        try:
+            return await asyncio.to_thread(self._get_turns_range_sync, conversation_id, start, end)
+        except Exception as e:
+            logger.error(f"Error obteniendo rango de turnos: {str(e)}")
+            raise
+
+    def _get_summary_sync(self, conversation_id: str) -> Dict[str, Any]:
+        """Lee el resumen acumulado desde el buffer de la conversación"""
+        with self._lock:
+            buffer = self._load_buffer(conversation_id)
+            return {
+                "summary": buffer.summary,
+                "summarized_until": buffer.summarized_until,
+                "next_index": buffer.next_index
+            }
+
+    async def get_summary(self, conversation_id: str) -> Dict[str, Any]:
+        """
+        Obtiene el resumen acumulado de una conversación
+
+        Args:
+            conversation_id: ID de la conversación
+
+        Returns:
+            Diccionario con el resumen (o None), el índice del primer turno no
+            resumido y el índice del próximo turno
+        """
+        try:
+            with self._lock:
+                buffer = self._buffers.get(conversation_id)
+                if buffer is not None:
+                    self._buffers.move_to_end(conversation_id)
+                    return {
+                        "summary": buffer.summary,
+                        "summarized_until": buffer.summarized_until,
+                        "next_index": buffer.next_index
+                    }
+
+            return await asyncio.to_thread(self._get_summary_sync, conversation_id)
+        except Exception as e:
+            logger.error(f"Error obteniendo resumen: {str(e)}")
+            raise
+
+    def _save_summary_sync(self, conversation_id: str, summary: str, summarized_until: int):
+        """Persiste el resumen en SQLite y actualiza el buffer"""
+        with self._lock:
+            self._connection.execute(
+                """
+                INSERT INTO conversation_summaries
+                    (conversation_id, summary, summarized_until, updated_at)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(conversation_id) DO UPDATE SET
+                    summary = excluded.summary,
+                    summarized_until = excluded.summarized_until,
+                    updated_at = excluded.updated_at
+                """,
+                (conversation_id, summary, summarized_until, time.time())
+            )
+            self._connection.commit()
+            buffer = self._buffers.get(conversation_id)
+            if buffer is not None:
+                buffer.summary = summary
+                buffer.summarized_until = summarized_until
+
+    async def save_summary(self, conversation_id: str, summary: str, summarized_until: int):
+        """
+        Guarda el resumen acumulado de una conversación
+
+        Args:
+            conversation_id: ID de la conversación
+            summary: Resumen de los turnos ya plegados
+            summarized_until: Índice del primer turno que no está en el resumen
+        """
+        try:
+            await asyncio.to_thread(
+                self._save_summary_sync,
+                conversation_id,
+                summary,
+                summarized_until
+            )
+        except Exception as e:
+            logger.error(f"Error guardando resumen: {str(e)}")
+            raise
+
+    def close(self):
+        """Cierra la conexión con la base de datos"""
+        with self._lock:
+            try:
+                self._connection.close()
+                logger.info("Historial de conversaciones cerrado correctamente")
+            except Exception as e:
+                logger.error(f"Error cerrando historial de conversaciones: {str(e)}")
@@ -0,0 +1,142 @@
+"""
+Cliente HTTP asíncrono compartido para todo el tráfico hacia Ollama
+
+Un único pool de conexiones con keep-alive por backend, con límites de
+conexiones y timeouts, que comparten los clientes de generación y embeddings
+de LangChain, las sondas de salud, el warm-up y el sondeo de readiness. Cada
+transporte cuenta peticiones y conexiones abiertas para verificar que las
+conexiones se reutilizan.
+"""
+import logging
+from typing import Dict, Any, List, Optional
+import httpx
+from app.config import settings
+from app.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Evento de httpcore emitido al abrir una conexión TCP nueva
+CONNECT_EVENT = "connection.connect_tcp.complete"
+
+
+class _InstrumentedTransport(httpx.AsyncHTTPTransport):
+    """Transporte con pool propio que cuenta peticiones y conexiones nuevas"""
+
+    def __init__(self, backend: str, **kwargs: Any):
+        super().__init__(**kwargs)
+        self.backend = backend
+        self.requests = 0
+        self.connections_opened = 0
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        labels = {"backend": self.backend}
+        self.requests += 1
+        metrics.increment("ollama_http_requests_total", labels=labels)
+
+        previous_trace = request.extensions.get("trace")
+
+        async def trace(event_name: str, info: Dict[str, Any]):
+            if event_name == CONNECT_EVENT:
+                self.connections_opened += 1
+                metrics.increment("ollama_http_connections_opened_total", labels=labels)
+            if previous_trace is not None:
+                await previous_trace(event_name, info)
+
+        request.extensions["trace"] = trace
+        response = await super().handle_async_request(request)
+        metrics.set_gauge("ollama_http_pool_connections", self.open_connections(), labels=labels)
+        return response
+
+    def open_connections(self) -> int:
+        """Conexiones abiertas en el pool del transporte"""
+        return len(getattr(self._pool, "connections", []))
+
+
+class OllamaHttpClient:
+    """Cliente HTTP compartido con un pool de conexiones por backend de Ollama"""
+
+    def __init__(self, urls: Optional[List[str]] = None):
+        self.timeout = httpx.Timeout(
+            settings.ollama_http_read_timeout_seconds,
+            connect=settings.ollama_http_connect_timeout_seconds
+        )
+        self.limits = httpx.Limits(
+            max_connections=settings.ollama_http_max_connections_per_backend,
+            max_keepalive_connections=settings.ollama_http_max_keepalive_per_backend,
+            keepalive_expiry=settings.ollama_http_keepalive_expiry_seconds
+        )
+        self.transports: Dict[str, _InstrumentedTransport] = {}
+        for url in urls or []:
+            self.transport_for(url)
+        self._client: Optional[httpx.AsyncClient] = None
+
+    def transport_for(self, url: str) -> _InstrumentedTransport:
+        """
+        Obtiene (o crea) el transporte con el pool de conexiones de un backend
+
+        Args:
+            url: URL del backend
+
+        Returns:
+            Transporte del backend
+        """
+        url = url.rstrip("/")
+        transport = self.transports.get(url)
+        if transport is None:
+            transport = _InstrumentedTransport(backend=url, limits=self.limits)
+            self.transports[url] = transport
+            # El cliente genérico se reconstruye con el nuevo backend montado
+            self._client = None
+        return transport
+
+    def client_kwargs(self, url: str) -> Dict[str, Any]:
+        """
+        Argumentos para que un cliente de Ollama use el pool de un backend
+
+        Args:
+            url: URL del backend
+
+        Returns:
+            Diccionario para async_client_kwargs de OllamaLLM/OllamaEmbeddings
+        """
+        return {"transport": self.transport_for(url), "timeout": self.timeout}
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """Cliente httpx que enruta cada backend a su propio pool"""
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                mounts={url: transport for url, transport in self.transports.items()}
+            )
+        return self._client
+
+    async def aclose(self):
+        """Cierra todas las conexiones de los pools"""
+        for transport in self.transports.values():
+            await transport.aclose()
+
+    def get_stats(self) -> List[Dict[str, Any]]:
+        """
+        Obtiene el estado de reutilización de conexiones por backend
+
+        Returns:
+            Lista con peticiones, conexiones abiertas y tasa de reutilización
+        """
+        return [
+            {
+                "backend": url,
+                "requests": transport.requests,
+                "connections_opened": transport.connections_opened,
+                "open_connections": transport.open_connections(),
+                "reuse_ratio": (
+                    round(1 - transport.connections_opened / transport.requests, 3)
+                    if transport.requests else None
+                )
+            }
+            for url, transport in self.transports.items()
+        ]
+
+
+# Instancia global compartida por todos los servicios
+ollama_http_client = OllamaHttpClient()
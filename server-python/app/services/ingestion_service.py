@@ -0,0 +1,400 @@
+"""
+Ingesta masiva de documentos en etapas encadenadas
+
+Los documentos llegan como NDJSON (un objeto JSON por línea) y atraviesan
+tres etapas unidas por colas acotadas, de modo que división, embeddings y
+escritura avanzan a la vez sin acumular el corpus en memoria:
+
+    división (pool de procesos) -> embeddings por lotes -> escritura en ChromaDB
+
+Un registro en SQLite guarda, por clave de documento, qué documentos se
+completaron y con qué contenido. Al repetir un trabajo interrumpido, los
+documentos ya completados y sin cambios se saltan. En el resto, los chunks
+tienen IDs derivados de su contenido: solo se vectorizan los que no están
+almacenados, y al completar el documento se eliminan los que ya no forman
+parte de él.
+"""
+import asyncio
+import contextlib
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from langchain_core.documents import Document
+from app.config import settings
+from app.metrics import metrics
+from app.services.embedding_service import EmbeddingService
+from app.services.vector_db_service import VectorDatabaseService
+
+logger = logging.getLogger(__name__)
+
+STATUS_STARTED = "started"
+STATUS_DONE = "done"
+
+# Marca de fin de cada cola del pipeline
+_END = object()
+
+
+class IngestionLedger:
+    """Registro persistente del estado de ingesta por clave de documento"""
+
+    def __init__(self, db_path: Optional[str] = None):
+        self.db_path = db_path or settings.ingestion_ledger_path
+        self._lock = threading.Lock()
+        self._connection = self._connect()
+
+    def _connect(self) -> sqlite3.Connection:
+        """Abre la base de datos SQLite y crea el esquema si no existe"""
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        connection = sqlite3.connect(self.db_path, check_same_thread=False)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS ingested_documents (
+                document_key TEXT PRIMARY KEY,
+                content_hash TEXT NOT NULL,
+                status TEXT NOT NULL,
+                chunks INTEGER NOT NULL,
+                updated_at REAL NOT NULL
+            )
+            """
+        )
+        connection.commit()
+        return connection
+
+    def _get_sync(self, key: str) -> Optional[Tuple[str, str]]:
+        """Lee el estado y el hash de contenido de un documento"""
+        with self._lock:
+            return self._connection.execute(
+                "SELECT status, content_hash FROM ingested_documents WHERE document_key = ?",
+                (key,)
+            ).fetchone()
+
+    def _set_sync(self, key: str, content_hash: str, status: str, chunks: int):
+        """Guarda el estado de un documento"""
+        with self._lock:
+            self._connection.execute(
+                """
+                INSERT INTO ingested_documents (document_key, content_hash, status, chunks, updated_at)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(document_key) DO UPDATE SET
+                    content_hash = excluded.content_hash,
+                    status = excluded.status,
+                    chunks = excluded.chunks,
+                    updated_at = excluded.updated_at
+                """,
+                (key, content_hash, status, chunks, time.time())
+            )
+            self._connection.commit()
+
+    async def get(self, key: str) -> Optional[Tuple[str, str]]:
+        """
+        Obtiene el estado de ingesta de un documento
+
+        Args:
+            key: Clave del documento
+
+        Returns:
+            Tupla (estado, hash de contenido) o None si nunca se ingirió
+        """
+        return await asyncio.to_thread(self._get_sync, key)
+
+    async def set(self, key: str, content_hash: str, status: str, chunks: int = 0):
+        """
+        Guarda el estado de ingesta de un documento
+
+        Args:
+            key: Clave del documento
+            content_hash: Hash del contenido ingerido
+            status: STATUS_STARTED o STATUS_DONE
+            chunks: Número de chunks almacenados
+        """
+        await asyncio.to_thread(self._set_sync, key, content_hash, status, chunks)
+
+    def close(self):
+        """Cierra la conexión con la base de datos"""
+        with self._lock:
+            try:
+                self._connection.close()
+            except Exception as e:
+                logger.error(f"Error cerrando el registro de ingesta: {str(e)}")
+
+
+class _DocumentJob:
+    """Estado de un documento dentro del pipeline"""
+
+    def __init__(self, key: str, content: str, metadata: Dict[str, Any], content_hash: str):
+        self.key = key
+        self.content = content
+        self.metadata = metadata
+        self.content_hash = content_hash
+        self.chunk_ids: List[str] = []
+        self.pending_chunks = 0
+        self.stored_chunks = 0
+        self.error: Optional[str] = None
+
+
+def _content_hash(content: str, metadata: Dict[str, Any]) -> str:
+    """Hash del contenido y los metadatos de un documento"""
+    digest = hashlib.sha256(content.encode("utf-8"))
+    digest.update(json.dumps(metadata, sort_keys=True, default=str).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class BulkIngestionService:
+    """Pipeline de ingesta masiva: división -> embeddings -> escritura"""
+
+    def __init__(
+        self,
+        embedding_service: EmbeddingService,
+        vector_db_service: VectorDatabaseService,
+        ledger: Optional[IngestionLedger] = None
+    ):
+        self.embedding_service = embedding_service
+        self.vector_db_service = vector_db_service
+        self.ledger = ledger or IngestionLedger()
+
+    def _parse_line(self, line: str, number: int) -> Tuple[Optional[_DocumentJob], Optional[Dict[str, Any]]]:
+        """
+        Convierte una línea NDJSON en un trabajo, o en un resultado de error
+
+        Returns:
+            Tupla (trabajo, error); solo uno de los dos no es None
+        """
+        try:
+            item = json.loads(line)
+            content = item["content"]
+            if not isinstance(content, str):
+                raise ValueError("'content' debe ser texto")
+            metadata = dict(item.get("metadata") or {})
+            if item.get("conversation_id"):
+                metadata["conversation_id"] = item["conversation_id"]
+        except Exception as e:
+            return None, {"line": number, "status": "error", "error": f"Línea inválida: {str(e)}"}
+
+        content_hash = _content_hash(content, metadata)
+        key = str(item.get("key") or content_hash)
+        return _DocumentJob(key, content, metadata, content_hash), None
+
+    async def ingest(self, lines: AsyncIterator[str]) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Ingiere documentos NDJSON y entrega un resultado por documento
+
+        Cada línea es un objeto con "content" y, opcionalmente, "key",
+        "metadata" y "conversation_id". Sin "key", la clave es el hash del
+        contenido.
+
+        Args:
+            lines: Líneas NDJSON del cuerpo de la petición
+
+        Yields:
+            Resultado de cada documento ("ok", "skipped" o "error") y un
+            resumen final
+        """
+        queue_size = settings.bulk_queue_size
+        documents: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        chunked: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        batches: asyncio.Queue = asyncio.Queue(maxsize=settings.bulk_embed_concurrency * 2)
+        embedded: asyncio.Queue = asyncio.Queue(maxsize=settings.bulk_embed_concurrency * 2)
+        results: asyncio.Queue = asyncio.Queue()
+        totals = {"documents": 0, "ok": 0, "skipped": 0, "errors": 0, "embedded": 0}
+        started_at = time.monotonic()
+
+        async def emit(result: Dict[str, Any]):
+            status = result["status"]
+            totals["ok" if status == "ok" else "skipped" if status == "skipped" else "errors"] += 1
+            metrics.increment("bulk_ingest_documents_total", labels={"status": status})
+            await results.put(result)
+
+        async def fail(job: _DocumentJob, error: str):
+            if job.error is None:
+                job.error = error
+                await emit({"key": job.key, "status": "error", "error": error})
+
+        async def read():
+            number = 0
+            async for line in lines:
+                number += 1
+                if not line.strip():
+                    continue
+                job, error = self._parse_line(line, number)
+                totals["documents"] += 1
+                if error is not None:
+                    await emit(error)
+                else:
+                    await documents.put(job)
+
+        async def finish(job: _DocumentJob):
+            # Documento completo: quitar los chunks que ya no forman parte de él
+            try:
+                deleted = await self.vector_db_service.delete_stale_chunks(
+                    job.key, job.chunk_ids, job.metadata.get("conversation_id")
+                )
+                await self.ledger.set(job.key, job.content_hash, STATUS_DONE, len(job.chunk_ids))
+            except Exception as e:
+                await fail(job, str(e))
+                return
+            totals["embedded"] += job.stored_chunks
+            await emit({
+                "key": job.key,
+                "status": "ok",
+                "chunks": len(job.chunk_ids),
+                "embedded": job.stored_chunks,
+                "deleted": deleted
+            })
+
+        async def split():
+            while True:
+                job = await documents.get()
+                if job is _END:
+                    return
+                try:
+                    state = await self.ledger.get(job.key)
+                    if state == (STATUS_DONE, job.content_hash):
+                        await emit({"key": job.key, "status": "skipped"})
+                        continue
+                    await self.ledger.set(job.key, job.content_hash, STATUS_STARTED)
+                    texts = (await self.embedding_service.split_texts_bulk([job.content]))[0]
+                    chunks = [
+                        self.embedding_service.create_document_from_text(
+                            content=text,
+                            metadata={**job.metadata, "document_key": job.key}
+                        )
+                        for text in texts
+                    ]
+                    chunk_ids = self.vector_db_service.chunk_ids(chunks)
+                    existing = await self.vector_db_service.get_existing_ids(chunk_ids)
+                except Exception as e:
+                    await fail(job, str(e))
+                    continue
+                # Solo se vectorizan los chunks que no están almacenados
+                new_chunks = []
+                seen_ids = set()
+                for chunk, chunk_id in zip(chunks, chunk_ids):
+                    if chunk_id in seen_ids:
+                        continue
+                    seen_ids.add(chunk_id)
+                    job.chunk_ids.append(chunk_id)
+                    if chunk_id not in existing:
+                        new_chunks.append(chunk)
+                job.pending_chunks = len(new_chunks)
+                if not new_chunks:
+                    await finish(job)
+                    continue
+                await chunked.put((job, new_chunks))
+
+        async def batch():
+            # Agrupa chunks de varios documentos en lotes de embeddings
+            current: List[Tuple[_DocumentJob, Document]] = []
+            while True:
+                item = await chunked.get()
+                if item is _END:
+                    break
+                job, chunks = item
+                for chunk in chunks:
+                    current.append((job, chunk))
+                    if len(current) >= settings.bulk_embed_batch_size:
+                        await batches.put(current)
+                        current = []
+                # Sin más trabajo esperando: no retener un lote incompleto
+                if current and chunked.empty():
+                    await batches.put(current)
+                    current = []
+            if current:
+                await batches.put(current)
+
+        async def embed():
+            while True:
+                items = await batches.get()
+                if items is _END:
+                    return
+                try:
+                    embeddings = await self.embedding_service.generate_embeddings(
+                        [chunk.page_content for _, chunk in items]
+                    )
+                except Exception as e:
+                    for job, _ in items:
+                        await fail(job, f"Error generando embeddings: {str(e)}")
+                    continue
+                await embedded.put((items, embeddings))
+
+        async def store():
+            while True:
+                item = await embedded.get()
+                if item is _END:
+                    return
+                items, embeddings = item
+                live = [i for i, (job, _) in enumerate(items) if job.error is None]
+                if live:
+                    try:
+                        await self.vector_db_service.add_documents(
+                            documents=[items[i][1] for i in live],
+                            embeddings=embeddings[live]
+                        )
+                    except Exception as e:
+                        for i in live:
+                            await fail(items[i][0], f"Error almacenando chunks: {str(e)}")
+                        live = []
+                for i in live:
+                    job = items[i][0]
+                    job.stored_chunks += 1
+                    if job.stored_chunks == job.pending_chunks and job.error is None:
+                        await finish(job)
+
+        async def run_stage(workers: List[asyncio.Task], downstream: asyncio.Queue, count: int):
+            # Cuando terminan los trabajadores de una etapa, cerrar la siguiente
+            await asyncio.gather(*workers)
+            for _ in range(count):
+                await downstream.put(_END)
+
+        async def pipeline():
+            # TaskGroup: si una etapa falla se cancelan las demás, que de otro
+            # modo quedarían bloqueadas para siempre en sus colas
+            try:
+                async with asyncio.TaskGroup() as group:
+                    reader = group.create_task(read())
+                    splitters = [group.create_task(split()) for _ in range(settings.bulk_split_concurrency)]
+                    batcher = group.create_task(batch())
+                    embedders = [group.create_task(embed()) for _ in range(settings.bulk_embed_concurrency)]
+                    group.create_task(run_stage([reader], documents, len(splitters)))
+                    group.create_task(run_stage(splitters, chunked, 1))
+                    group.create_task(run_stage([batcher], batches, len(embedders)))
+                    group.create_task(run_stage(embedders, embedded, 1))
+                    group.create_task(store())
+            except Exception as e:
+                error = e.exceptions[0] if isinstance(e, ExceptionGroup) else e
+                logger.error(f"Error en la ingesta masiva: {str(error)}")
+                await results.put({"status": "error", "error": str(error)})
+            finally:
+                await results.put(_END)
+
+        task = asyncio.create_task(pipeline())
+        try:
+            while True:
+                result = await results.get()
+                if result is _END:
+                    break
+                yield result
+            elapsed = time.monotonic() - started_at
+            logger.info(
+                f"Ingesta masiva: {totals['ok']} documentos, {totals['skipped']} sin cambios, "
+                f"{totals['errors']} errores en {elapsed:.1f}s"
+            )
+            yield {"status": "done", **totals, "seconds": round(elapsed, 3)}
+        finally:
+            # Fin normal o cliente desconectado: cancelar y esperar a todas las etapas
+            task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await task
+
+    def close(self):
+        """Cierra el registro de ingesta"""
+        self.ledger.close()
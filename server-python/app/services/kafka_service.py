@@ -102,7 +102,8 @@ class KafkaService:
         conversation_id: str,
         chunk: str,
         chunk_index: int,
-        is_final: bool = False
+        is_final: bool = False,
+        cancelled: bool = False
     ) -> bool:
         """
         Envía un chunk de respuesta streaming a Kafka
@@ -112,6 +113,7 @@ class KafkaService:
             chunk: Contenido del chunk
             chunk_index: Índice del chunk
             is_final: Si es el último chunk
+            cancelled: Si la generación se canceló porque el cliente se desconectó
             
         Returns:
             True si el mensaje se envió correctamente, False en caso contrario
@@ -126,6 +128,7 @@ class KafkaService:
                 "chunk": chunk,
                 "chunk_index": chunk_index,
                 "is_final": is_final,
+                "cancelled": cancelled,
                 "timestamp": self._get_current_timestamp(),
                 "message_type": "streaming_chunk"
             }
@@ -1,12 +1,28 @@
 """
 Servicio de modelo de lenguaje usando LangChain y Ollama
 """
+import asyncio
 import logging
+import time
 from typing import List, Optional, Dict, Any
 from langchain_ollama import OllamaLLM
 from langchain_core.prompts import PromptTemplate
+from langchain_core.callbacks import AsyncCallbackHandler
 from langchain_core.output_parsers import StrOutputParser
+from langchain_core.outputs import LLMResult
+from langchain_core.runnables import RunnableConfig
 from app.config import settings
+from app.metrics import metrics
+from app.services.context_window import ContextWindowSizer, estimate_tokens
+from app.services.continuation_cache import ContinuationCache
+from app.services.http_client import OllamaHttpClient
+from app.services.model_router import ModelRouter
+from app.services.ollama_pool import OllamaBackendPool
+from app.services.scheduler_service import (
+    GenerationScheduler,
+    PRIORITY_BATCH,
+    PRIORITY_STANDARD
+)
 
 logger = logging.getLogger(__name__)
 
@@ -14,19 +30,131 @@ logger = logging.getLogger(__name__)
 DEFAULT_TEMPERATURE = 0.4
 QUESTION_PREVIEW_LENGTH = 50
 TEST_QUESTION = "¿Estás funcionando?"
+HEALTH_CHECK_MAX_TOKENS = 16
+STREAM_STATS_SMOOTHING = 0.1
+INITIAL_STREAM_CHUNKS = 200
+INITIAL_STREAM_SECONDS = 30.0
+# Clave de config["configurable"] con los argumentos de Ollama de cada invocación
+OLLAMA_KWARGS_KEY = "ollama_kwargs"
+# Modo de continuación que reenvía el array context de Ollama
+CONTINUATION_MODE_CONTEXT = "context"
+
+
+class RequestScopedOllamaLLM(OllamaLLM):
+    """
+    OllamaLLM que toma opciones de generación por invocación desde
+    config["configurable"], de modo que una cadena compilada una sola vez
+    puede compartirse entre peticiones concurrentes sin mutar el modelo
+    """
+    
+    @staticmethod
+    def _invocation_kwargs(config: Optional[RunnableConfig], kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        """Combina los argumentos de la invocación con los de config["configurable"]"""
+        request_kwargs = ((config or {}).get("configurable") or {}).get(OLLAMA_KWARGS_KEY)
+        if not request_kwargs:
+            return kwargs
+        return {**request_kwargs, **kwargs}
+    
+    def invoke(self, input, config=None, *, stop=None, **kwargs):
+        return super().invoke(input, config, stop=stop, **self._invocation_kwargs(config, kwargs))
+    
+    async def ainvoke(self, input, config=None, *, stop=None, **kwargs):
+        return await super().ainvoke(input, config, stop=stop, **self._invocation_kwargs(config, kwargs))
+    
+    def stream(self, input, config=None, *, stop=None, **kwargs):
+        yield from super().stream(input, config, stop=stop, **self._invocation_kwargs(config, kwargs))
+    
+    async def astream(self, input, config=None, *, stop=None, **kwargs):
+        stream = super().astream(input, config, stop=stop, **self._invocation_kwargs(config, kwargs))
+        try:
+            async for chunk in stream:
+                yield chunk
+        finally:
+            await stream.aclose()
+
+
+class _UsageCallbackHandler(AsyncCallbackHandler):
+    """Captura las estadísticas que Ollama devuelve al terminar una generación"""
+    
+    def __init__(self):
+        self.generation_info: Dict[str, Any] = {}
+    
+    async def on_llm_end(self, response: LLMResult, **kwargs: Any) -> None:
+        if response.generations and response.generations[0]:
+            self.generation_info = response.generations[0][0].generation_info or {}
+    
+    def build_usage(
+        self,
+        chunks: int,
+        max_tokens: Optional[int],
+        elapsed: float,
+        finish_reason: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Construye el resumen de uso de una generación
+        
+        Args:
+            chunks: Chunks recibidos (aproximación de tokens si Ollama no informa)
+            max_tokens: Límite de tokens aplicado
+            elapsed: Segundos de generación
+            finish_reason: Motivo de fin forzado (p. ej. "deadline")
+            
+        Returns:
+            Diccionario con tokens de prompt, de respuesta y motivo de finalización
+        """
+        info = self.generation_info
+        prompt_tokens = info.get("prompt_eval_count")
+        completion_tokens = info.get("eval_count", chunks)
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": (prompt_tokens or 0) + completion_tokens,
+            "max_tokens": max_tokens,
+            "finish_reason": finish_reason or info.get("done_reason", "stop"),
+            "generation_seconds": round(elapsed, 3)
+        }
 
 
 class LLMService:
     """Servicio para interactuar con el modelo de lenguaje"""
     
-    def __init__(self):
-        self.llm = OllamaLLM(
-            model=settings.llm_model,
-            base_url=settings.ollama_base_url,
-            temperature=DEFAULT_TEMPERATURE
+    def __init__(self, http_client: Optional[OllamaHttpClient] = None):
+        self.pool = OllamaBackendPool.from_settings(
+            "generation",
+            settings.ollama_generation_backends,
+            http_client
         )
+        # Un cliente de Ollama por backend del pool, sobre el pool de conexiones compartido
+        self.llms = {
+            url: RequestScopedOllamaLLM(
+                model=settings.llm_model,
+                base_url=url,
+                temperature=DEFAULT_TEMPERATURE,
+                keep_alive=settings.ollama_keep_alive,
+                async_client_kwargs=self.pool.http_client.client_kwargs(url)
+            )
+            for url in self.pool.urls
+        }
         self.output_parser = StrOutputParser()
+        # Selección del modelo por niveles; los clientes solo fijan el modelo por defecto
+        self.router = ModelRouter()
+        # El límite de concurrencia es por backend: escala con los backends
+        # disponibles en cada momento (no cuenta los caídos ni los expulsados)
+        self.scheduler = GenerationScheduler(
+            backend=self.pool.name,
+            max_concurrency=settings.llm_max_concurrency_per_backend,
+            backend_count=self.pool.available_count
+        )
+        # Al recuperarse un backend, usar su capacidad sin esperar a que termine otra generación
+        self.pool.on_backend_available(self.scheduler.wake)
+        # Estado de continuación (contexto KV de Ollama) por conversación
+        self.continuations = ContinuationCache()
+        # num_ctx por petición, en escalones para evitar recargas del modelo
+        self.context_window = ContextWindowSizer()
+        self._stream_chunks_avg = float(INITIAL_STREAM_CHUNKS)
+        self._stream_seconds_avg = INITIAL_STREAM_SECONDS
         self._setup_prompts()
+        self._setup_chains()
     
     def _setup_prompts(self):
         """Configura los templates de prompts"""
@@ -42,43 +170,278 @@ class LLMService:
             "Pregunta: {question}\n\n"
             "Respuesta:"
         )
+        
+        # Turnos de continuación: solo el mensaje nuevo, sobre el contexto KV previo
+        self.continuation_prompt = PromptTemplate.from_template(
+            "Usuario: {question}\n\n"
+            "Asistente:"
+        )
+        
+        self.continuation_context_prompt = PromptTemplate.from_template(
+            "Contexto adicional:\n{context}\n\n"
+            "Usuario: {question}\n\n"
+            "Asistente:"
+        )
+        
+        self.summary_prompt = PromptTemplate.from_template(
+            "Resume la siguiente conversación entre un usuario y un asistente. "
+            "Integra el resumen previo con los nuevos turnos, conserva nombres, datos y "
+            "decisiones relevantes y no superes las 150 palabras.\n\n"
+            "Resumen previo:\n{summary}\n\n"
+            "Nuevos turnos:\n{turns}\n\n"
+            "Resumen actualizado:"
+        )
+    
+    def _setup_chains(self):
+        """Compila una sola vez las cadenas de procesamiento de cada backend"""
+        self.prompts = {
+            "chat": self.chat_prompt,
+            "context": self.context_prompt,
+            "continuation": self.continuation_prompt,
+            "continuation_context": self.continuation_context_prompt,
+            "summary": self.summary_prompt
+        }
+        self.chains = {
+            url: {
+                name: prompt | llm | self.output_parser
+                for name, prompt in self.prompts.items()
+            }
+            for url, llm in self.llms.items()
+        }
     
-    def _prepare_chain(self, question: str, context: Optional[str] = None, temperature: Optional[float] = None):
+    def _resolve_max_tokens(self, max_tokens: Optional[int]) -> int:
+        """
+        Calcula el límite de tokens a generar (num_predict)
+        
+        Args:
+            max_tokens: Máximo solicitado por el cliente (opcional)
+            
+        Returns:
+            Límite efectivo, acotado por la configuración
+        """
+        if not max_tokens:
+            return settings.llm_default_max_tokens
+        return min(max_tokens, settings.llm_max_tokens_limit)
+    
+    def _invocation_config(
+        self,
+        temperature: Optional[float] = None,
+        max_tokens: Optional[int] = None,
+        stop: Optional[List[str]] = None,
+        ollama_context: Optional[List[int]] = None,
+        model: Optional[str] = None
+    ) -> RunnableConfig:
+        """
+        Construye la configuración inmutable de una invocación
+        
+        Args:
+            temperature: Temperatura del modelo (opcional)
+            max_tokens: Máximo de tokens a generar (opcional)
+            stop: Secuencias de parada (por defecto las de la plantilla)
+            ollama_context: Array context de un turno anterior (continuación)
+            model: Modelo de Ollama (por defecto settings.llm_model)
+            
+        Returns:
+            Config con las opciones de Ollama de esta invocación
+        """
+        stop_sequences = settings.llm_stop_sequences if stop is None else stop
+        options = {
+            "temperature": temperature if temperature is not None else DEFAULT_TEMPERATURE,
+            "num_predict": self._resolve_max_tokens(max_tokens),
+            "stop": list(stop_sequences) or None
+        }
+        ollama_kwargs: Dict[str, Any] = {"options": options, "model": model or settings.llm_model}
+        if ollama_context:
+            ollama_kwargs["context"] = ollama_context
+        return {"configurable": {OLLAMA_KWARGS_KEY: ollama_kwargs}}
+    
+    def _with_num_ctx(
+        self,
+        config: RunnableConfig,
+        chain_name: str,
+        input_vars: Dict[str, Any],
+        backend_url: str
+    ) -> RunnableConfig:
+        """
+        Añade a la configuración el num_ctx adecuado para el prompt ensamblado
+        
+        Args:
+            config: Configuración de la invocación
+            chain_name: Cadena que se va a ejecutar
+            input_vars: Variables de entrada del prompt
+            backend_url: Backend que atenderá la petición
+            
+        Returns:
+            Nueva configuración con options.num_ctx
+        """
+        ollama_kwargs = config["configurable"][OLLAMA_KWARGS_KEY]
+        prompt_tokens = estimate_tokens(self.prompts[chain_name].format(**input_vars))
+        # En continuación el contexto previo también ocupa la ventana
+        prompt_tokens += len(ollama_kwargs.get("context") or [])
+        num_ctx = self.context_window.select(
+            backend_url,
+            ollama_kwargs["model"],
+            prompt_tokens + ollama_kwargs["options"]["num_predict"]
+        )
+        options = {**ollama_kwargs["options"], "num_ctx": num_ctx}
+        return {
+            **config,
+            "configurable": {
+                **config["configurable"],
+                OLLAMA_KWARGS_KEY: {**ollama_kwargs, "options": options}
+            }
+        }
+    
+    def _prepare_chain(
+        self,
+        question: str,
+        context: Optional[str] = None,
+        temperature: Optional[float] = None,
+        max_tokens: Optional[int] = None,
+        continuation: Optional[Dict[str, Any]] = None,
+        model: Optional[str] = None
+    ):
         """
-        Prepara la cadena de procesamiento y variables de entrada
+        Selecciona la cadena precompilada y prepara las variables de entrada
         
         Args:
             question: Pregunta del usuario
             context: Contexto opcional para la respuesta
             temperature: Temperatura del modelo (opcional)
+            max_tokens: Máximo de tokens a generar (opcional)
+            continuation: Estado de continuación de la conversación (opcional)
+            model: Modelo forzado por el cliente (opcional)
             
         Returns:
-            Tupla con (chain, input_vars, log_message)
+            Tupla con (chain_name, input_vars, config, log_message)
         """
-        # Configurar temperatura si se especifica
-        if temperature is not None:
-            self.llm.temperature = temperature
+        if continuation:
+            # Prefijo estable: solo se envía el turno nuevo tras el contexto previo,
+            # en el mismo modelo que generó ese contexto
+            chain_name = "continuation_context" if context else "continuation"
+            input_vars = {"question": question, "context": context} if context else {"question": question}
+            config = self._invocation_config(
+                temperature,
+                max_tokens,
+                ollama_context=continuation["context"],
+                model=continuation["model"]
+            )
+            log_message = (
+                f"con {continuation['model']} como continuación "
+                f"({len(continuation['context'])} tokens previos) "
+                f"para: {question[:QUESTION_PREVIEW_LENGTH]}..."
+            )
+            return chain_name, input_vars, config, log_message
         
-        # Seleccionar prompt según si hay contexto
+        model = self.router.select(
+            question,
+            has_context=bool(context),
+            max_tokens=max_tokens,
+            model=model
+        )
+        
+        # Seleccionar cadena según si hay contexto
         if context:
-            prompt = self.context_prompt
+            chain_name = "context"
             input_vars = {"question": question, "context": context}
-            log_message = f"con contexto para: {question[:QUESTION_PREVIEW_LENGTH]}..."
+            log_message = f"con {model} y contexto para: {question[:QUESTION_PREVIEW_LENGTH]}..."
         else:
-            prompt = self.chat_prompt
+            chain_name = "chat"
             input_vars = {"question": question}
-            log_message = f"sin contexto para: {question[:QUESTION_PREVIEW_LENGTH]}..."
+            log_message = f"con {model} sin contexto para: {question[:QUESTION_PREVIEW_LENGTH]}..."
         
-        # Crear cadena de procesamiento
-        chain = prompt | self.llm | self.output_parser
+        config = self._invocation_config(temperature, max_tokens, model=model)
+        return chain_name, input_vars, config, log_message
+    
+    async def _generate_stream(
+        self,
+        chain,
+        input_vars: Dict[str, Any],
+        config: RunnableConfig,
+        usage: Optional[Dict[str, Any]] = None,
+        generation_info: Optional[Dict[str, Any]] = None
+    ):
+        """
+        Ejecuta una cadena en streaming con límite de tiempo de pared
         
-        return chain, input_vars, log_message
+        Al agotarse el plazo el stream se cierra limpiamente (se cierra también
+        la conexión con Ollama) y se devuelve lo generado hasta ese momento.
+        
+        Args:
+            chain: Cadena precompilada
+            input_vars: Variables de entrada del prompt
+            config: Configuración de la invocación
+            usage: Diccionario opcional que se completa con el uso de tokens
+            generation_info: Diccionario opcional que se completa con la
+                información final de Ollama (solo si la generación terminó)
+            
+        Yields:
+            Chunks de la respuesta generada
+        """
+        usage_handler = _UsageCallbackHandler()
+        config = {**config, "callbacks": [usage_handler]}
+        started_at = time.monotonic()
+        deadline = asyncio.get_running_loop().time() + settings.llm_generation_timeout_seconds
+        first_chunk_at = None
+        chunks = 0
+        finish_reason = None
+        
+        stream = chain.astream(input_vars, config=config)
+        try:
+            # Un único plazo para todo el stream. Se suspende mientras el chunk
+            # está entregado al consumidor: la cancelación solo debe llegar
+            # mientras se espera a Ollama, no en el código de quien consume
+            async with asyncio.timeout_at(deadline) as timeout:
+                async for chunk in stream:
+                    if first_chunk_at is None:
+                        first_chunk_at = time.monotonic()
+                    chunks += 1
+                    timeout.reschedule(None)
+                    yield chunk
+                    timeout.reschedule(deadline)
+        except TimeoutError:
+            finish_reason = "deadline"
+        finally:
+            # Cerrar el stream propaga el cierre hasta la conexión HTTP con Ollama
+            await stream.aclose()
+        
+        if finish_reason == "deadline":
+            metrics.increment("llm_generation_deadline_total")
+            logger.warning(
+                f"Generación detenida tras {settings.llm_generation_timeout_seconds}s "
+                f"({chunks} chunks generados)"
+            )
+        
+        if generation_info is not None and finish_reason is None:
+            generation_info.update(usage_handler.generation_info)
+        
+        ollama_kwargs = config["configurable"][OLLAMA_KWARGS_KEY]
+        generation_usage = usage_handler.build_usage(
+            chunks=chunks,
+            max_tokens=ollama_kwargs["options"].get("num_predict"),
+            elapsed=time.monotonic() - started_at,
+            finish_reason=finish_reason
+        )
+        generation_usage["model"] = ollama_kwargs["model"]
+        self._record_model_usage(
+            generation_usage,
+            first_chunk_at - started_at if first_chunk_at is not None else None
+        )
+        if usage is not None:
+            usage.update(generation_usage)
     
     async def generate_response(
         self, 
         question: str, 
         context: Optional[str] = None,
-        temperature: Optional[float] = None
+        temperature: Optional[float] = None,
+        max_tokens: Optional[int] = None,
+        priority: int = PRIORITY_STANDARD,
+        fairness_key: str = "default",
+        usage: Optional[Dict[str, Any]] = None,
+        conversation_id: Optional[str] = None,
+        continuation: Optional[Dict[str, Any]] = None,
+        model: Optional[str] = None
     ) -> str:
         """
         Genera una respuesta usando el modelo de lenguaje
@@ -87,16 +450,37 @@ class LLMService:
             question: Pregunta del usuario
             context: Contexto opcional para la respuesta
             temperature: Temperatura del modelo (opcional)
+            max_tokens: Máximo de tokens a generar (opcional)
+            priority: Prioridad de la petición en el planificador
+            fairness_key: Clave de reparto equitativo (conversación o cliente)
+            usage: Diccionario opcional que se completa con el uso de tokens
+            conversation_id: Conversación cuyo estado de continuación se guarda (opcional)
+            continuation: Estado de continuación obtenido con get_continuation (opcional)
+            model: Modelo forzado por el cliente (por defecto, elección por niveles)
             
         Returns:
             Respuesta generada por el modelo
         """
         try:
-            chain, input_vars, log_message = self._prepare_chain(question, context, temperature)
-            logger.info(f"Generando respuesta {log_message}")
-            
-            # Generar respuesta
-            response = await chain.ainvoke(input_vars)
+            async with self.scheduler.slot(priority, fairness_key):
+                chain_name, input_vars, config, log_message = self._prepare_chain(
+                    question, context, temperature, max_tokens, continuation, model
+                )
+                
+                async with self.pool.lease(prefer=self._preferred_backend(continuation)) as backend:
+                    logger.info(f"Generando respuesta {log_message} en {backend.url}")
+                    
+                    # Generar respuesta
+                    chain = self.chains[backend.url][chain_name]
+                    config = self._with_num_ctx(config, chain_name, input_vars, backend.url)
+                    generation_info: Dict[str, Any] = {}
+                    chunks = [
+                        chunk async for chunk in self._generate_stream(
+                            chain, input_vars, config, usage, generation_info
+                        )
+                    ]
+                    response = "".join(chunks)
+                    self._save_continuation(conversation_id, backend.url, config, generation_info)
             
             logger.info("Respuesta generada exitosamente")
             return response.strip()
@@ -109,7 +493,14 @@ class LLMService:
         self, 
         question: str, 
         context: Optional[str] = None,
-        temperature: Optional[float] = None
+        temperature: Optional[float] = None,
+        max_tokens: Optional[int] = None,
+        priority: int = PRIORITY_STANDARD,
+        fairness_key: str = "default",
+        usage: Optional[Dict[str, Any]] = None,
+        conversation_id: Optional[str] = None,
+        continuation: Optional[Dict[str, Any]] = None,
+        model: Optional[str] = None
     ):
         """
         Genera una respuesta streaming usando el modelo de lenguaje
@@ -118,17 +509,51 @@ class LLMService:
             question: Pregunta del usuario
             context: Contexto opcional para la respuesta
             temperature: Temperatura del modelo (opcional)
+            max_tokens: Máximo de tokens a generar (opcional)
+            priority: Prioridad de la petición en el planificador
+            fairness_key: Clave de reparto equitativo (conversación o cliente)
+            usage: Diccionario opcional que se completa al terminar el stream
+            conversation_id: Conversación cuyo estado de continuación se guarda (opcional)
+            continuation: Estado de continuación obtenido con get_continuation (opcional)
+            model: Modelo forzado por el cliente (por defecto, elección por niveles)
             
         Yields:
             Chunks de la respuesta generada
         """
         try:
-            chain, input_vars, log_message = self._prepare_chain(question, context, temperature)
-            logger.info(f"Generando respuesta streaming {log_message}")
-            
-            # Generar respuesta streaming
-            async for chunk in chain.astream(input_vars):
-                yield chunk
+            async with self.scheduler.slot(priority, fairness_key):
+                chain_name, input_vars, config, log_message = self._prepare_chain(
+                    question, context, temperature, max_tokens, continuation, model
+                )
+                
+                async with self.pool.lease(prefer=self._preferred_backend(continuation)) as backend:
+                    logger.info(f"Generando respuesta streaming {log_message} en {backend.url}")
+                    
+                    # Generar respuesta streaming
+                    chain = self.chains[backend.url][chain_name]
+                    config = self._with_num_ctx(config, chain_name, input_vars, backend.url)
+                    started_at = time.monotonic()
+                    chunks_emitted = 0
+                    generation_info: Dict[str, Any] = {}
+                    stream = self._generate_stream(
+                        chain, input_vars, config, usage, generation_info
+                    )
+                    try:
+                        async for chunk in stream:
+                            chunks_emitted += 1
+                            yield chunk
+                    except (GeneratorExit, asyncio.CancelledError):
+                        self._record_stream_cancelled(
+                            chunks_emitted,
+                            time.monotonic() - started_at,
+                            self._resolve_max_tokens(max_tokens)
+                        )
+                        raise
+                    finally:
+                        await stream.aclose()
+                    
+                    self._record_stream_completed(chunks_emitted, time.monotonic() - started_at)
+                    self._save_continuation(conversation_id, backend.url, config, generation_info)
             
             logger.info("Respuesta streaming generada exitosamente")
             
@@ -136,6 +561,144 @@ class LLMService:
             logger.error(f"Error generando respuesta streaming: {str(e)}")
             raise
     
+    def get_continuation(
+        self,
+        conversation_id: Optional[str],
+        model: Optional[str] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Obtiene el estado de continuación de una conversación
+        
+        Args:
+            conversation_id: ID de la conversación
+            model: Modelo forzado por el cliente; el contexto solo vale para el
+                modelo que lo generó
+            
+        Returns:
+            Estado con el array context, el backend y el modelo, o None si el modo
+            está desactivado o la conversación no tiene estado (primer turno o expulsada)
+        """
+        if settings.llm_continuation_mode != CONTINUATION_MODE_CONTEXT or not conversation_id:
+            return None
+        continuation = self.continuations.get(conversation_id)
+        if continuation and model and continuation["model"] != model:
+            return None
+        return continuation
+    
+    @staticmethod
+    def _preferred_backend(continuation: Optional[Dict[str, Any]]) -> Optional[str]:
+        """Backend que conserva la caché KV de la conversación, si lo hay"""
+        return continuation["backend"] if continuation else None
+    
+    def _save_continuation(
+        self,
+        conversation_id: Optional[str],
+        backend_url: str,
+        config: RunnableConfig,
+        generation_info: Dict[str, Any]
+    ):
+        """
+        Guarda el array context devuelto por Ollama para el siguiente turno
+        
+        Si la generación no terminó (plazo agotado) no hay contexto coherente
+        y se descarta el estado: el siguiente turno usa el prompt completo.
+        
+        Args:
+            conversation_id: ID de la conversación (None si no aplica)
+            backend_url: Backend que atendió la generación
+            config: Configuración de la invocación (modelo usado)
+            generation_info: Información final de la generación
+        """
+        if settings.llm_continuation_mode != CONTINUATION_MODE_CONTEXT or not conversation_id:
+            return
+        context = generation_info.get("context")
+        if context:
+            model = config["configurable"][OLLAMA_KWARGS_KEY]["model"]
+            self.continuations.put(conversation_id, list(context), backend_url, model)
+        else:
+            self.continuations.discard(conversation_id)
+    
+    def _record_model_usage(self, usage: Dict[str, Any], time_to_first_chunk: Optional[float]):
+        """
+        Publica las métricas de latencia y uso de tokens por modelo
+        
+        Args:
+            usage: Resumen de uso de la generación (incluye el modelo)
+            time_to_first_chunk: Segundos hasta el primer chunk (None si no hubo)
+        """
+        labels = {"model": usage["model"]}
+        metrics.increment("llm_requests_total", labels=labels)
+        metrics.observe("llm_generation_seconds", usage["generation_seconds"], labels=labels)
+        if time_to_first_chunk is not None:
+            metrics.observe("llm_time_to_first_chunk_seconds", time_to_first_chunk, labels=labels)
+        metrics.increment("llm_prompt_tokens_total", usage["prompt_tokens"] or 0, labels=labels)
+        metrics.increment("llm_completion_tokens_total", usage["completion_tokens"], labels=labels)
+    
+    def _record_stream_completed(self, chunks: int, elapsed: float):
+        """
+        Actualiza las medias de duración de los streams completados
+        
+        Args:
+            chunks: Chunks generados
+            elapsed: Segundos de generación
+        """
+        self._stream_chunks_avg += STREAM_STATS_SMOOTHING * (chunks - self._stream_chunks_avg)
+        self._stream_seconds_avg += STREAM_STATS_SMOOTHING * (elapsed - self._stream_seconds_avg)
+    
+    def _record_stream_cancelled(self, chunks: int, elapsed: float, max_tokens: int):
+        """
+        Registra una generación cancelada y estima el cómputo ahorrado
+        
+        Args:
+            chunks: Chunks generados antes de la cancelación
+            elapsed: Segundos de generación antes de la cancelación
+            max_tokens: Límite de tokens de la generación cancelada
+        """
+        tokens_saved = max(0.0, min(self._stream_chunks_avg, max_tokens) - chunks)
+        seconds_saved = max(0.0, self._stream_seconds_avg - elapsed)
+        
+        metrics.increment("llm_stream_cancelled_total")
+        metrics.increment("llm_stream_cancelled_tokens_generated", chunks)
+        metrics.increment("llm_stream_tokens_saved_estimate", tokens_saved)
+        metrics.increment("llm_stream_seconds_saved_estimate", seconds_saved)
+        logger.info(
+            f"Generación streaming cancelada tras {chunks} chunks "
+            f"(ahorro estimado: {tokens_saved:.0f} tokens, {seconds_saved:.1f}s)"
+        )
+    
+    async def summarize_conversation(self, previous_summary: Optional[str], turns: str) -> str:
+        """
+        Integra nuevos turnos en el resumen acumulado de una conversación
+        
+        Args:
+            previous_summary: Resumen previo (None si es el primero)
+            turns: Turnos a integrar, formateados como texto
+            
+        Returns:
+            Resumen actualizado
+        """
+        try:
+            # Trabajo en segundo plano: cede el paso a las peticiones interactivas
+            input_vars = {
+                "summary": previous_summary or "(sin resumen previo)",
+                "turns": turns
+            }
+            config = self._invocation_config(
+                max_tokens=settings.summary_max_tokens,
+                stop=[],
+                model=self.router.tiers[-1]
+            )
+            async with self.scheduler.slot(PRIORITY_BATCH, "summaries"), self.pool.lease() as backend:
+                summary = await self.chains[backend.url]["summary"].ainvoke(
+                    input_vars,
+                    config=self._with_num_ctx(config, "summary", input_vars, backend.url)
+                )
+            return summary.strip()
+            
+        except Exception as e:
+            logger.error(f"Error resumiendo conversación: {str(e)}")
+            raise
+    
     def format_context(self, documents: List[Dict[str, Any]]) -> str:
         """
         Formatea los documentos de contexto en un string
@@ -175,7 +738,12 @@ class LLMService:
         """
         try:
             # Intentar generar una respuesta simple con timeout implícito
-            response = await self.generate_response(TEST_QUESTION)
+            response = await self.generate_response(
+                TEST_QUESTION,
+                max_tokens=HEALTH_CHECK_MAX_TOKENS,
+                priority=PRIORITY_BATCH,
+                fairness_key="health_check"
+            )
             
             # Verificar que la respuesta no esté vacía
             is_available = bool(response and response.strip())
@@ -200,6 +768,8 @@ class LLMService:
         """
         return {
             "model": settings.llm_model,
-            "base_url": settings.ollama_base_url,
-            "temperature": self.llm.temperature
+            "tiers": self.router.tiers,
+            "backends": self.pool.get_stats(),
+            "temperature": DEFAULT_TEMPERATURE,
+            "continuation_mode": settings.llm_continuation_mode
         }
@@ -0,0 +1,74 @@
+"""
+Enrutado de peticiones entre modelos de distinto tamaño
+
+Elige el modelo de generación de una lista de niveles (del más pequeño al más
+grande) a partir de características baratas de la petición: longitud del
+mensaje, si hay contexto recuperado y el máximo de tokens solicitado. Los
+saludos y preguntas cortas van al modelo pequeño; el resto escala de nivel.
+"""
+from typing import List, Optional
+from app.config import settings
+
+
+class UnknownModelError(ValueError):
+    """El modelo solicitado no está entre los niveles configurados"""
+
+
+def configured_models() -> List[str]:
+    """Modelos de generación configurados, del más pequeño al más grande"""
+    return list(settings.llm_model_tiers) or [settings.llm_model]
+
+
+class ModelRouter:
+    """Selector de modelo por niveles a partir de características de la petición"""
+
+    def __init__(self, tiers: Optional[List[str]] = None):
+        self.tiers = tiers or configured_models()
+
+    def validate(self, model: Optional[str]):
+        """
+        Verifica que un modelo solicitado por el cliente esté configurado
+
+        Args:
+            model: Modelo solicitado (None = elección automática)
+
+        Raises:
+            UnknownModelError: Si el modelo no está entre los niveles
+        """
+        if model and model not in self.tiers:
+            raise UnknownModelError(
+                f"Modelo '{model}' no disponible; modelos configurados: {', '.join(self.tiers)}"
+            )
+
+    def select(
+        self,
+        question: str,
+        has_context: bool = False,
+        max_tokens: Optional[int] = None,
+        model: Optional[str] = None
+    ) -> str:
+        """
+        Elige el modelo de una petición
+
+        Args:
+            question: Mensaje del usuario
+            has_context: Si la petición lleva contexto recuperado
+            max_tokens: Máximo de tokens solicitado por el cliente (None = por defecto)
+            model: Modelo forzado por el cliente (opcional)
+
+        Returns:
+            Nombre del modelo elegido
+        """
+        if model:
+            self.validate(model)
+            return model
+
+        # Cada característica "costosa" sube un nivel
+        level = 0
+        if len(question) > settings.llm_router_short_message_chars:
+            level += 1
+        if has_context:
+            level += 1
+        if max_tokens and max_tokens > settings.llm_router_small_max_tokens:
+            level += 1
+        return self.tiers[min(level, len(self.tiers) - 1)]
@@ -0,0 +1,215 @@
+"""
+Detección de turnos casi duplicados con MinHash y LSH
+
+Cada turno se representa por su firma MinHash sobre shingles de caracteres
+del texto normalizado; la fracción de posiciones iguales entre dos firmas
+estima la similitud de Jaccard de sus shingles. Las firmas se reparten en
+bandas (LSH): dos turnos solo se comparan si coinciden en alguna banda
+completa, de modo que la búsqueda no recorre todos los turnos registrados.
+
+Hay dos ámbitos, cada uno con su umbral:
+- conversación: repeticiones o reformulaciones dentro de la misma conversación
+- global: el mismo intercambio en cualquier conversación
+
+El estado vive en memoria (acotado a max_entries firmas, las más antiguas se
+descartan); tras un reinicio se reconstruye con los turnos nuevos.
+"""
+import logging
+import threading
+import zlib
+from collections import OrderedDict
+from itertools import count
+from typing import Dict, Any, List, Optional, Tuple
+import numpy as np
+from app.config import settings
+from app.metrics import metrics
+from app.services.embedding_cache import normalize_text
+
+logger = logging.getLogger(__name__)
+
+SCOPE_CONVERSATION = "conversation"
+SCOPE_GLOBAL = "global"
+
+# Caracteres por shingle
+SHINGLE_CHARS = 5
+# Primo de Mersenne 2^31 - 1 para las permutaciones (a * x + b) mod p
+_PRIME = np.uint64((1 << 31) - 1)
+# Semilla fija: las firmas deben ser estables entre procesos
+_SEED = 0x5EED
+
+
+def _lsh_shape(num_perm: int, threshold: float) -> Tuple[int, int]:
+    """
+    Elige bandas y filas por banda para un umbral de Jaccard
+
+    Dos firmas con similitud s coinciden en alguna banda con probabilidad
+    1 - (1 - s^r)^b, cuya zona de transición está en torno a (1/b)^(1/r).
+    Se elige la división de num_perm cuyo punto de transición queda más
+    cerca del umbral, sin superarlo para no perder candidatos.
+    """
+    best: Optional[Tuple[float, int, int]] = None
+    for rows in range(1, num_perm + 1):
+        if num_perm % rows:
+            continue
+        bands = num_perm // rows
+        transition = (1 / bands) ** (1 / rows)
+        if transition > threshold:
+            continue
+        distance = threshold - transition
+        if best is None or distance < best[0]:
+            best = (distance, bands, rows)
+    if best is None:
+        return num_perm, 1
+    return best[1], best[2]
+
+
+class NearDuplicateDetector:
+    """Índice MinHash/LSH de turnos por conversación y global"""
+
+    def __init__(
+        self,
+        threshold: Optional[float] = None,
+        global_threshold: Optional[float] = None,
+        num_perm: Optional[int] = None,
+        max_entries: Optional[int] = None
+    ):
+        self.threshold = threshold if threshold is not None else settings.turn_dedup_threshold
+        self.global_threshold = (
+            global_threshold if global_threshold is not None
+            else settings.turn_dedup_global_threshold
+        )
+        self.num_perm = num_perm or settings.turn_dedup_num_perm
+        self.max_entries = max_entries or settings.turn_dedup_max_entries
+
+        rng = np.random.default_rng(_SEED)
+        self._a = rng.integers(1, int(_PRIME), size=self.num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, int(_PRIME), size=self.num_perm, dtype=np.uint64)
+
+        # Bandas calculadas para el umbral más bajo en uso: también sirven al otro ámbito
+        thresholds = [t for t in (self.threshold, self.global_threshold) if t > 0]
+        self.bands, self.rows = _lsh_shape(self.num_perm, min(thresholds) if thresholds else 1.0)
+
+        # Firmas registradas: id -> (conversation_id, firma)
+        self._entries: "OrderedDict[int, Tuple[Optional[str], np.ndarray]]" = OrderedDict()
+        # Cubetas LSH: (conversation_id, banda, hash de la banda) -> ids;
+        # conversation_id None = ámbito global
+        self._buckets: Dict[Tuple[Optional[str], int, int], List[int]] = {}
+        self._ids = count()
+        self._lock = threading.Lock()
+
+    def signature(self, text: str) -> np.ndarray:
+        """
+        Calcula la firma MinHash de un texto
+
+        Args:
+            text: Texto del turno
+
+        Returns:
+            Vector uint64 de num_perm valores mínimos
+        """
+        normalized = normalize_text(text).lower()
+        if len(normalized) <= SHINGLE_CHARS:
+            shingles = {normalized}
+        else:
+            shingles = {
+                normalized[i:i + SHINGLE_CHARS]
+                for i in range(len(normalized) - SHINGLE_CHARS + 1)
+            }
+        hashes = np.fromiter(
+            (zlib.crc32(shingle.encode("utf-8")) for shingle in shingles),
+            dtype=np.uint64,
+            count=len(shingles)
+        )
+        # a < 2^31 y hash < 2^32: el producto cabe en uint64 sin desbordar
+        permuted = (hashes[:, None] * self._a + self._b) % _PRIME
+        return permuted.min(axis=0)
+
+    def _band_keys(self, signature: np.ndarray, scope: Optional[str]) -> List[Tuple[Optional[str], int, int]]:
+        """Claves de cubeta de cada banda de la firma en un ámbito"""
+        return [
+            (scope, band, hash(signature[band * self.rows:(band + 1) * self.rows].tobytes()))
+            for band in range(self.bands)
+        ]
+
+    def _best_match(self, signature: np.ndarray, scope: Optional[str]) -> float:
+        """Mayor similitud estimada entre la firma y los candidatos LSH de un ámbito"""
+        candidates = set()
+        for key in self._band_keys(signature, scope):
+            candidates.update(self._buckets.get(key, ()))
+        best = 0.0
+        for entry_id in candidates:
+            _, other = self._entries[entry_id]
+            best = max(best, float(np.mean(signature == other)))
+        return best
+
+    def check(self, conversation_id: Optional[str], text: str) -> Optional[Dict[str, Any]]:
+        """
+        Comprueba si un turno es casi duplicado y, si no lo es, lo registra
+
+        Args:
+            conversation_id: ID de la conversación
+            text: Texto del turno
+
+        Returns:
+            None si el turno es nuevo, o {"scope", "similarity"} del duplicado
+        """
+        signature = self.signature(text)
+        with self._lock:
+            if conversation_id and self.threshold > 0:
+                similarity = self._best_match(signature, conversation_id)
+                if similarity >= self.threshold:
+                    return self._suppressed(SCOPE_CONVERSATION, similarity)
+            if self.global_threshold > 0:
+                similarity = self._best_match(signature, None)
+                if similarity >= self.global_threshold:
+                    return self._suppressed(SCOPE_GLOBAL, similarity)
+            self._register(conversation_id, signature)
+        return None
+
+    @staticmethod
+    def _suppressed(scope: str, similarity: float) -> Dict[str, Any]:
+        """Registra la métrica de un duplicado y devuelve su descripción"""
+        metrics.increment("turn_dedup_suppressed_total", labels={"scope": scope})
+        return {"scope": scope, "similarity": round(similarity, 3)}
+
+    def _register(self, conversation_id: Optional[str], signature: np.ndarray):
+        """Añade una firma a las cubetas. Debe llamarse con el lock adquirido."""
+        entry_id = next(self._ids)
+        self._entries[entry_id] = (conversation_id, signature)
+        scopes = [None] if self.global_threshold > 0 else []
+        if conversation_id:
+            scopes.append(conversation_id)
+        for scope in scopes:
+            for key in self._band_keys(signature, scope):
+                self._buckets.setdefault(key, []).append(entry_id)
+
+        while len(self._entries) > self.max_entries:
+            self._evict()
+
+    def _evict(self):
+        """Descarta la firma más antigua. Debe llamarse con el lock adquirido."""
+        entry_id, (conversation_id, signature) = self._entries.popitem(last=False)
+        for scope in (None, conversation_id):
+            for key in self._band_keys(signature, scope):
+                bucket = self._buckets.get(key)
+                if bucket and entry_id in bucket:
+                    bucket.remove(entry_id)
+                    if not bucket:
+                        del self._buckets[key]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Obtiene el estado del detector
+
+        Returns:
+            Diccionario con umbrales, forma LSH y firmas registradas
+        """
+        with self._lock:
+            return {
+                "threshold": self.threshold,
+                "global_threshold": self.global_threshold,
+                "bands": self.bands,
+                "rows_per_band": self.rows,
+                "entries": len(self._entries),
+                "buckets": len(self._buckets)
+            }
@@ -0,0 +1,293 @@
+"""
+Pool de backends de Ollama con balanceo por menor número de peticiones en curso
+
+Cada pool (generación o embeddings) reparte las peticiones entre varias URLs
+de Ollama ponderadas, sondea periódicamente su salud con /api/tags y expulsa
+temporalmente los backends que acumulan fallos consecutivos.
+"""
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import Callable, Dict, List, Optional, Any, Iterable
+import httpx
+from app.config import settings
+from app.metrics import metrics
+from app.services.http_client import OllamaHttpClient, ollama_http_client
+
+logger = logging.getLogger(__name__)
+
+# Timeout de las sondas de salud (segundos)
+PROBE_TIMEOUT_SECONDS = 2.0
+# Peso de la última observación en la media móvil de latencia
+LATENCY_SMOOTHING = 0.2
+
+
+class OllamaBackend:
+    """Estado de un backend de Ollama dentro de un pool"""
+
+    def __init__(self, url: str, weight: int = 1):
+        self.url = url.rstrip("/")
+        self.weight = max(1, weight)
+        self.outstanding = 0
+        self.healthy = True
+        self.consecutive_failures = 0
+        self.ejected_until = 0.0
+        self.latency_avg: Optional[float] = None
+
+    def is_available(self, now: float) -> bool:
+        """Indica si el backend puede recibir peticiones"""
+        return self.healthy and now >= self.ejected_until
+
+    def load(self) -> float:
+        """Carga relativa: peticiones en curso ponderadas por el peso"""
+        return (self.outstanding + 1) / self.weight
+
+
+class OllamaBackendPool:
+    """Pool de backends de Ollama con balanceo least-outstanding-requests"""
+
+    def __init__(
+        self,
+        name: str,
+        backends: Dict[str, int],
+        http_client: Optional[OllamaHttpClient] = None
+    ):
+        self.name = name
+        self.backends: List[OllamaBackend] = [
+            OllamaBackend(url, weight) for url, weight in backends.items()
+        ]
+        if not self.backends:
+            raise ValueError(f"El pool '{name}' no tiene backends configurados")
+
+        self.http_client = http_client or ollama_http_client
+        for backend in self.backends:
+            self.http_client.transport_for(backend.url)
+
+        self.probe_interval = settings.ollama_probe_interval_seconds
+        self.ejection_failures = settings.ollama_ejection_failures
+        self.ejection_seconds = settings.ollama_ejection_seconds
+        self._probe_task: Optional[asyncio.Task] = None
+        self._next = 0
+        # Avisos cuando un backend vuelve a estar disponible
+        self._available_listeners: List[Callable[[], None]] = []
+
+    @classmethod
+    def from_settings(
+        cls,
+        name: str,
+        backends: Dict[str, int],
+        http_client: Optional[OllamaHttpClient] = None
+    ) -> "OllamaBackendPool":
+        """
+        Crea un pool desde la configuración, usando ollama_base_url si no hay backends
+
+        Args:
+            name: Nombre del pool (p. ej. "generation" o "embedding")
+            backends: Diccionario URL -> peso
+            http_client: Cliente HTTP compartido (por defecto, el global)
+
+        Returns:
+            Pool de backends
+        """
+        return cls(name, backends or {settings.ollama_base_url: 1}, http_client)
+
+    @property
+    def urls(self) -> List[str]:
+        """URLs de los backends del pool"""
+        return [backend.url for backend in self.backends]
+
+    def on_backend_available(self, listener: Callable[[], None]):
+        """
+        Registra una función a la que avisar cuando un backend vuelve a estar
+        disponible (sonda correcta tras caída o fin de la expulsión)
+
+        Args:
+            listener: Función sin argumentos, llamada desde el event loop
+        """
+        self._available_listeners.append(listener)
+
+    def _notify_available(self):
+        """Avisa de que hay un backend más disponible"""
+        for listener in self._available_listeners:
+            try:
+                listener()
+            except Exception as e:
+                logger.error(f"Error notificando backend disponible en '{self.name}': {str(e)}")
+
+    def available_count(self) -> int:
+        """
+        Número de backends que pueden recibir peticiones ahora
+
+        Returns:
+            Backends sanos y no expulsados (al menos 1: sin ninguno, select
+            reparte entre todos)
+        """
+        now = time.monotonic()
+        return max(1, sum(1 for backend in self.backends if backend.is_available(now)))
+
+    def select(self, exclude: Iterable[str] = (), prefer: Optional[str] = None) -> OllamaBackend:
+        """
+        Elige el backend disponible con menor carga ponderada
+
+        Args:
+            exclude: URLs a descartar (p. ej. un backend que ya falló)
+            prefer: URL preferida (afinidad, p. ej. donde está la caché KV de
+                una conversación); se usa si está disponible
+
+        Returns:
+            Backend elegido
+        """
+        now = time.monotonic()
+        excluded = set(exclude)
+        candidates = [
+            backend for backend in self.backends
+            if backend.url not in excluded and backend.is_available(now)
+        ]
+        for backend in candidates:
+            if backend.url == prefer:
+                return backend
+        if not candidates:
+            # Sin backends sanos: repartir igualmente antes que fallar en seco
+            candidates = [b for b in self.backends if b.url not in excluded] or self.backends
+
+        # Rotar el punto de partida para desempatar en round-robin
+        self._next = (self._next + 1) % len(candidates)
+        rotated = candidates[self._next:] + candidates[:self._next]
+        return min(rotated, key=lambda backend: backend.load())
+
+    @asynccontextmanager
+    async def lease(self, exclude: Iterable[str] = (), prefer: Optional[str] = None):
+        """
+        Reserva un backend mientras dura la petición y registra el resultado
+
+        Args:
+            exclude: URLs a descartar
+            prefer: URL preferida si está disponible
+
+        Yields:
+            Backend elegido
+        """
+        backend = self.select(exclude, prefer)
+        backend.outstanding += 1
+        self._update_gauges(backend)
+        started_at = time.monotonic()
+        try:
+            yield backend
+        except Exception:
+            self.record_failure(backend)
+            raise
+        except BaseException:
+            # Cancelaciones: no son culpa del backend
+            raise
+        else:
+            self.record_success(backend, time.monotonic() - started_at)
+        finally:
+            backend.outstanding -= 1
+            self._update_gauges(backend)
+
+    def record_success(self, backend: OllamaBackend, latency: float):
+        """Registra una petición correcta"""
+        backend.consecutive_failures = 0
+        if backend.latency_avg is None:
+            backend.latency_avg = latency
+        else:
+            backend.latency_avg += LATENCY_SMOOTHING * (latency - backend.latency_avg)
+        metrics.observe("ollama_backend_latency_seconds", latency,
+                        labels={"pool": self.name, "backend": backend.url})
+
+    def record_failure(self, backend: OllamaBackend):
+        """Registra un fallo y expulsa el backend si acumula demasiados seguidos"""
+        backend.consecutive_failures += 1
+        metrics.increment("ollama_backend_failures_total",
+                          labels={"pool": self.name, "backend": backend.url})
+
+        if backend.consecutive_failures < self.ejection_failures:
+            return
+
+        # No expulsar el último backend disponible
+        now = time.monotonic()
+        others_available = any(
+            other is not backend and other.is_available(now) for other in self.backends
+        )
+        if not others_available:
+            return
+
+        backend.ejected_until = now + self.ejection_seconds
+        backend.consecutive_failures = 0
+        # Al terminar la expulsión el backend vuelve a contar sin esperar a la sonda
+        asyncio.get_running_loop().call_later(self.ejection_seconds, self._notify_available)
+        metrics.increment("ollama_backend_ejections_total",
+                          labels={"pool": self.name, "backend": backend.url})
+        logger.warning(
+            f"Backend {backend.url} expulsado del pool '{self.name}' "
+            f"durante {self.ejection_seconds}s por fallos consecutivos"
+        )
+
+    async def _probe(self, client: httpx.AsyncClient, backend: OllamaBackend):
+        """Sondea la salud de un backend con /api/tags"""
+        try:
+            response = await client.get(f"{backend.url}/api/tags", timeout=PROBE_TIMEOUT_SECONDS)
+            healthy = response.status_code == 200
+        except Exception:
+            healthy = False
+
+        recovered = healthy and not backend.healthy
+        if healthy != backend.healthy:
+            state = "disponible" if healthy else "no disponible"
+            logger.warning(f"Backend {backend.url} del pool '{self.name}' {state}")
+        backend.healthy = healthy
+        metrics.set_gauge("ollama_backend_healthy", 1 if healthy else 0,
+                          labels={"pool": self.name, "backend": backend.url})
+        if recovered:
+            self._notify_available()
+
+    async def _probe_loop(self):
+        """Bucle de sondas de salud activas"""
+        while True:
+            client = self.http_client.client
+            await asyncio.gather(*(self._probe(client, backend) for backend in self.backends))
+            await asyncio.sleep(self.probe_interval)
+
+    async def start(self):
+        """Inicia las sondas de salud en segundo plano"""
+        if self._probe_task is None and self.probe_interval > 0:
+            self._probe_task = asyncio.create_task(self._probe_loop())
+            logger.info(f"Pool '{self.name}' iniciado con backends: {', '.join(self.urls)}")
+
+    async def close(self):
+        """Detiene las sondas de salud"""
+        if self._probe_task is not None:
+            self._probe_task.cancel()
+            try:
+                await self._probe_task
+            except asyncio.CancelledError:
+                pass
+            self._probe_task = None
+
+    def _update_gauges(self, backend: OllamaBackend):
+        """Publica las peticiones en curso del backend"""
+        metrics.set_gauge("ollama_backend_outstanding", backend.outstanding,
+                          labels={"pool": self.name, "backend": backend.url})
+
+    def get_stats(self) -> List[Dict[str, Any]]:
+        """
+        Obtiene el estado de los backends del pool
+
+        Returns:
+            Lista con el estado de cada backend
+        """
+        now = time.monotonic()
+        return [
+            {
+                "url": backend.url,
+                "weight": backend.weight,
+                "outstanding": backend.outstanding,
+                "healthy": backend.healthy,
+                "ejected": now < backend.ejected_until,
+                "latency_avg_seconds": (
+                    round(backend.latency_avg, 3) if backend.latency_avg is not None else None
+                )
+            }
+            for backend in self.backends
+        ]
@@ -0,0 +1,278 @@
+"""
+Planificador de admisión para las generaciones del LLM
+
+Limita las generaciones concurrentes por backend de Ollama, mantiene una cola
+de espera acotada con prioridades y reparto equitativo (round-robin) entre
+conversaciones/clientes, y rechaza de inmediato las peticiones cuya espera
+estimada supera el SLO configurado.
+"""
+import asyncio
+import logging
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Callable, Dict, Optional
+from app.config import settings
+from app.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Prioridades (menor valor = mayor prioridad)
+PRIORITY_INTERACTIVE = 0
+PRIORITY_STANDARD = 1
+PRIORITY_BATCH = 2
+
+PRIORITY_NAMES = {
+    PRIORITY_INTERACTIVE: "interactive",
+    PRIORITY_STANDARD: "standard",
+    PRIORITY_BATCH: "batch"
+}
+
+# Peso de la última observación en la media móvil del tiempo de servicio
+SERVICE_TIME_SMOOTHING = 0.2
+
+
+class SchedulerOverloadedError(Exception):
+    """La petición no puede admitirse sin superar el SLO de espera"""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class GenerationScheduler:
+    """Planificador con límite de concurrencia, cola acotada y reparto equitativo"""
+
+    def __init__(
+        self,
+        backend: str,
+        max_concurrency: Optional[int] = None,
+        max_queue_size: Optional[int] = None,
+        slo_seconds: Optional[float] = None,
+        backend_count: Optional[Callable[[], int]] = None
+    ):
+        self.backend = backend
+        self.max_concurrency_per_backend = max_concurrency or settings.llm_max_concurrency_per_backend
+        # Backends disponibles en cada momento: el límite total escala con ellos
+        self.backend_count = backend_count or (lambda: 1)
+        self.max_queue_size = max_queue_size or settings.llm_max_queue_size
+        self.slo_seconds = slo_seconds or settings.llm_queue_slo_seconds
+        self.service_time = settings.llm_expected_generation_seconds
+
+        self._active = 0
+        self._waiting = 0
+        # prioridad -> (clave de reparto -> cola de futuros)
+        self._queues: Dict[int, "OrderedDict[str, deque]"] = {
+            priority: OrderedDict() for priority in PRIORITY_NAMES
+        }
+
+    @property
+    def max_concurrency(self) -> int:
+        """Límite total actual: por backend, por los backends disponibles ahora"""
+        return self.max_concurrency_per_backend * self.backend_count()
+
+    def _waiting_ahead(self, priority: int) -> int:
+        """Número de peticiones en cola que se atenderán antes que una nueva"""
+        return sum(
+            len(queue)
+            for queue_priority, queues in self._queues.items()
+            if queue_priority <= priority
+            for queue in queues.values()
+        )
+
+    def estimate_wait(self, priority: int = PRIORITY_STANDARD) -> float:
+        """
+        Estima el tiempo de espera en cola de una nueva petición
+
+        Args:
+            priority: Prioridad de la petición
+
+        Returns:
+            Segundos estimados hasta obtener un hueco de generación
+        """
+        ahead = self._waiting_ahead(priority)
+        if self._active < self.max_concurrency and ahead == 0:
+            return 0.0
+        return (ahead + 1) / self.max_concurrency * self.service_time
+
+    def check_admission(self, priority: int = PRIORITY_STANDARD):
+        """
+        Verifica si una petición puede admitirse
+
+        Args:
+            priority: Prioridad de la petición
+
+        Raises:
+            SchedulerOverloadedError: Si la cola está llena o la espera estimada supera el SLO
+        """
+        estimated_wait = self.estimate_wait(priority)
+        labels = {"backend": self.backend, "priority": PRIORITY_NAMES[priority]}
+
+        if self._waiting >= self.max_queue_size:
+            metrics.increment("scheduler_rejected_total", labels={**labels, "reason": "queue_full"})
+            raise SchedulerOverloadedError(
+                f"Cola de generación llena ({self._waiting} peticiones en espera)",
+                retry_after=max(estimated_wait, self.service_time)
+            )
+
+        if estimated_wait > self.slo_seconds:
+            metrics.increment("scheduler_rejected_total", labels={**labels, "reason": "slo"})
+            raise SchedulerOverloadedError(
+                f"Espera estimada de {estimated_wait:.1f}s supera el SLO de {self.slo_seconds:.1f}s",
+                retry_after=estimated_wait
+            )
+
+    async def acquire(self, priority: int = PRIORITY_STANDARD, fairness_key: str = "default"):
+        """
+        Espera un hueco de generación
+
+        Args:
+            priority: Prioridad de la petición
+            fairness_key: Clave de reparto equitativo (conversación o cliente)
+
+        Raises:
+            SchedulerOverloadedError: Si la petición no puede admitirse
+        """
+        self.check_admission(priority)
+
+        if self._active < self.max_concurrency and self._waiting == 0:
+            self._active += 1
+            self._update_gauges()
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        queues = self._queues[priority]
+        queues.setdefault(fairness_key, deque()).append(future)
+        self._waiting += 1
+        # Puede haber huecos libres si el límite creció (backend recuperado):
+        # se asignan en orden de cola, no a la petición recién llegada
+        self._grant_waiting()
+        self._update_gauges()
+
+        enqueued_at = time.monotonic()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # El hueco ya estaba asignado: cederlo al siguiente
+                self._release_slot()
+            else:
+                self._remove_waiter(priority, fairness_key, future)
+            raise
+
+        metrics.observe(
+            "scheduler_queue_wait_seconds",
+            time.monotonic() - enqueued_at,
+            labels={"backend": self.backend, "priority": PRIORITY_NAMES[priority]}
+        )
+
+    def release(self, service_time: Optional[float] = None):
+        """
+        Libera un hueco de generación
+
+        Args:
+            service_time: Duración de la generación, para la estimación de espera
+        """
+        if service_time is not None:
+            self.service_time += SERVICE_TIME_SMOOTHING * (service_time - self.service_time)
+        self._release_slot()
+
+    @asynccontextmanager
+    async def slot(self, priority: int = PRIORITY_STANDARD, fairness_key: str = "default"):
+        """
+        Contexto que mantiene un hueco de generación mientras dura
+
+        Args:
+            priority: Prioridad de la petición
+            fairness_key: Clave de reparto equitativo (conversación o cliente)
+        """
+        await self.acquire(priority, fairness_key)
+        started_at = time.monotonic()
+        try:
+            yield
+        except BaseException:
+            # Las generaciones fallidas o canceladas no cuentan para la estimación
+            self.release()
+            raise
+        self.release(time.monotonic() - started_at)
+
+    def wake(self):
+        """
+        Asigna los huecos libres a las peticiones en cola
+
+        Para cuando el límite crece sin que termine ninguna generación, p. ej.
+        al volver a estar disponible un backend.
+        """
+        self._grant_waiting()
+        self._update_gauges()
+
+    def _release_slot(self):
+        """Libera un hueco y lo asigna a la siguiente petición en cola"""
+        self._active -= 1
+        self._grant_waiting()
+        self._update_gauges()
+
+    def _grant_waiting(self):
+        """Despierta peticiones en cola mientras haya huecos libres"""
+        while self._active < self.max_concurrency:
+            future = self._pop_next()
+            if future is None:
+                break
+            if future.done():
+                continue
+            self._active += 1
+            future.set_result(None)
+
+    def _pop_next(self) -> Optional[asyncio.Future]:
+        """
+        Extrae la siguiente petición: la de mayor prioridad y, dentro de ella,
+        la siguiente clave de reparto en orden round-robin
+        """
+        for priority in sorted(self._queues):
+            queues = self._queues[priority]
+            if not queues:
+                continue
+            fairness_key, queue = next(iter(queues.items()))
+            future = queue.popleft()
+            if queue:
+                queues.move_to_end(fairness_key)
+            else:
+                del queues[fairness_key]
+            self._waiting -= 1
+            return future
+        return None
+
+    def _remove_waiter(self, priority: int, fairness_key: str, future: asyncio.Future):
+        """Elimina de la cola una petición cancelada mientras esperaba"""
+        queue = self._queues[priority].get(fairness_key)
+        if queue is None or future not in queue:
+            return
+        queue.remove(future)
+        if not queue:
+            del self._queues[priority][fairness_key]
+        self._waiting -= 1
+        self._update_gauges()
+
+    def _update_gauges(self):
+        """Publica el estado del planificador como métricas"""
+        labels = {"backend": self.backend}
+        metrics.set_gauge("scheduler_active", self._active, labels=labels)
+        metrics.set_gauge("scheduler_waiting", self._waiting, labels=labels)
+
+    def get_stats(self) -> Dict[str, float]:
+        """
+        Obtiene el estado actual del planificador
+
+        Returns:
+            Diccionario con huecos activos, cola y estimaciones
+        """
+        return {
+            "backend": self.backend,
+            "active": self._active,
+            "waiting": self._waiting,
+            "max_concurrency": self.max_concurrency,
+            "max_concurrency_per_backend": self.max_concurrency_per_backend,
+            "max_queue_size": self.max_queue_size,
+            "service_time_seconds": round(self.service_time, 3),
+            "estimated_wait_seconds": round(self.estimate_wait(), 3)
+        }
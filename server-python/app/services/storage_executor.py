@@ -0,0 +1,133 @@
+"""
+Ejecución de operaciones bloqueantes de almacenamiento fuera del event loop
+
+El cliente de ChromaDB es síncrono: cada llamada hace E/S de SQLite y trabajo
+del índice HNSW. Ejecutada en el event loop, detiene también el streaming de
+tokens del resto de peticiones. StorageExecutor la envía a un pool de hilos
+de tamaño fijo, con tiempo límite por llamada, y registra por operación la
+espera en cola y la duración:
+
+- vector_store_queue_wait_seconds{operation}
+- vector_store_latency_seconds{operation}
+- vector_store_timeouts_total{operation} / vector_store_errors_total{operation}
+- vector_store_pending (operaciones enviadas y sin terminar)
+"""
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, TypeVar
+from app.config import settings
+from app.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class StorageTimeoutError(Exception):
+    """Una operación de almacenamiento superó su tiempo límite"""
+
+
+class StorageExecutor:
+    """Pool de hilos acotado para las llamadas síncronas a la base vectorial"""
+
+    def __init__(self, max_workers: Optional[int] = None, timeout_seconds: Optional[float] = None):
+        self.max_workers = max_workers if max_workers is not None else settings.vector_store_workers
+        self.timeout_seconds = (
+            timeout_seconds if timeout_seconds is not None
+            else settings.vector_store_timeout_seconds
+        )
+        # max_workers = 0: ejecución en el event loop (solo para comparar en benchmarks)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        if self.max_workers > 0:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_workers,
+                thread_name_prefix="vector-store"
+            )
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def _track(self, delta: int):
+        """Actualiza el número de operaciones pendientes"""
+        with self._lock:
+            self._pending += delta
+            metrics.set_gauge("vector_store_pending", self._pending)
+
+    async def run(
+        self,
+        operation: str,
+        function: Callable[..., T],
+        *args: Any,
+        timeout: Optional[float] = None,
+        **kwargs: Any
+    ) -> T:
+        """
+        Ejecuta una llamada bloqueante en el pool y espera su resultado
+
+        Si vence el tiempo límite, una operación aún en cola se descarta; una
+        que ya se está ejecutando termina en segundo plano, porque los hilos
+        no pueden interrumpirse.
+
+        Args:
+            operation: Nombre de la operación para las métricas (p. ej. "query")
+            function: Función síncrona a ejecutar
+            *args: Argumentos posicionales de la función
+            timeout: Tiempo límite en segundos (por defecto, el configurado)
+            **kwargs: Argumentos con nombre de la función
+
+        Returns:
+            Resultado de la función
+
+        Raises:
+            StorageTimeoutError: Si la operación no termina a tiempo
+        """
+        labels = {"operation": operation}
+        enqueued_at = time.monotonic()
+
+        def call() -> T:
+            started_at = time.monotonic()
+            metrics.observe("vector_store_queue_wait_seconds", started_at - enqueued_at, labels=labels)
+            try:
+                return function(*args, **kwargs)
+            except Exception:
+                metrics.increment("vector_store_errors_total", labels=labels)
+                raise
+            finally:
+                metrics.observe("vector_store_latency_seconds", time.monotonic() - started_at, labels=labels)
+
+        if self._executor is None:
+            return call()
+
+        self._track(1)
+        future = self._executor.submit(call)
+        future.add_done_callback(lambda _: self._track(-1))
+        limit = timeout if timeout is not None else self.timeout_seconds
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout=limit)
+        except asyncio.TimeoutError:
+            metrics.increment("vector_store_timeouts_total", labels=labels)
+            logger.warning(f"Operación '{operation}' de la base vectorial sin respuesta tras {limit:.1f}s")
+            raise StorageTimeoutError(
+                f"La operación '{operation}' de la base vectorial superó {limit:.1f}s"
+            )
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Obtiene el estado del pool
+
+        Returns:
+            Diccionario con hilos, tiempo límite y operaciones pendientes
+        """
+        with self._lock:
+            return {
+                "workers": self.max_workers,
+                "timeout_seconds": self.timeout_seconds,
+                "pending": self._pending
+            }
+
+    def close(self):
+        """Detiene el pool sin esperar a las operaciones en curso"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
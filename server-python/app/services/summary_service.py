@@ -0,0 +1,101 @@
+"""
+Servicio de resumen incremental de conversaciones
+
+Cada K turnos pliega en segundo plano los turnos más antiguos de una
+conversación en un resumen acumulado, de modo que el prompt se construye con
+resumen + turnos recientes y su tamaño no crece con la conversación.
+"""
+import asyncio
+import logging
+from typing import Dict
+from app.services.llm_service import LLMService
+from app.services.history_service import ConversationHistoryService
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class ConversationSummaryService:
+    """Servicio que mantiene un resumen acumulado por conversación"""
+
+    def __init__(self, llm_service: LLMService, history_service: ConversationHistoryService):
+        self.llm_service = llm_service
+        self.history_service = history_service
+        self.every_turns = settings.summary_every_turns
+        self.keep_recent_turns = settings.summary_keep_recent_turns
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    def schedule(self, conversation_id: str, next_index: int, summarized_until: int):
+        """
+        Programa un resumen en segundo plano si la conversación acumula al menos
+        K turnos nuevos fuera de la ventana de turnos recientes
+
+        La condición se evalúa en cada turno: si un resumen falla o se omite
+        porque otro seguía en curso, se reintenta en el turno siguiente.
+
+        Args:
+            conversation_id: ID de la conversación
+            next_index: Índice del próximo turno (turnos almacenados)
+            summarized_until: Índice del primer turno no resumido
+        """
+        if not settings.summary_enable:
+            return
+
+        # Solo un resumen en curso por conversación
+        if conversation_id in self._tasks:
+            return
+
+        if next_index - summarized_until - self.keep_recent_turns < self.every_turns:
+            return
+
+        task = asyncio.create_task(self._summarize(conversation_id))
+        self._tasks[conversation_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(conversation_id, None))
+
+    async def _summarize(self, conversation_id: str):
+        """
+        Pliega en el resumen los turnos anteriores a la ventana reciente
+
+        Args:
+            conversation_id: ID de la conversación
+        """
+        try:
+            state = await self.history_service.get_summary(conversation_id)
+            start = state["summarized_until"]
+            end = state["next_index"] - self.keep_recent_turns
+
+            if end - start < self.every_turns:
+                return
+
+            turns = await self.history_service.get_turns_range(conversation_id, start, end)
+            if not turns:
+                return
+
+            turns_text = "\n".join(
+                f"Usuario: {turn['user_message']}\nAsistente: {turn['assistant_response']}"
+                for turn in turns
+            )
+            summary = await self.llm_service.summarize_conversation(
+                previous_summary=state["summary"],
+                turns=turns_text
+            )
+
+            await self.history_service.save_summary(conversation_id, summary, end)
+            logger.info(
+                f"Resumen actualizado para conversación {conversation_id} "
+                f"(turnos {start}-{end - 1})"
+            )
+
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error generando resumen de conversación: {str(e)}")
+
+    async def shutdown(self):
+        """Cancela los resúmenes pendientes"""
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+            logger.info(f"Cancelados {len(tasks)} resúmenes pendientes")
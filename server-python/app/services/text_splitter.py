@@ -0,0 +1,211 @@
+"""
+División de textos en chunks por secciones, sin bloquear el event loop
+
+RecursiveCharacterTextSplitter trabaja sobre el texto completo. Para
+documentos de varios megabytes, el texto se recorre en secciones de tamaño
+acotado, cortadas en un salto de párrafo, de línea o un espacio, y cada
+sección se divide por separado. Los chunks se producen a medida que avanza
+la división, de modo que los embeddings pueden empezar antes de que termine.
+La división se ejecuta en un hilo, y los trabajos masivos pueden repartirla
+en un pool de procesos.
+"""
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import AsyncIterator, Iterable, Iterator, List, Optional
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
+SEPARATORS = ["\n\n", "\n", " ", ""]
+# Tamaño máximo de cada sección que se divide de una vez (caracteres)
+SECTION_CHARS = 64 * 1024
+# Chunks que la división puede adelantar al consumidor
+PREFETCH_CHUNKS = 256
+
+# Marca de fin de la cola de chunks
+_END = object()
+
+
+def create_text_splitter() -> RecursiveCharacterTextSplitter:
+    """Crea el divisor de texto con la configuración de chunks de la aplicación"""
+    return RecursiveCharacterTextSplitter(
+        chunk_size=CHUNK_SIZE,
+        chunk_overlap=CHUNK_OVERLAP,
+        length_function=len,
+        separators=SEPARATORS
+    )
+
+
+class StreamingTextSplitter:
+    """Divisor incremental: recibe texto por partes y devuelve chunks por secciones"""
+
+    def __init__(self, section_chars: int = SECTION_CHARS):
+        self.section_chars = max(section_chars, 4 * CHUNK_SIZE)
+        self._splitter = create_text_splitter()
+        self._buffer = ""
+
+    def _cut_point(self) -> int:
+        """Fin de la sección: el último separador en la segunda mitad del límite"""
+        for separator in SEPARATORS[:-1]:
+            index = self._buffer.rfind(separator, self.section_chars // 2, self.section_chars)
+            if index != -1:
+                return index + len(separator)
+        return self.section_chars
+
+    def _overlap_start(self, cut: int) -> int:
+        """Inicio de la siguiente sección: CHUNK_OVERLAP caracteres antes del corte, en un espacio"""
+        start = cut - CHUNK_OVERLAP
+        space = self._buffer.find(" ", start, cut)
+        return space + 1 if space != -1 else start
+
+    def feed(self, text: str) -> List[str]:
+        """
+        Añade texto y divide las secciones completas
+
+        Args:
+            text: Siguiente parte del texto
+
+        Returns:
+            Chunks de las secciones completadas
+        """
+        self._buffer += text
+        chunks: List[str] = []
+        while len(self._buffer) >= self.section_chars:
+            cut = self._cut_point()
+            chunks.extend(self._splitter.split_text(self._buffer[:cut]))
+            # La siguiente sección repite el final de esta para conservar el solapamiento
+            self._buffer = self._buffer[self._overlap_start(cut):]
+        return chunks
+
+    def finish(self) -> List[str]:
+        """
+        Divide el texto pendiente
+
+        Returns:
+            Chunks de la última sección
+        """
+        chunks = self._splitter.split_text(self._buffer) if self._buffer.strip() else []
+        self._buffer = ""
+        return chunks
+
+
+def iter_sections(text: str, size: int = SECTION_CHARS) -> Iterator[str]:
+    """Recorre un texto en partes de tamaño fijo"""
+    for start in range(0, len(text), size):
+        yield text[start:start + size]
+
+
+def iter_split_text(parts: Iterable[str]) -> Iterator[str]:
+    """
+    Divide un texto recibido por partes, produciendo los chunks sobre la marcha
+
+    Args:
+        parts: Partes consecutivas del texto
+
+    Yields:
+        Chunks del texto
+    """
+    splitter = StreamingTextSplitter()
+    for part in parts:
+        yield from splitter.feed(part)
+    yield from splitter.finish()
+
+
+def split_text(text: str) -> List[str]:
+    """Divide un texto completo (función de módulo, ejecutable en otro proceso)"""
+    return list(iter_split_text(iter_sections(text)))
+
+
+class DocumentSplitter:
+    """División de documentos fuera del event loop (hilos o pool de procesos)"""
+
+    def __init__(self, process_workers: Optional[int] = None):
+        self.process_workers = (
+            process_workers if process_workers is not None
+            else settings.text_splitter_process_workers
+        )
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    async def aiter_chunks(self, parts: Iterable[str]) -> AsyncIterator[str]:
+        """
+        Divide un texto en un hilo y entrega los chunks según se producen
+
+        La división se adelanta hasta PREFETCH_CHUNKS chunks al consumidor,
+        así que los embeddings de los primeros chunks se solapan con la
+        división del resto del texto.
+
+        Args:
+            parts: Partes consecutivas del texto (p. ej. iter_sections(texto))
+
+        Yields:
+            Chunks del texto
+        """
+        queue: asyncio.Queue = asyncio.Queue(maxsize=PREFETCH_CHUNKS)
+
+        async def produce():
+            try:
+                splitter = StreamingTextSplitter()
+                iterator = iter(parts)
+                while True:
+                    part = await asyncio.to_thread(next, iterator, None)
+                    if part is None:
+                        break
+                    for chunk in await asyncio.to_thread(splitter.feed, part):
+                        await queue.put(chunk)
+                for chunk in await asyncio.to_thread(splitter.finish):
+                    await queue.put(chunk)
+                await queue.put(_END)
+            except Exception as e:
+                await queue.put(e)
+
+        producer = asyncio.create_task(produce())
+        try:
+            while True:
+                item = await queue.get()
+                if item is _END:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            producer.cancel()
+
+    async def split_many(self, texts: List[str]) -> List[List[str]]:
+        """
+        Divide varios textos en paralelo para trabajos masivos
+
+        Usa el pool de procesos si está configurado (process_workers > 0) y,
+        si no, un hilo por texto.
+
+        Args:
+            texts: Textos a dividir
+
+        Returns:
+            Lista de chunks por texto, alineada con texts
+        """
+        loop = asyncio.get_running_loop()
+        if self.process_workers <= 0:
+            return list(await asyncio.gather(
+                *(asyncio.to_thread(split_text, text) for text in texts)
+            ))
+        if self._executor is None:
+            # "spawn": los procesos hijos no heredan hilos ni el event loop del servidor
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.process_workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+            logger.info(f"Pool de {self.process_workers} procesos de división iniciado")
+        return list(await asyncio.gather(
+            *(loop.run_in_executor(self._executor, split_text, text) for text in texts)
+        ))
+
+    def close(self):
+        """Detiene el pool de procesos"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
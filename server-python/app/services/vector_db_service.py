@@ -1,16 +1,41 @@
 """
 Servicio de base de datos vectorial usando ChromaDB
+
+Las llamadas al cliente de ChromaDB (síncronas) se ejecutan en el pool
+acotado de StorageExecutor, fuera del event loop.
 """
+import hashlib
 import logging
 import uuid
-from typing import List, Optional, Dict, Any
+from typing import Iterable, List, Optional, Dict, Any, Set
 import chromadb
+import numpy as np
 from chromadb.config import Settings as ChromaSettings
 from langchain_core.documents import Document
 from app.config import settings
+from app.services.storage_executor import StorageExecutor
+from app.services.vector_index import QUANTIZATION_NONE, QuantizedVectorIndex, rescore
 
 logger = logging.getLogger(__name__)
 
+# Documentos por página al cargar el índice cuantizado desde la colección
+INDEX_LOAD_PAGE_SIZE = 1000
+
+
+def chunk_id(content: str, document_key: Optional[str] = None, conversation_id: Optional[str] = None) -> str:
+    """
+    ID determinista de un chunk: hash de (clave de origen, conversación, contenido)
+
+    Volver a añadir el mismo contenido produce los mismos IDs, así que las
+    escrituras son idempotentes. Sin clave de origen, el ID depende solo del
+    contenido dentro de la conversación.
+    """
+    digest = hashlib.sha256()
+    for part in (document_key or "", conversation_id or "", content):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()[:32]
+
 
 class VectorDatabaseService:
     """Servicio para gestionar la base de datos vectorial con ChromaDB"""
@@ -24,6 +49,33 @@ class VectorDatabaseService:
             )
         )
         self.collection = self._get_or_create_collection()
+        self.storage = StorageExecutor()
+        # Índice cuantizado en memoria para la búsqueda (opcional)
+        self.index: Optional[QuantizedVectorIndex] = None
+        if settings.vector_index_quantization != QUANTIZATION_NONE:
+            self.index = QuantizedVectorIndex(settings.vector_index_quantization)
+            self._load_index()
+    
+    def _load_index(self):
+        """Carga en el índice cuantizado los vectores ya guardados en la colección"""
+        offset = 0
+        while True:
+            page = self.collection.get(
+                limit=INDEX_LOAD_PAGE_SIZE,
+                offset=offset,
+                include=["embeddings", "metadatas"]
+            )
+            if not page["ids"]:
+                break
+            self.index.add(
+                page["ids"],
+                np.asarray(page["embeddings"], dtype=np.float32),
+                [(metadata or {}).get("conversation_id") for metadata in page["metadatas"]]
+            )
+            offset += len(page["ids"])
+        logger.info(
+            f"Índice {settings.vector_index_quantization} cargado con {offset} vectores"
+        )
     
     def _get_or_create_collection(self):
         """Obtiene o crea la colección de ChromaDB"""
@@ -38,18 +90,63 @@ class VectorDatabaseService:
             logger.error(f"Error creando colección: {str(e)}")
             raise
     
+    def chunk_ids(self, documents: List[Document], conversation_id: Optional[str] = None) -> List[str]:
+        """
+        Calcula los IDs deterministas de unos chunks
+        
+        Args:
+            documents: Chunks (la clave de origen es el metadato "document_key")
+            conversation_id: ID de la conversación (opcional)
+            
+        Returns:
+            Lista de IDs alineada con documents
+        """
+        ids = []
+        for doc in documents:
+            metadata = doc.metadata or {}
+            ids.append(chunk_id(
+                doc.page_content,
+                metadata.get("document_key"),
+                conversation_id or metadata.get("conversation_id")
+            ))
+        return ids
+    
+    async def get_existing_ids(self, ids: List[str]) -> Set[str]:
+        """
+        Obtiene cuáles de unos IDs ya están almacenados
+        
+        Args:
+            ids: IDs de chunks
+            
+        Returns:
+            Conjunto de IDs presentes en la colección
+        """
+        if not ids:
+            return set()
+        try:
+            found = await self.storage.run(
+                "get", self.collection.get, ids=list(dict.fromkeys(ids)), include=[]
+            )
+            return set(found["ids"])
+        except Exception as e:
+            logger.error(f"Error consultando IDs existentes: {str(e)}")
+            raise
+    
     async def add_documents(
         self, 
         documents: List[Document], 
-        embeddings: List[List[float]],
+        embeddings: np.ndarray,
         conversation_id: Optional[str] = None
     ) -> List[str]:
         """
-        Añade documentos a la base de datos vectorial
+        Añade o reemplaza documentos en la base de datos vectorial
+        
+        Los IDs se derivan del contenido (ver chunk_id), así que repetir una
+        escritura actualiza los mismos chunks en lugar de duplicarlos.
         
         Args:
             documents: Lista de documentos a añadir
-            embeddings: Lista de embeddings correspondientes
+            embeddings: Matriz float32 con un embedding por documento
             conversation_id: ID de la conversación (opcional)
             
         Returns:
@@ -59,11 +156,17 @@ class VectorDatabaseService:
             document_ids = []
             texts = []
             metadatas = []
+            rows = []
+            seen = set()
             
-            for doc in documents:
-                doc_id = str(uuid.uuid4())
+            for row, (doc, doc_id) in enumerate(zip(documents, self.chunk_ids(documents, conversation_id))):
+                # Chunks repetidos en la misma escritura: se guarda una vez
+                if doc_id in seen:
+                    continue
+                seen.add(doc_id)
                 document_ids.append(doc_id)
                 texts.append(doc.page_content)
+                rows.append(row)
                 
                 # Combinar metadatos del documento con conversation_id
                 metadata = doc.metadata.copy() if doc.metadata else {}
@@ -72,13 +175,12 @@ class VectorDatabaseService:
                 metadata["timestamp"] = str(uuid.uuid1().time)
                 metadatas.append(metadata)
             
-            # Añadir a ChromaDB
-            self.collection.add(
-                documents=texts,
-                embeddings=embeddings,
-                metadatas=metadatas,
-                ids=document_ids
-            )
+            if not document_ids:
+                return []
+            if len(rows) < len(documents):
+                embeddings = embeddings[rows]
+            
+            await self.storage.run("upsert", self._upsert, document_ids, texts, embeddings, metadatas)
             
             logger.info(f"Añadidos {len(document_ids)} documentos a la base de datos")
             return document_ids
@@ -87,9 +189,33 @@ class VectorDatabaseService:
             logger.error(f"Error añadiendo documentos: {str(e)}")
             raise
     
+    def _upsert(
+        self,
+        document_ids: List[str],
+        texts: List[str],
+        embeddings: np.ndarray,
+        metadatas: List[Dict[str, Any]]
+    ):
+        """Escribe los chunks en ChromaDB y en el índice cuantizado (en el pool de hilos)"""
+        # ChromaDB acepta la matriz float32 sin convertirla a listas
+        self.collection.upsert(
+            documents=texts,
+            embeddings=embeddings,
+            metadatas=metadatas,
+            ids=document_ids
+        )
+        if self.index is not None:
+            # Reemplazar en el índice los vectores de chunks ya presentes
+            self.index.remove(document_ids)
+            self.index.add(
+                document_ids,
+                embeddings,
+                [metadata.get("conversation_id") for metadata in metadatas]
+            )
+    
     async def search_similar_documents(
         self, 
-        query_embedding: List[float], 
+        query_embedding: np.ndarray, 
         n_results: int = 5,
         conversation_id: Optional[str] = None
     ) -> List[Dict[str, Any]]:
@@ -97,7 +223,7 @@ class VectorDatabaseService:
         Busca documentos similares usando embedding de consulta
         
         Args:
-            query_embedding: Embedding de la consulta
+            query_embedding: Vector float32 de la consulta
             n_results: Número de resultados a devolver
             conversation_id: ID de la conversación para filtrar
             
@@ -105,14 +231,23 @@ class VectorDatabaseService:
             Lista de documentos similares con metadatos
         """
         try:
+            if self.index is not None:
+                documents = await self.storage.run(
+                    "search", self._search_quantized, query_embedding, n_results, conversation_id
+                )
+                logger.info(f"Encontrados {len(documents)} documentos similares")
+                return documents
+            
             # Preparar filtros si se especifica conversation_id
             where_clause = None
             if conversation_id:
                 where_clause = {"conversation_id": conversation_id}
             
             # Buscar en ChromaDB
-            results = self.collection.query(
-                query_embeddings=[query_embedding],
+            results = await self.storage.run(
+                "query",
+                self.collection.query,
+                query_embeddings=query_embedding[None, :],
                 n_results=n_results,
                 where=where_clause,
                 include=["documents", "metadatas", "distances"]
@@ -135,6 +270,52 @@ class VectorDatabaseService:
             logger.error(f"Error buscando documentos similares: {str(e)}")
             raise
     
+    def _search_quantized(
+        self,
+        query_embedding: np.ndarray,
+        n_results: int,
+        conversation_id: Optional[str]
+    ) -> List[Dict[str, Any]]:
+        """
+        Busca con el índice cuantizado y reordena los candidatos con los
+        vectores float32 guardados en ChromaDB (en el pool de hilos)
+        
+        Args:
+            query_embedding: Vector float32 de la consulta
+            n_results: Número de resultados a devolver
+            conversation_id: ID de la conversación para filtrar
+            
+        Returns:
+            Lista de documentos similares con metadatos
+        """
+        candidates = self.index.search(
+            query_embedding,
+            n_results * settings.vector_index_rescore_factor,
+            group=conversation_id
+        )
+        if not candidates:
+            return []
+        
+        fetched = self.collection.get(
+            ids=candidates,
+            include=["embeddings", "documents", "metadatas"]
+        )
+        positions = {doc_id: i for i, doc_id in enumerate(fetched["ids"])}
+        ranked = rescore(
+            query_embedding,
+            fetched["ids"],
+            np.asarray(fetched["embeddings"], dtype=np.float32),
+            n_results
+        )
+        return [
+            {
+                "content": fetched["documents"][positions[doc_id]],
+                "metadata": fetched["metadatas"][positions[doc_id]] or {},
+                "distance": distance
+            }
+            for doc_id, distance in ranked
+        ]
+    
     async def get_conversation_context(
         self, 
         conversation_id: str, 
@@ -151,7 +332,9 @@ class VectorDatabaseService:
             Lista de documentos del contexto de la conversación
         """
         try:
-            results = self.collection.get(
+            results = await self.storage.run(
+                "get",
+                self.collection.get,
                 where={"conversation_id": conversation_id},
                 limit=limit,
                 include=["documents", "metadatas"]
@@ -172,7 +355,70 @@ class VectorDatabaseService:
             logger.error(f"Error obteniendo contexto: {str(e)}")
             raise
     
-    def get_collection_stats(self) -> Dict[str, Any]:
+    async def delete_stale_chunks(
+        self,
+        document_key: str,
+        keep_ids: Iterable[str] = (),
+        conversation_id: Optional[str] = None
+    ) -> int:
+        """
+        Elimina los chunks de un documento que ya no forman parte de él
+        
+        Args:
+            document_key: Clave de origen del documento (metadato "document_key")
+            keep_ids: IDs de los chunks actuales del documento
+            conversation_id: Conversación del documento; los chunks de la misma
+                clave en otras conversaciones no se tocan
+            
+        Returns:
+            Número de chunks eliminados
+        """
+        try:
+            stale = await self.storage.run(
+                "delete", self._delete_stale, document_key, set(keep_ids), conversation_id
+            )
+            if not stale:
+                return 0
+            logger.info(f"Eliminados {len(stale)} chunks obsoletos del documento '{document_key}'")
+            return len(stale)
+        except Exception as e:
+            logger.error(f"Error eliminando chunks obsoletos: {str(e)}")
+            raise
+    
+    def _delete_stale(
+        self,
+        document_key: str,
+        keep: Set[str],
+        conversation_id: Optional[str]
+    ) -> List[str]:
+        """Elimina de ChromaDB y del índice los chunks no incluidos en keep (en el pool de hilos)"""
+        if conversation_id:
+            stored = self.collection.get(
+                where={"$and": [
+                    {"document_key": document_key},
+                    {"conversation_id": conversation_id}
+                ]},
+                include=[]
+            )["ids"]
+        else:
+            # Sin conversación: solo los chunks de la clave que no pertenecen a ninguna
+            found = self.collection.get(where={"document_key": document_key}, include=["metadatas"])
+            stored = [
+                doc_id for doc_id, metadata in zip(found["ids"], found["metadatas"])
+                if not (metadata or {}).get("conversation_id")
+            ]
+        stale = [doc_id for doc_id in stored if doc_id not in keep]
+        if stale:
+            self.collection.delete(ids=stale)
+            if self.index is not None:
+                self.index.remove(stale)
+        return stale
+    
+    async def count_documents(self) -> int:
+        """Cuenta los documentos de la colección"""
+        return await self.storage.run("count", self.collection.count)
+    
+    async def get_collection_stats(self) -> Dict[str, Any]:
         """
         Obtiene estadísticas de la colección
         
@@ -180,11 +426,15 @@ class VectorDatabaseService:
             Diccionario con estadísticas
         """
         try:
-            count = self.collection.count()
-            return {
+            count = await self.count_documents()
+            stats = {
                 "total_documents": count,
-                "collection_name": settings.collection_name
+                "collection_name": settings.collection_name,
+                "storage": self.storage.get_stats()
             }
+            if self.index is not None:
+                stats["index"] = self.index.get_stats()
+            return stats
         except Exception as e:
             logger.error(f"Error obteniendo estadísticas: {str(e)}")
             return {"error": str(e)}
@@ -194,7 +444,13 @@ class VectorDatabaseService:
         try:
             self.client.delete_collection(settings.collection_name)
             self.collection = self._get_or_create_collection()
+            if self.index is not None:
+                self.index.clear()
             logger.info("Colección reseteada exitosamente")
         except Exception as e:
             logger.error(f"Error reseteando colección: {str(e)}")
             raise
+    
+    def close(self):
+        """Detiene el pool de hilos de almacenamiento"""
+        self.storage.close()
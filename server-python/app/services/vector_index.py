@@ -0,0 +1,262 @@
+"""
+Precisión de almacenamiento de los embeddings
+
+- Truncado Matryoshka: los modelos entrenados con Matryoshka (como
+  nomic-embed-text v1.5) concentran la información en las primeras
+  dimensiones, así que los vectores pueden recortarse a 256 o 512 dimensiones
+  y renormalizarse con poca pérdida.
+- Índice cuantizado en memoria: una copia int8 (escala por vector) o binaria
+  (un bit por dimensión) de los vectores de la colección, para preseleccionar
+  candidatos con una fracción de la memoria. Los mejores candidatos se
+  reordenan después con los vectores float32 completos.
+
+La preselección int8 aproxima la misma métrica que ChromaDB y rescore (L2 al
+cuadrado), con la norma de cada vector reconstruido. La binaria solo conserva
+el signo de cada dimensión: su distancia de Hamming sigue al ángulo entre
+vectores y equivale a L2 únicamente con vectores de norma unitaria (los de
+Ollama y los truncados lo son). Todos los vectores de un índice deben tener
+las mismas dimensiones.
+"""
+import logging
+import threading
+from typing import Dict, Any, List, Optional, Sequence, Set, Tuple
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+QUANTIZATION_NONE = "none"
+QUANTIZATION_INT8 = "int8"
+QUANTIZATION_BINARY = "binary"
+
+# Filas por bloque al puntuar, para no materializar la matriz completa en float32
+SCORE_CHUNK_ROWS = 8192
+# Bits a 1 de cada byte, para la distancia de Hamming
+_POPCOUNT = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(axis=1).astype(np.uint16)
+
+
+def truncate_embeddings(embeddings: np.ndarray, dimensions: int) -> np.ndarray:
+    """
+    Recorta los embeddings a sus primeras dimensiones y los renormaliza
+
+    Args:
+        embeddings: Vector (1-D) o matriz (una fila por vector) float32
+        dimensions: Dimensiones a conservar (0 o >= las actuales = sin cambios)
+
+    Returns:
+        Embeddings truncados con norma unitaria
+    """
+    if not dimensions or dimensions >= embeddings.shape[-1]:
+        return embeddings
+    truncated = np.array(embeddings[..., :dimensions], dtype=np.float32)
+    norms = np.linalg.norm(truncated, axis=-1, keepdims=True)
+    return truncated / np.clip(norms, 1e-12, None)
+
+
+def squared_l2(query: np.ndarray, vectors: np.ndarray) -> np.ndarray:
+    """Distancia L2 al cuadrado (la métrica por defecto de ChromaDB)"""
+    differences = vectors - query
+    return np.einsum("ij,ij->i", differences, differences)
+
+
+def rescore(
+    query: np.ndarray,
+    ids: Sequence[str],
+    vectors: np.ndarray,
+    n_results: int
+) -> List[Tuple[str, float]]:
+    """
+    Reordena candidatos con sus vectores float32 completos
+
+    Args:
+        query: Vector float32 de la consulta
+        ids: IDs de los candidatos
+        vectors: Matriz float32 de los candidatos, alineada con ids
+        n_results: Número de resultados
+
+    Returns:
+        Lista de (id, distancia L2 al cuadrado), de la más cercana a la más lejana
+    """
+    if not len(ids):
+        return []
+    distances = squared_l2(query, vectors)
+    order = np.argsort(distances)[:n_results]
+    return [(ids[i], float(distances[i])) for i in order]
+
+
+class QuantizedVectorIndex:
+    """Índice en memoria con vectores cuantizados (int8 o binarios)"""
+
+    def __init__(self, quantization: str):
+        if quantization not in (QUANTIZATION_INT8, QUANTIZATION_BINARY):
+            raise ValueError(f"Cuantización '{quantization}' no soportada")
+        self.quantization = quantization
+        self.dimensions: Optional[int] = None
+        self._ids: List[str] = []
+        self._id_set: Set[str] = set()
+        self._groups: List[Optional[str]] = []
+        self._codes: List[np.ndarray] = []
+        self._scales: List[np.ndarray] = []
+        # Norma al cuadrado de cada vector reconstruido (int8), para aproximar L2
+        self._norms: List[np.ndarray] = []
+        # Matrices consolidadas, reconstruidas tras cada inserción
+        self._matrix: Optional[np.ndarray] = None
+        self._scale_vector: Optional[np.ndarray] = None
+        self._norm_vector: Optional[np.ndarray] = None
+        self._group_array: Optional[np.ndarray] = None
+        self._lock = threading.Lock()
+
+    def _quantize(self, embeddings: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Cuantiza una matriz float32; devuelve códigos, escalas y normas al cuadrado por fila"""
+        if self.quantization == QUANTIZATION_BINARY:
+            # Los códigos binarios no necesitan escala ni norma
+            empty = np.empty(0, dtype=np.float32)
+            return np.packbits(embeddings > 0, axis=1), empty, empty
+        scales = np.abs(embeddings).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        codes = np.round(embeddings / scales[:, None]).astype(np.int8)
+        reconstructed = codes.astype(np.float32) * scales[:, None]
+        norms = np.einsum("ij,ij->i", reconstructed, reconstructed)
+        return codes, scales.astype(np.float32), norms.astype(np.float32)
+
+    def _check_dimensions(self, dimensions: int):
+        """Rechaza vectores de otra dimensión. Debe llamarse con el lock adquirido."""
+        if self.dimensions is not None and dimensions != self.dimensions:
+            raise ValueError(
+                f"El índice contiene vectores de {self.dimensions} dimensiones y se recibieron "
+                f"de {dimensions}; si cambió embedding_dimensions, reconstruye la colección"
+            )
+
+    def add(self, ids: Sequence[str], embeddings: np.ndarray, groups: Sequence[Optional[str]]):
+        """
+        Añade vectores al índice
+
+        Args:
+            ids: IDs de los documentos
+            embeddings: Matriz float32 con una fila por documento
+            groups: Grupo de cada documento para filtrar (conversation_id o None)
+
+        Raises:
+            ValueError: Si las dimensiones no coinciden con las del índice
+        """
+        if not len(ids):
+            return
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        codes, scales, norms = self._quantize(embeddings)
+        with self._lock:
+            self._check_dimensions(embeddings.shape[1])
+            if self.dimensions is None:
+                self.dimensions = embeddings.shape[1]
+            self._ids.extend(ids)
+            self._id_set.update(ids)
+            self._groups.extend(groups)
+            self._codes.append(codes)
+            self._scales.append(scales)
+            self._norms.append(norms)
+            self._matrix = None
+
+    def remove(self, ids: Sequence[str]):
+        """
+        Quita vectores del índice
+
+        Args:
+            ids: IDs de los documentos a quitar
+        """
+        with self._lock:
+            removed = self._id_set.intersection(ids)
+            if not removed:
+                return
+            self._consolidate()
+            if self._matrix is None:
+                return
+            keep = np.array([doc_id not in removed for doc_id in self._ids], dtype=bool)
+            self._id_set -= removed
+            self._ids = [doc_id for doc_id, kept in zip(self._ids, keep) if kept]
+            self._groups = [group for group, kept in zip(self._groups, keep) if kept]
+            if not self._ids:
+                self.dimensions = None
+                self._codes, self._scales, self._norms = [], [], []
+            else:
+                self._codes = [self._matrix[keep]]
+                # Los índices binarios no tienen escalas ni normas (vectores vacíos)
+                scales = self._scale_vector[keep] if self._scale_vector.size else self._scale_vector
+                norms = self._norm_vector[keep] if self._norm_vector.size else self._norm_vector
+                self._scales = [scales]
+                self._norms = [norms]
+            self._matrix = None
+
+    def clear(self):
+        """Vacía el índice"""
+        with self._lock:
+            self.dimensions = None
+            self._ids, self._groups, self._codes, self._scales, self._norms = [], [], [], [], []
+            self._id_set = set()
+            self._matrix = None
+
+    def _consolidate(self):
+        """Une los bloques añadidos en una sola matriz. Debe llamarse con el lock adquirido."""
+        if self._matrix is None and self._codes:
+            self._matrix = np.concatenate(self._codes)
+            self._scale_vector = np.concatenate(self._scales)
+            self._norm_vector = np.concatenate(self._norms)
+            self._group_array = np.array(self._groups, dtype=object)
+            self._codes, self._scales = [self._matrix], [self._scale_vector]
+            self._norms = [self._norm_vector]
+
+    def _approximate_distances(self, query: np.ndarray, rows: slice) -> np.ndarray:
+        """Distancia aproximada (menor = más cercano) de un bloque de filas"""
+        codes = self._matrix[rows]
+        if self.quantization == QUANTIZATION_BINARY:
+            query_bits = np.packbits(query > 0)
+            return _POPCOUNT[np.bitwise_xor(codes, query_bits)].sum(axis=1)
+        # L2 al cuadrado aproximada: |x|^2 - 2 x·q (|q|^2 es igual para todas las filas)
+        dot = (codes.astype(np.float32) @ query) * self._scale_vector[rows]
+        return self._norm_vector[rows] - 2 * dot
+
+    def search(self, query: np.ndarray, k: int, group: Optional[str] = None) -> List[str]:
+        """
+        Preselecciona los k candidatos más cercanos a la consulta
+
+        Args:
+            query: Vector float32 de la consulta (ya truncado, si procede)
+            k: Número de candidatos
+            group: Grupo al que restringir la búsqueda (opcional)
+
+        Returns:
+            IDs de los candidatos, sin ordenar
+
+        Raises:
+            ValueError: Si la consulta no tiene las dimensiones del índice
+        """
+        with self._lock:
+            self._consolidate()
+            if self._matrix is None or k <= 0:
+                return []
+            self._check_dimensions(query.shape[-1])
+            total = self._matrix.shape[0]
+            distances = np.concatenate([
+                self._approximate_distances(query, slice(start, start + SCORE_CHUNK_ROWS))
+                for start in range(0, total, SCORE_CHUNK_ROWS)
+            ]).astype(np.float32)
+            if group is not None:
+                distances[self._group_array != group] = np.inf
+            k = min(k, total)
+            candidates = np.argpartition(distances, k - 1)[:k]
+            return [self._ids[i] for i in candidates if np.isfinite(distances[i])]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Obtiene el tamaño del índice
+
+        Returns:
+            Diccionario con cuantización, vectores, dimensiones y bytes en memoria
+        """
+        with self._lock:
+            code_bytes = sum(codes.nbytes for codes in self._codes)
+            scale_bytes = sum(scales.nbytes for scales in self._scales)
+            scale_bytes += sum(norms.nbytes for norms in self._norms)
+            return {
+                "quantization": self.quantization,
+                "vectors": len(self._ids),
+                "dimensions": self.dimensions,
+                "memory_bytes": code_bytes + scale_bytes
+            }
@@ -0,0 +1,211 @@
+"""
+Precarga (warm-up) de los modelos de Ollama
+
+Carga el modelo de generación y el de embeddings en cada backend al arrancar
+con peticiones de cero tokens, los fija en memoria con keep_alive y vigila
+/api/ps para volver a cargarlos si Ollama los descarga. El servidor solo se
+declara listo cuando todos los modelos están cargados.
+"""
+import asyncio
+import logging
+import time
+from typing import Dict, List, Optional, Any, Set, Tuple
+import httpx
+from app.config import settings
+from app.metrics import metrics
+from app.services.http_client import OllamaHttpClient, ollama_http_client
+from app.services.model_router import configured_models
+
+logger = logging.getLogger(__name__)
+
+# Tipos de modelo a precargar
+MODEL_KIND_GENERATION = "generation"
+MODEL_KIND_EMBEDDING = "embedding"
+# Timeout de las consultas a /api/ps (segundos)
+PS_TIMEOUT_SECONDS = 2.0
+
+
+class ModelWarmupService:
+    """Gestor de precarga y keep-alive de los modelos en cada backend"""
+
+    def __init__(
+        self,
+        generation_urls: List[str],
+        embedding_urls: List[str],
+        http_client: Optional[OllamaHttpClient] = None
+    ):
+        self.http_client = http_client or ollama_http_client
+        # (tipo, url, modelo) de cada modelo a mantener cargado
+        self.targets: List[Tuple[str, str, str]] = [
+            (MODEL_KIND_GENERATION, url, model)
+            for url in generation_urls
+            for model in configured_models()
+        ] + [
+            (MODEL_KIND_EMBEDDING, url, settings.embedding_model) for url in embedding_urls
+        ]
+        self.interval = settings.ollama_warmup_interval_seconds
+        self._warm: Dict[Tuple[str, str], bool] = {
+            (url, model): False for _, url, model in self.targets
+        }
+        self._last_warmup: Dict[Tuple[str, str], float] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def _matches(loaded_name: str, model: str) -> bool:
+        """Compara un nombre de /api/ps con el modelo configurado (tag latest implícito)"""
+        return loaded_name == model or loaded_name == f"{model}:latest"
+
+    async def _warm_model(self, client: httpx.AsyncClient, kind: str, url: str, model: str) -> bool:
+        """
+        Carga un modelo en un backend sin generar tokens
+
+        Args:
+            client: Cliente HTTP
+            kind: Tipo de modelo (generación o embeddings)
+            url: URL del backend
+            model: Nombre del modelo
+
+        Returns:
+            True si el modelo quedó cargado
+        """
+        # Prompt/entrada vacíos: Ollama carga el modelo y responde sin generar
+        if kind == MODEL_KIND_GENERATION:
+            endpoint = f"{url}/api/generate"
+            # Mismo num_ctx inicial que asume el dimensionado adaptativo: sin recarga
+            payload = {
+                "model": model,
+                "prompt": "",
+                "stream": False,
+                "options": {"num_ctx": min(settings.llm_num_ctx_buckets)}
+            }
+        else:
+            endpoint = f"{url}/api/embed"
+            payload = {"model": model, "input": []}
+        payload["keep_alive"] = settings.ollama_keep_alive
+
+        labels = {"backend": url, "model": model}
+        started_at = time.monotonic()
+        try:
+            response = await client.post(
+                endpoint, json=payload, timeout=settings.ollama_warmup_timeout_seconds
+            )
+            response.raise_for_status()
+        except Exception as e:
+            metrics.increment("ollama_model_warmups_total", labels={**labels, "result": "error"})
+            logger.warning(f"No se pudo precargar {model} en {url}: {str(e)}")
+            return False
+
+        elapsed = time.monotonic() - started_at
+        metrics.increment("ollama_model_warmups_total", labels={**labels, "result": "ok"})
+        metrics.observe("ollama_model_warmup_seconds", elapsed, labels=labels)
+        logger.info(f"Modelo {model} precargado en {url} en {elapsed:.1f}s")
+        return True
+
+    async def _loaded_models(self, client: httpx.AsyncClient, url: str) -> Optional[Set[str]]:
+        """
+        Consulta los modelos cargados en un backend
+
+        Args:
+            client: Cliente HTTP
+            url: URL del backend
+
+        Returns:
+            Nombres de los modelos cargados, o None si el backend no responde
+        """
+        try:
+            response = await client.get(f"{url}/api/ps", timeout=PS_TIMEOUT_SECONDS)
+            response.raise_for_status()
+            return {entry.get("name", "") for entry in response.json().get("models", [])}
+        except Exception:
+            return None
+
+    async def refresh(self, client: httpx.AsyncClient):
+        """
+        Comprueba qué modelos siguen cargados y precarga los que no lo están
+
+        Args:
+            client: Cliente HTTP
+        """
+        loaded_by_url = {}
+        for url in {url for _, url, _ in self.targets}:
+            loaded_by_url[url] = await self._loaded_models(client, url)
+
+        pending = []
+        for kind, url, model in self.targets:
+            loaded = loaded_by_url[url]
+            is_loaded = loaded is not None and any(self._matches(name, model) for name in loaded)
+            if is_loaded:
+                self._set_warm(url, model, True)
+                continue
+            if self._warm[(url, model)]:
+                metrics.increment("ollama_model_unloads_detected_total",
+                                  labels={"backend": url, "model": model})
+                logger.warning(f"Modelo {model} descargado en {url}; volviendo a precargar")
+            self._set_warm(url, model, False)
+            pending.append((kind, url, model))
+
+        results = await asyncio.gather(
+            *(self._warm_model(client, kind, url, model) for kind, url, model in pending)
+        )
+        for (_, url, model), warm in zip(pending, results):
+            self._set_warm(url, model, warm)
+            if warm:
+                self._last_warmup[(url, model)] = time.time()
+
+    async def _refresh_loop(self):
+        """Bucle de precarga inicial y vigilancia periódica"""
+        while True:
+            try:
+                await self.refresh(self.http_client.client)
+            except Exception as e:
+                logger.error(f"Error en la precarga de modelos: {str(e)}")
+            await asyncio.sleep(self.interval)
+
+    def _set_warm(self, url: str, model: str, warm: bool):
+        """Actualiza el estado de un modelo y su métrica"""
+        self._warm[(url, model)] = warm
+        metrics.set_gauge("ollama_model_warm", 1 if warm else 0,
+                          labels={"backend": url, "model": model})
+
+    def is_ready(self) -> bool:
+        """Indica si todos los modelos están cargados (siempre True si está desactivado)"""
+        return not settings.ollama_warmup_enable or all(self._warm.values())
+
+    async def start(self):
+        """Inicia la precarga y la vigilancia en segundo plano"""
+        if settings.ollama_warmup_enable and self._task is None:
+            self._task = asyncio.create_task(self._refresh_loop())
+            logger.info("Precarga de modelos iniciada en segundo plano")
+
+    async def close(self):
+        """Detiene la vigilancia de modelos"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def get_status(self) -> Dict[str, Any]:
+        """
+        Obtiene el estado de precarga de los modelos
+
+        Returns:
+            Diccionario con el estado general y el de cada modelo por backend
+        """
+        return {
+            "enabled": settings.ollama_warmup_enable,
+            "ready": self.is_ready(),
+            "keep_alive": settings.ollama_keep_alive,
+            "models": [
+                {
+                    "kind": kind,
+                    "backend": url,
+                    "model": model,
+                    "warm": self._warm[(url, model)],
+                    "last_warmup": self._last_warmup.get((url, model))
+                }
+                for kind, url, model in self.targets
+            ]
+        }
@@ -0,0 +1,457 @@
+"""
+Benchmarks de rendimiento del servidor de IA
+
+Ejecutan los servicios directamente (sin pasar por la API) contra el Ollama
+configurado en .env.
+"""
+import argparse
+import asyncio
+import shutil
+import statistics
+import tempfile
+import time
+import tracemalloc
+import uuid
+from typing import Dict, List
+
+import chromadb
+import numpy as np
+from chromadb.config import Settings as ChromaSettings
+from langchain_core.documents import Document
+
+from app.config import settings
+from app.services.embedding_backends import create_embedding_backend
+from app.services.llm_service import LLMService
+from app.services.vector_db_service import VectorDatabaseService
+from app.services.vector_index import (
+    QUANTIZATION_BINARY,
+    QUANTIZATION_INT8,
+    QuantizedVectorIndex,
+    rescore,
+    squared_l2,
+    truncate_embeddings,
+)
+
+# Preguntas de una conversación de ejemplo (se repiten si hacen falta más turnos)
+CONVERSATION_QUESTIONS = [
+    "Hola, ¿qué lugares me recomiendas visitar en Formosa?",
+    "¿Cuál es la mejor época del año para ir?",
+    "¿Qué puedo hacer en el Bañado La Estrella?",
+    "¿Cómo llego desde la capital?",
+    "¿Hay alojamiento cerca?",
+    "¿Qué comidas típicas debería probar?",
+    "¿Qué fiestas populares hay durante el año?",
+    "¿Es recomendable ir con niños?",
+    "¿Qué debo llevar en la mochila?",
+    "Resume en una frase todo lo que me recomendaste.",
+]
+
+
+async def _run_conversation(
+    llm_service: LLMService,
+    mode: str,
+    turns: int,
+    max_tokens: int
+) -> List[float]:
+    """
+    Ejecuta una conversación y mide el tiempo hasta el primer token de cada turno
+
+    Args:
+        llm_service: Servicio LLM
+        mode: "off" (historial reenviado como contexto) o "context" (continuación)
+        turns: Número de turnos
+        max_tokens: Máximo de tokens por respuesta
+
+    Returns:
+        Lista de segundos hasta el primer token por turno
+    """
+    settings.llm_continuation_mode = mode
+    conversation_id = str(uuid.uuid4())
+    history: List[Dict[str, str]] = []
+    ttfts = []
+
+    for turn in range(turns):
+        question = CONVERSATION_QUESTIONS[turn % len(CONVERSATION_QUESTIONS)]
+        continuation = llm_service.get_continuation(conversation_id)
+        context = None
+        if continuation is None and history:
+            context = llm_service.format_context([
+                {"content": f"Usuario: {h['user']}\nAsistente: {h['assistant']}"}
+                for h in history
+            ])
+
+        started_at = time.perf_counter()
+        first_token_at = None
+        chunks = []
+        async for chunk in llm_service.generate_streaming_response(
+            question,
+            context=context,
+            max_tokens=max_tokens,
+            conversation_id=conversation_id,
+            continuation=continuation
+        ):
+            if first_token_at is None:
+                first_token_at = time.perf_counter()
+            chunks.append(chunk)
+
+        ttft = (first_token_at or time.perf_counter()) - started_at
+        ttfts.append(ttft)
+        history.append({"user": question, "assistant": "".join(chunks).strip()})
+        print(f"  [{mode}] turno {turn + 1}: TTFT {ttft * 1000:.0f} ms")
+
+    return ttfts
+
+
+async def benchmark_ttft(turns: int, max_tokens: int, repeats: int):
+    """
+    Compara el tiempo hasta el primer token del último turno de una conversación
+    reenviando el historial completo frente a la continuación con contexto KV
+
+    Args:
+        turns: Turnos por conversación (se informa el último)
+        max_tokens: Máximo de tokens por respuesta
+        repeats: Conversaciones por modo
+    """
+    llm_service = LLMService()
+    results: Dict[str, List[float]] = {"off": [], "context": []}
+
+    for repeat in range(repeats):
+        for mode in results:
+            print(f"🔄 Conversación {repeat + 1}/{repeats} en modo '{mode}'")
+            ttfts = await _run_conversation(llm_service, mode, turns, max_tokens)
+            results[mode].append(ttfts[-1])
+
+    print(f"\n📊 TTFT en el turno {turns} ({repeats} conversaciones por modo):")
+    for mode, values in results.items():
+        print(
+            f"  {mode:>8}: mediana {statistics.median(values) * 1000:.0f} ms, "
+            f"mín {min(values) * 1000:.0f} ms, máx {max(values) * 1000:.0f} ms"
+        )
+    speedup = statistics.median(results["off"]) / max(statistics.median(results["context"]), 1e-9)
+    print(f"  Mejora con continuación: x{speedup:.2f}")
+
+
+def _ingest(
+    mode: str,
+    batches: List[List[str]],
+    matrices: List,
+    collection
+) -> Dict[str, float]:
+    """
+    Mide memoria y tiempo de ingesta de los embeddings en una colección
+
+    Args:
+        mode: "listas" (List[List[float]]) o "numpy" (matrices float32)
+        batches: Textos de cada lote
+        matrices: Matriz float32 de embeddings de cada lote
+        collection: Colección de ChromaDB de destino
+
+    Returns:
+        Segundos de ingesta y pico de memoria de los embeddings retenidos
+    """
+    tracemalloc.start()
+    held = [matrix.tolist() if mode == "listas" else matrix.copy() for matrix in matrices]
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    started_at = time.perf_counter()
+    for texts, embeddings in zip(batches, held):
+        collection.add(
+            ids=[str(uuid.uuid4()) for _ in texts],
+            documents=texts,
+            embeddings=embeddings
+        )
+    return {"seconds": time.perf_counter() - started_at, "peak_bytes": peak}
+
+
+async def benchmark_ingest(documents: int, batch_size: int, backend: str):
+    """
+    Compara memoria y rendimiento de la ingesta masiva con embeddings como
+    listas de floats de Python frente a matrices NumPy float32
+
+    Args:
+        documents: Número de documentos sintéticos
+        batch_size: Documentos por lote
+        backend: Backend de embeddings (ollama, onnx o stub)
+    """
+    embedding_backend = create_embedding_backend(backend)
+    texts = [
+        f"Documento {i}: {CONVERSATION_QUESTIONS[i % len(CONVERSATION_QUESTIONS)]}"
+        for i in range(documents)
+    ]
+    batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+
+    print(f"🔄 Generando embeddings de {documents} documentos con '{embedding_backend.model}'")
+    started_at = time.perf_counter()
+    matrices = [await embedding_backend.embed(batch) for batch in batches]
+    embed_seconds = time.perf_counter() - started_at
+    await embedding_backend.close()
+    dimensions = matrices[0].shape[1]
+    print(f"  {documents / embed_seconds:.0f} docs/s de embeddings ({dimensions} dimensiones)")
+
+    results = {}
+    for mode in ("listas", "numpy"):
+        directory = tempfile.mkdtemp(prefix="bench_chroma_")
+        try:
+            client = chromadb.PersistentClient(
+                path=directory, settings=ChromaSettings(anonymized_telemetry=False)
+            )
+            collection = client.get_or_create_collection(f"bench_{mode}")
+            results[mode] = _ingest(mode, batches, matrices, collection)
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    print(f"\n📊 Ingesta de {documents} documentos en lotes de {batch_size}:")
+    for mode, result in results.items():
+        print(
+            f"  {mode:>7}: {documents / result['seconds']:.0f} docs/s, "
+            f"memoria {result['peak_bytes'] / 1024 / 1024:.1f} MB "
+            f"({result['peak_bytes'] / documents / 1024:.1f} KB por vector)"
+        )
+    ratio = results["listas"]["peak_bytes"] / max(results["numpy"]["peak_bytes"], 1)
+    print(f"  Memoria de listas frente a float32: x{ratio:.1f}")
+
+
+async def benchmark_recall(
+    documents: int,
+    queries: int,
+    k: int,
+    rescore_factors: List[int],
+    backend: str
+):
+    """
+    Compara recall@k, latencia y memoria por vector de las combinaciones de
+    truncado Matryoshka y cuantización frente a la búsqueda exacta en float32
+
+    Las consultas son documentos de la colección con ruido añadido, y la
+    referencia es la búsqueda exacta con los vectores completos.
+
+    Args:
+        documents: Número de documentos sintéticos
+        queries: Número de consultas
+        k: Resultados por consulta
+        rescore_factors: Factores de candidatos reordenados (k * factor)
+        backend: Backend de embeddings (ollama, onnx o stub)
+    """
+    embedding_backend = create_embedding_backend(backend)
+    texts = [
+        f"Documento {i}: {CONVERSATION_QUESTIONS[i % len(CONVERSATION_QUESTIONS)]}"
+        for i in range(documents)
+    ]
+    print(f"🔄 Generando embeddings de {documents} documentos con '{embedding_backend.model}'")
+    matrix = np.concatenate([
+        await embedding_backend.embed(texts[i:i + 64]) for i in range(0, documents, 64)
+    ])
+    await embedding_backend.close()
+    dimensions = matrix.shape[1]
+    ids = [str(i) for i in range(documents)]
+
+    rng = np.random.default_rng(0)
+    picked = matrix[rng.integers(0, documents, queries)]
+    query_matrix = truncate_embeddings(
+        picked + rng.standard_normal(picked.shape).astype(np.float32) * (0.5 / np.sqrt(dimensions)),
+        dimensions
+    )
+    truth = [set(np.argsort(squared_l2(q, matrix))[:k].tolist()) for q in query_matrix]
+
+    print(f"\n📊 recall@{k} con {documents} documentos y {queries} consultas:")
+    print(f"  {'dims':>5} {'precisión':>10} {'reorden':>8} {'recall':>7} {'ms/consulta':>12} {'bytes/vector':>13}")
+    for dims in [d for d in (dimensions, 512, 256) if d <= dimensions]:
+        vectors = truncate_embeddings(matrix, dims)
+        truncated_queries = truncate_embeddings(query_matrix, dims)
+        configs = [("float32", None)] + [
+            (quantization, factor)
+            for quantization in (QUANTIZATION_INT8, QUANTIZATION_BINARY)
+            for factor in rescore_factors
+        ]
+        for precision, factor in configs:
+            index = None
+            memory = vectors.nbytes
+            if factor is not None:
+                index = QuantizedVectorIndex(precision)
+                index.add(ids, vectors, [None] * documents)
+                memory = index.get_stats()["memory_bytes"]
+
+            hits = 0
+            started_at = time.perf_counter()
+            for query, expected in zip(truncated_queries, truth):
+                if index is None:
+                    found = np.argsort(squared_l2(query, vectors))[:k].tolist()
+                else:
+                    candidates = [int(i) for i in index.search(query, k * factor)]
+                    found = [int(i) for i, _ in rescore(query, candidates, vectors[candidates], k)]
+                hits += len(expected.intersection(found))
+            elapsed = time.perf_counter() - started_at
+
+            print(
+                f"  {dims:>5} {precision:>10} {('x' + str(factor)) if factor else '-':>8} "
+                f"{hits / (k * queries):>7.3f} {elapsed / queries * 1000:>12.2f} "
+                f"{memory / documents:>13.0f}"
+            )
+
+
+async def _vector_db_load(vector_db_service: VectorDatabaseService, dimensions: int, stop: asyncio.Event) -> int:
+    """
+    Escribe y busca en la base vectorial sin pausa hasta que se pida parar
+
+    Returns:
+        Número de operaciones completadas
+    """
+    rng = np.random.default_rng(1)
+    operations = 0
+    while not stop.is_set():
+        embeddings = rng.standard_normal((256, dimensions)).astype(np.float32)
+        await vector_db_service.add_documents(
+            [Document(page_content=f"carga {operations}-{i}") for i in range(256)],
+            embeddings
+        )
+        for query in embeddings[:4]:
+            await vector_db_service.search_similar_documents(query, n_results=5)
+        operations += 5
+        # Ceder el loop entre operaciones, como peticiones independientes
+        await asyncio.sleep(0)
+    return operations
+
+
+async def benchmark_jitter(streams: int, max_tokens: int, documents: int, dimensions: int):
+    """
+    Compara la irregularidad entre tokens del streaming mientras la base
+    vectorial escribe y busca, con ChromaDB en el event loop frente al pool
+    de hilos acotado; "sin carga" es la referencia sin operaciones
+
+    Args:
+        streams: Respuestas en streaming concurrentes por modo
+        max_tokens: Máximo de tokens por respuesta
+        documents: Documentos precargados en la colección
+        dimensions: Dimensiones de los vectores sintéticos
+    """
+    # Los streams se generan a la vez (requiere OLLAMA_NUM_PARALLEL >= streams en Ollama)
+    settings.llm_max_concurrency_per_backend = max(settings.llm_max_concurrency_per_backend, streams)
+    llm_service = LLMService()
+    rng = np.random.default_rng(0)
+    workers = settings.vector_store_workers or 4
+    settings.vector_index_quantization = "none"
+
+    results: Dict[str, List[float]] = {}
+    for mode, mode_workers in (("sin carga", None), ("loop", 0), ("pool", workers)):
+        directory = tempfile.mkdtemp(prefix="bench_chroma_")
+        settings.chroma_persist_directory = directory
+        settings.vector_store_workers = mode_workers or 0
+        vector_db_service = VectorDatabaseService()
+        try:
+            print(f"🔄 Modo '{mode}'")
+            for start in range(0, documents if mode_workers is not None else 0, 1000):
+                count = min(1000, documents - start)
+                await vector_db_service.add_documents(
+                    [Document(page_content=f"documento {start + i}") for i in range(count)],
+                    rng.standard_normal((count, dimensions)).astype(np.float32)
+                )
+
+            gaps: List[float] = []
+
+            async def stream(index: int):
+                last_at = None
+                async for _ in llm_service.generate_streaming_response(
+                    CONVERSATION_QUESTIONS[index % len(CONVERSATION_QUESTIONS)],
+                    max_tokens=max_tokens
+                ):
+                    now = time.perf_counter()
+                    if last_at is not None:
+                        gaps.append(now - last_at)
+                    last_at = now
+
+            stop = asyncio.Event()
+            load = None
+            if mode_workers is not None:
+                load = asyncio.create_task(_vector_db_load(vector_db_service, dimensions, stop))
+            await asyncio.gather(*(stream(i) for i in range(streams)))
+            stop.set()
+            operations = await load if load is not None else 0
+            results[mode] = gaps
+            print(f"  {len(gaps)} intervalos entre tokens, {operations} operaciones de la base vectorial")
+        finally:
+            vector_db_service.close()
+            shutil.rmtree(directory, ignore_errors=True)
+
+    print(f"\n📊 Intervalo entre tokens con {streams} streams y carga de la base vectorial:")
+    for mode, gaps in results.items():
+        ordered = sorted(gaps)
+        print(
+            f"  {mode:>9}: p50 {ordered[len(ordered) // 2] * 1000:.1f} ms, "
+            f"p99 {ordered[int(len(ordered) * 0.99)] * 1000:.1f} ms, "
+            f"máx {ordered[-1] * 1000:.1f} ms, desviación {statistics.pstdev(gaps) * 1000:.1f} ms"
+        )
+
+
+def main():
+    """Función principal"""
+    parser = argparse.ArgumentParser(description="Benchmarks del servidor de IA")
+
+    subparsers = parser.add_subparsers(dest="command", help="Benchmarks disponibles")
+
+    # Benchmark ttft
+    ttft_parser = subparsers.add_parser(
+        "ttft", help="TTFT de conversaciones largas: prompt completo vs continuación"
+    )
+    ttft_parser.add_argument("--turns", type=int, default=10, help="Turnos por conversación")
+    ttft_parser.add_argument("--max-tokens", type=int, default=64, help="Máximo de tokens por respuesta")
+    ttft_parser.add_argument("--repeats", type=int, default=3, help="Conversaciones por modo")
+
+    # Benchmark ingest
+    ingest_parser = subparsers.add_parser(
+        "ingest", help="Memoria y rendimiento de ingesta: listas de floats vs float32"
+    )
+    ingest_parser.add_argument("--documents", type=int, default=2000, help="Documentos sintéticos")
+    ingest_parser.add_argument("--batch-size", type=int, default=64, help="Documentos por lote")
+    ingest_parser.add_argument(
+        "--backend", default=settings.embedding_backend,
+        choices=["ollama", "onnx", "stub"], help="Backend de embeddings"
+    )
+
+    # Benchmark recall
+    recall_parser = subparsers.add_parser(
+        "recall", help="Recall vs latencia/memoria: truncado Matryoshka y cuantización"
+    )
+    recall_parser.add_argument("--documents", type=int, default=5000, help="Documentos sintéticos")
+    recall_parser.add_argument("--queries", type=int, default=200, help="Consultas")
+    recall_parser.add_argument("--k", type=int, default=5, help="Resultados por consulta")
+    recall_parser.add_argument(
+        "--rescore-factors", default="1,4,10",
+        help="Factores de candidatos reordenados, separados por comas"
+    )
+    recall_parser.add_argument(
+        "--backend", default=settings.embedding_backend,
+        choices=["ollama", "onnx", "stub"], help="Backend de embeddings"
+    )
+
+    # Benchmark jitter
+    jitter_parser = subparsers.add_parser(
+        "jitter", help="Jitter entre tokens con ChromaDB en el event loop vs pool de hilos"
+    )
+    jitter_parser.add_argument("--streams", type=int, default=4, help="Streams concurrentes")
+    jitter_parser.add_argument("--max-tokens", type=int, default=128, help="Máximo de tokens por respuesta")
+    jitter_parser.add_argument("--documents", type=int, default=20000, help="Documentos precargados")
+    jitter_parser.add_argument("--dimensions", type=int, default=768, help="Dimensiones de los vectores")
+
+    args = parser.parse_args()
+
+    if args.command == "ttft":
+        asyncio.run(benchmark_ttft(args.turns, args.max_tokens, args.repeats))
+    elif args.command == "ingest":
+        asyncio.run(benchmark_ingest(args.documents, args.batch_size, args.backend))
+    elif args.command == "recall":
+        asyncio.run(benchmark_recall(
+            args.documents,
+            args.queries,
+            args.k,
+            [int(factor) for factor in args.rescore_factors.split(",")],
+            args.backend
+        ))
+    elif args.command == "jitter":
+        asyncio.run(benchmark_jitter(args.streams, args.max_tokens, args.documents, args.dimensions))
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
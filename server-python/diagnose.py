@@ -8,6 +8,9 @@ import json
 import requests
 from pathlib import Path
 
+# Sesión HTTP reutilizada por todas las comprobaciones (conexiones keep-alive)
+http_session = requests.Session()
+
 
 def print_header(title: str):
     """Imprime un encabezado formateado"""
@@ -105,7 +108,7 @@ def check_ollama_connection():
     print_header("VERIFICACIÓN DE OLLAMA")
     
     try:
-        response = requests.get("http://localhost:11434/api/tags", timeout=5)
+        response = http_session.get("http://localhost:11434/api/tags", timeout=5)
         if response.status_code == 200:
             print("✅ Ollama está ejecutándose")
             
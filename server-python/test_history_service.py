@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Pruebas del historial de conversaciones: últimos N turnos desde el buffer en
+memoria o desde SQLite, rangos de turnos y persistencia del resumen
+"""
+import asyncio
+import os
+
+from app.services.history_service import ConversationHistoryService
+
+
+def _service(tmp_path, **kwargs) -> ConversationHistoryService:
+    return ConversationHistoryService(db_path=os.path.join(tmp_path, "history.sqlite3"), **kwargs)
+
+
+async def _append(service: ConversationHistoryService, conversation_id: str, count: int):
+    for i in range(count):
+        await service.append_turn(conversation_id, f"pregunta {i}", f"respuesta {i}")
+
+
+def test_recent_turns_in_order_with_consecutive_indexes(tmp_path):
+    async def main():
+        service = _service(tmp_path, buffer_size=5)
+        await _append(service, "a", 8)
+        await _append(service, "b", 2)
+
+        recent = await service.get_recent_turns("a", limit=3)
+        assert [turn["turn_index"] for turn in recent] == [5, 6, 7]
+        assert recent[-1]["user_message"] == "pregunta 7"
+
+        # Más turnos de los que caben en el buffer: se completan desde SQLite
+        recent = await service.get_recent_turns("a", limit=7)
+        assert [turn["turn_index"] for turn in recent] == list(range(1, 8))
+
+        assert [turn["turn_index"] for turn in await service.get_recent_turns("b", limit=10)] == [0, 1]
+        assert await service.get_recent_turns("desconocida", limit=3) == []
+        service.close()
+
+    asyncio.run(main())
+
+
+def test_history_survives_restart(tmp_path):
+    async def main():
+        service = _service(tmp_path, buffer_size=4)
+        await _append(service, "a", 6)
+        await service.save_summary("a", "resumen", 2)
+        service.close()
+
+        reopened = _service(tmp_path, buffer_size=4)
+        state = await reopened.get_summary("a")
+        assert state == {"summary": "resumen", "summarized_until": 2, "next_index": 6}
+
+        # Los índices continúan donde quedaron
+        turn = await reopened.append_turn("a", "otra", "más")
+        assert turn["turn_index"] == 6
+
+        turns = await reopened.get_turns_range("a", 2, 5)
+        assert [t["turn_index"] for t in turns] == [2, 3, 4]
+        reopened.close()
+
+    asyncio.run(main())
+
+
+def test_evicted_conversation_reloads_from_sqlite(tmp_path):
+    async def main():
+        service = _service(tmp_path, buffer_size=10, max_active_conversations=1)
+        await _append(service, "a", 3)
+        await _append(service, "b", 1)
+
+        # "a" salió de memoria al activarse "b"; su historial sigue completo
+        recent = await service.get_recent_turns("a", limit=10)
+        assert [turn["turn_index"] for turn in recent] == [0, 1, 2]
+        turn = await service.append_turn("a", "nueva", "respuesta")
+        assert turn["turn_index"] == 3
+        service.close()
+
+    asyncio.run(main())
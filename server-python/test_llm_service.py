@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Pruebas de aislamiento de las opciones de generación por invocación
+
+Las cadenas precompiladas de LLMService comparten un único RequestScopedOllamaLLM
+por backend; cada petición pasa sus opciones en config["configurable"]. Se
+sustituye el cliente asíncrono de Ollama por uno falso que registra los
+parámetros que recibiría el servidor.
+"""
+import asyncio
+import random
+from typing import Any, Dict, List
+
+from app.services.llm_service import LLMService
+
+CONCURRENT_CALLS = 40
+
+
+class FakeOllamaClient:
+    """Cliente asíncrono que responde con eco de las opciones recibidas"""
+
+    def __init__(self):
+        self.requests: List[Dict[str, Any]] = []
+
+    async def generate(self, **params):
+        self.requests.append(params)
+        options = params["options"]
+        tag = f"{options['temperature']}|{options['num_predict']}|{','.join(options['stop'] or [])}"
+
+        async def stream():
+            for token in (tag[:4], tag[4:]):
+                # Pausas aleatorias para entrelazar las peticiones concurrentes
+                await asyncio.sleep(random.uniform(0, 0.005))
+                yield {"response": token, "done": False}
+            yield {"response": "", "done": True, "done_reason": "stop", "eval_count": 2}
+
+        return stream()
+
+
+def _request_parameters(index: int) -> Dict[str, Any]:
+    """Parámetros distintos para cada llamada"""
+    return {
+        "temperature": round(0.05 * (index % 20), 2),
+        "max_tokens": 10 + index,
+        "stop": [f"<fin-{index}>", f"\nUsuario{index}:"]
+    }
+
+
+def _expected_tag(parameters: Dict[str, Any]) -> str:
+    return f"{parameters['temperature']}|{parameters['max_tokens']}|{','.join(parameters['stop'])}"
+
+
+def _setup_service():
+    service = LLMService()
+    url = service.pool.urls[0]
+    llm = service.llms[url]
+    client = FakeOllamaClient()
+    llm._async_client = client
+    return service, url, llm, client
+
+
+def _run_concurrently(streaming: bool):
+    service, url, llm, client = _setup_service()
+    snapshot = llm.model_dump()
+
+    async def call(index: int):
+        parameters = _request_parameters(index)
+        config = service._invocation_config(
+            parameters["temperature"],
+            parameters["max_tokens"],
+            parameters["stop"]
+        )
+        chain = service.chains[url]["chat"]
+        input_vars = {"question": f"pregunta {index}"}
+        if streaming:
+            chunks = [chunk async for chunk in chain.astream(input_vars, config=config)]
+            return parameters, "".join(chunks)
+        return parameters, await chain.ainvoke(input_vars, config=config)
+
+    async def main():
+        return await asyncio.gather(*(call(i) for i in range(CONCURRENT_CALLS)))
+
+    results = asyncio.run(main())
+
+    # Cada llamada recibe la respuesta generada con sus propias opciones
+    for parameters, response in results:
+        assert response == _expected_tag(parameters)
+
+    # Y cada petición a Ollama lleva exactamente las opciones de su llamada
+    assert len(client.requests) == CONCURRENT_CALLS
+    for index in range(CONCURRENT_CALLS):
+        parameters = _request_parameters(index)
+        prompt = service.chat_prompt.format(question=f"pregunta {index}")
+        options = next(r["options"] for r in client.requests if r["prompt"] == prompt)
+        assert options["temperature"] == parameters["temperature"]
+        assert options["num_predict"] == parameters["max_tokens"]
+        assert options["stop"] == parameters["stop"]
+
+    # El modelo compartido no se modifica
+    assert llm.model_dump() == snapshot
+
+
+def test_concurrent_ainvoke_uses_per_call_options():
+    _run_concurrently(streaming=False)
+
+
+def test_concurrent_astream_uses_per_call_options():
+    _run_concurrently(streaming=True)
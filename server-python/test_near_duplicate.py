@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Pruebas de la detección de turnos casi duplicados con MinHash/LSH
+"""
+import numpy as np
+
+from app.services.near_duplicate import (
+    NearDuplicateDetector,
+    SCOPE_CONVERSATION,
+    SCOPE_GLOBAL,
+    _lsh_shape
+)
+
+TURN = (
+    "Usuario: ¿Qué lugares puedo visitar en Formosa capital?\n"
+    "Asistente: Puedes recorrer la costanera, el paseo de las artesanías "
+    "y el museo histórico, y cenar junto al río Paraguay."
+)
+REPHRASED = TURN.replace("Puedes recorrer", "Podés recorrer").upper()
+OTHER = (
+    "Usuario: ¿Cómo llego al Bañado La Estrella?\n"
+    "Asistente: Desde Las Lomitas se toma la ruta provincial 28 hacia el norte."
+)
+
+
+def _detector(**kwargs) -> NearDuplicateDetector:
+    options = {"threshold": 0.8, "global_threshold": 0.0, "num_perm": 128, "max_entries": 1000}
+    options.update(kwargs)
+    return NearDuplicateDetector(**options)
+
+
+def test_signature_is_stable_and_estimates_similarity():
+    detector = _detector()
+    assert np.array_equal(detector.signature(TURN), _detector().signature(TURN))
+    same = np.mean(detector.signature(TURN) == detector.signature(REPHRASED))
+    different = np.mean(detector.signature(TURN) == detector.signature(OTHER))
+    assert same > 0.8
+    assert different < 0.2
+
+
+def test_lsh_transition_below_threshold():
+    bands, rows = _lsh_shape(128, 0.8)
+    assert bands * rows == 128
+    assert (1 / bands) ** (1 / rows) <= 0.8
+
+
+def test_near_duplicate_suppressed_within_conversation_only():
+    detector = _detector()
+    assert detector.check("a", TURN) is None
+    duplicate = detector.check("a", REPHRASED)
+    assert duplicate["scope"] == SCOPE_CONVERSATION
+    assert duplicate["similarity"] >= 0.8
+
+    # Otra conversación y otro contenido no se suprimen
+    assert detector.check("b", TURN) is None
+    assert detector.check("a", OTHER) is None
+
+
+def test_global_scope_across_conversations():
+    detector = _detector(threshold=0.0, global_threshold=0.9)
+    assert detector.check("a", TURN) is None
+    assert detector.check("b", TURN)["scope"] == SCOPE_GLOBAL
+
+
+def test_oldest_entries_are_evicted():
+    detector = _detector(max_entries=2)
+    assert detector.check("a", TURN) is None
+    assert detector.check("a", OTHER) is None
+    assert detector.check("a", "Usuario: hola\nAsistente: ¡Hola! ¿En qué te ayudo?") is None
+
+    stats = detector.get_stats()
+    assert stats["entries"] == 2
+    # El primer turno ya no está registrado: vuelve a aceptarse
+    assert detector.check("a", TURN) is None
@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+Pruebas del planificador de generación: prioridades, reparto equitativo,
+cesión de huecos cancelados, admisión por SLO / cola llena y huecos nuevos
+al recuperarse un backend
+"""
+import asyncio
+
+import pytest
+
+from app.services.ollama_pool import OllamaBackendPool
+from app.services.scheduler_service import (
+    GenerationScheduler,
+    PRIORITY_BATCH,
+    PRIORITY_INTERACTIVE,
+    PRIORITY_STANDARD,
+    SchedulerOverloadedError
+)
+
+
+def _scheduler(**kwargs) -> GenerationScheduler:
+    options = {"max_concurrency": 1, "max_queue_size": 32, "slo_seconds": 1000.0}
+    options.update(kwargs)
+    return GenerationScheduler(backend="test", **options)
+
+
+async def _serve_in_order(scheduler: GenerationScheduler, requests):
+    """
+    Ocupa el único hueco, encola las peticiones en el orden dado y devuelve
+    el orden en que las atiende el planificador
+    """
+    served = []
+    await scheduler.acquire()
+
+    async def request(name, priority, fairness_key):
+        await scheduler.acquire(priority, fairness_key)
+        served.append(name)
+        scheduler.release()
+
+    tasks = []
+    for name, priority, fairness_key in requests:
+        tasks.append(asyncio.create_task(request(name, priority, fairness_key)))
+        # Dejar que cada petición llegue a la cola antes de crear la siguiente
+        await asyncio.sleep(0)
+    assert scheduler.get_stats()["waiting"] == len(requests)
+
+    scheduler.release()
+    await asyncio.gather(*tasks)
+    return served
+
+
+def test_higher_priority_is_served_first():
+    scheduler = _scheduler()
+    served = asyncio.run(_serve_in_order(scheduler, [
+        ("batch", PRIORITY_BATCH, "a"),
+        ("standard", PRIORITY_STANDARD, "b"),
+        ("interactive", PRIORITY_INTERACTIVE, "c"),
+    ]))
+    assert served == ["interactive", "standard", "batch"]
+
+
+def test_round_robin_between_fairness_keys():
+    scheduler = _scheduler()
+    served = asyncio.run(_serve_in_order(scheduler, [
+        ("a1", PRIORITY_STANDARD, "a"),
+        ("a2", PRIORITY_STANDARD, "a"),
+        ("a3", PRIORITY_STANDARD, "a"),
+        ("b1", PRIORITY_STANDARD, "b"),
+        ("b2", PRIORITY_STANDARD, "b"),
+    ]))
+    assert served == ["a1", "b1", "a2", "b2", "a3"]
+
+
+def test_slot_granted_to_cancelled_waiter_passes_to_next():
+    async def main():
+        scheduler = _scheduler()
+        await scheduler.acquire()
+
+        first = asyncio.create_task(scheduler.acquire(PRIORITY_STANDARD, "a"))
+        second = asyncio.create_task(scheduler.acquire(PRIORITY_STANDARD, "b"))
+        await asyncio.sleep(0)
+        assert scheduler.get_stats()["waiting"] == 2
+
+        # El hueco se asigna a la primera petición, que se cancela antes de
+        # llegar a ejecutarse: debe cedérselo a la segunda
+        scheduler.release()
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        await asyncio.wait_for(second, timeout=1)
+
+        stats = scheduler.get_stats()
+        assert stats["active"] == 1
+        assert stats["waiting"] == 0
+
+        scheduler.release()
+        assert scheduler.get_stats()["active"] == 0
+
+    asyncio.run(main())
+
+
+def test_cancelled_waiter_leaves_the_queue():
+    async def main():
+        scheduler = _scheduler()
+        await scheduler.acquire()
+        waiter = asyncio.create_task(scheduler.acquire())
+        await asyncio.sleep(0)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        assert scheduler.get_stats()["waiting"] == 0
+        scheduler.release()
+        assert scheduler.get_stats()["active"] == 0
+
+    asyncio.run(main())
+
+
+def test_admission_rejects_when_wait_exceeds_slo():
+    async def main():
+        scheduler = _scheduler(slo_seconds=5.0)
+        scheduler.service_time = 4.0
+        await scheduler.acquire()
+
+        # Un hueco ocupado, nadie en cola: espera estimada de un servicio
+        scheduler.check_admission()
+        waiter = asyncio.create_task(scheduler.acquire())
+        await asyncio.sleep(0)
+
+        # Con una petición delante la espera estimada (8s) supera el SLO
+        with pytest.raises(SchedulerOverloadedError) as error:
+            scheduler.check_admission()
+        assert error.value.retry_after == pytest.approx(8.0)
+
+        # Las de mayor prioridad no cuentan la cola de menor prioridad
+        scheduler.check_admission(PRIORITY_INTERACTIVE)
+
+        scheduler.release()
+        await waiter
+        scheduler.release()
+
+    asyncio.run(main())
+
+
+def test_admission_rejects_when_queue_is_full():
+    async def main():
+        scheduler = _scheduler(max_queue_size=1)
+        scheduler.service_time = 3.0
+        await scheduler.acquire()
+        waiter = asyncio.create_task(scheduler.acquire())
+        await asyncio.sleep(0)
+
+        with pytest.raises(SchedulerOverloadedError) as error:
+            await scheduler.acquire()
+        assert error.value.retry_after >= scheduler.service_time
+        assert scheduler.get_stats()["waiting"] == 1
+
+        scheduler.release()
+        await waiter
+        scheduler.release()
+
+    asyncio.run(main())
+
+
+def test_wake_uses_capacity_added_while_requests_wait():
+    async def main():
+        backends = {"count": 1}
+        scheduler = _scheduler(backend_count=lambda: backends["count"])
+        await scheduler.acquire()
+        waiters = [asyncio.create_task(scheduler.acquire()) for _ in range(2)]
+        await asyncio.sleep(0)
+        assert scheduler.get_stats()["waiting"] == 2
+
+        # Vuelve un backend: el hueco nuevo se asigna sin esperar a una liberación
+        backends["count"] = 2
+        scheduler.wake()
+        await asyncio.wait_for(waiters[0], timeout=1)
+        assert not waiters[1].done()
+        assert scheduler.get_stats()["active"] == 2
+
+        scheduler.release()
+        await asyncio.wait_for(waiters[1], timeout=1)
+
+    asyncio.run(main())
+
+
+def test_new_arrival_wakes_queue_when_capacity_grew():
+    async def main():
+        backends = {"count": 1}
+        scheduler = _scheduler(backend_count=lambda: backends["count"])
+        await scheduler.acquire()
+        waiting = asyncio.create_task(scheduler.acquire(PRIORITY_STANDARD, "a"))
+        await asyncio.sleep(0)
+
+        # Sin wake(): la siguiente llegada reparte los huecos libres en orden de cola
+        backends["count"] = 3
+        arrival = asyncio.create_task(scheduler.acquire(PRIORITY_STANDARD, "b"))
+        await asyncio.wait_for(asyncio.gather(waiting, arrival), timeout=1)
+        stats = scheduler.get_stats()
+        assert stats["active"] == 3
+        assert stats["waiting"] == 0
+
+    asyncio.run(main())
+
+
+def test_pool_recovery_wakes_the_scheduler():
+    class Response:
+        status_code = 200
+
+    class Client:
+        async def get(self, url, timeout):
+            return Response()
+
+    async def main():
+        pool = OllamaBackendPool("test", {"http://a:1": 1, "http://b:1": 1})
+        pool.backends[1].healthy = False
+        scheduler = _scheduler(backend_count=pool.available_count)
+        pool.on_backend_available(scheduler.wake)
+
+        await scheduler.acquire()
+        waiter = asyncio.create_task(scheduler.acquire())
+        await asyncio.sleep(0)
+        assert not waiter.done()
+
+        await pool._probe(Client(), pool.backends[1])
+        await asyncio.wait_for(waiter, timeout=1)
+        assert scheduler.get_stats()["active"] == 2
+
+    asyncio.run(main())
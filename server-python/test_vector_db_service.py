@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Pruebas de los IDs deterministas de chunks y de la eliminación de chunks
+obsoletos al volver a añadir un documento con document_key
+"""
+import asyncio
+import os
+
+import pytest
+
+from app.config import settings
+from app.services.chat_service import ChatService
+
+ORIGINAL = "\n\n".join(
+    f"Sección {i}: " + " ".join(f"palabra{i}_{j}" for j in range(120)) for i in range(4)
+)
+EDITED = ORIGINAL.replace("Sección 3:", "Sección 3 revisada:")
+
+
+@pytest.fixture
+def chat_service(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "embedding_backend", "stub")
+    monkeypatch.setattr(settings, "embedding_cache_enable", False)
+    monkeypatch.setattr(settings, "vector_index_quantization", "none")
+    monkeypatch.setattr(settings, "turn_dedup_enable", False)
+    monkeypatch.setattr(settings, "chroma_persist_directory", os.path.join(tmp_path, "chroma"))
+    monkeypatch.setattr(settings, "history_db_path", os.path.join(tmp_path, "history.sqlite3"))
+    monkeypatch.setattr(settings, "ingestion_ledger_path", os.path.join(tmp_path, "ingestion.sqlite3"))
+    service = ChatService()
+
+    # Contar los textos que llegan a vectorizarse
+    service.embedded_texts = []
+    generate_embeddings = service.embedding_service.generate_embeddings
+
+    async def counting_generate_embeddings(texts):
+        service.embedded_texts.extend(texts)
+        return await generate_embeddings(texts)
+
+    service.embedding_service.generate_embeddings = counting_generate_embeddings
+    yield service
+    service.vector_db_service.close()
+    service.ingestion_service.close()
+    service.history_service.close()
+
+
+def _stored(service: ChatService, **where):
+    found = service.vector_db_service.collection.get(where=where, include=["documents"])
+    return dict(zip(found["ids"], found["documents"]))
+
+
+def test_unchanged_document_keeps_ids_and_embeds_nothing(chat_service):
+    async def main():
+        first = await chat_service.add_document_to_context(
+            ORIGINAL, conversation_id="a", document_key="guia"
+        )
+        stored = _stored(chat_service, conversation_id="a")
+        assert first["chunks_created"] == len(stored) > 1
+        embedded = len(chat_service.embedded_texts)
+
+        again = await chat_service.add_document_to_context(
+            ORIGINAL, conversation_id="a", document_key="guia"
+        )
+        assert again["chunks_created"] == 0
+        assert again["chunks_unchanged"] == len(stored)
+        assert again["chunks_deleted"] == 0
+        assert again["document_id"] == first["document_id"]
+        assert len(chat_service.embedded_texts) == embedded
+        assert _stored(chat_service, conversation_id="a") == stored
+
+    asyncio.run(main())
+
+
+def test_edited_document_deletes_only_its_stale_chunks(chat_service):
+    async def main():
+        await chat_service.add_document_to_context(ORIGINAL, conversation_id="a", document_key="guia")
+        await chat_service.add_document_to_context(ORIGINAL, conversation_id="a", document_key="otra")
+        before = _stored(chat_service, document_key="guia")
+        other = _stored(chat_service, document_key="otra")
+
+        edited = await chat_service.add_document_to_context(
+            EDITED, conversation_id="a", document_key="guia"
+        )
+        after = _stored(chat_service, document_key="guia")
+
+        assert edited["chunks_created"] >= 1
+        assert edited["chunks_deleted"] == edited["chunks_created"]
+        assert any("Sección 3 revisada" in text for text in after.values())
+        assert not any("Sección 3:" in text for text in after.values())
+        # Los chunks que no cambiaron conservan su ID
+        assert len(set(before) & set(after)) == len(after) - edited["chunks_created"]
+        # Otro documento de la misma conversación no se toca
+        assert _stored(chat_service, document_key="otra") == other
+
+    asyncio.run(main())
+
+
+def test_same_document_key_in_two_conversations(chat_service):
+    async def main():
+        await chat_service.add_document_to_context(ORIGINAL, conversation_id="a", document_key="guia")
+        await chat_service.add_document_to_context(ORIGINAL, conversation_id="b", document_key="guia")
+        in_a = _stored(chat_service, conversation_id="a")
+        in_b = _stored(chat_service, conversation_id="b")
+        # Mismo contenido y clave, distinta conversación: IDs distintos
+        assert not set(in_a) & set(in_b)
+
+        edited = await chat_service.add_document_to_context(
+            EDITED, conversation_id="a", document_key="guia"
+        )
+        assert edited["chunks_deleted"] >= 1
+        assert _stored(chat_service, conversation_id="b") == in_b
+
+        # Re-ingestar sin conversación no borra los chunks de ninguna conversación
+        await chat_service.add_document_to_context("Texto suelto", document_key="guia")
+        assert _stored(chat_service, conversation_id="b") == in_b
+        assert len(_stored(chat_service, conversation_id="a")) == len(in_a)
+
+    asyncio.run(main())
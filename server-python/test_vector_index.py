@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Pruebas del truncado Matryoshka y del índice cuantizado en memoria
+"""
+import numpy as np
+import pytest
+
+from app.services.vector_index import (
+    QUANTIZATION_BINARY,
+    QUANTIZATION_INT8,
+    QuantizedVectorIndex,
+    rescore,
+    truncate_embeddings
+)
+
+
+def _vectors(rows: int, dimensions: int, seed: int = 0) -> np.ndarray:
+    return np.random.default_rng(seed).normal(size=(rows, dimensions)).astype(np.float32)
+
+
+def _unit(vectors: np.ndarray) -> np.ndarray:
+    return vectors / np.linalg.norm(vectors, axis=-1, keepdims=True)
+
+
+def test_truncate_keeps_prefix_with_unit_norm():
+    vectors = _vectors(4, 64)
+    truncated = truncate_embeddings(vectors, 16)
+    assert truncated.shape == (4, 16)
+    assert np.allclose(np.linalg.norm(truncated, axis=1), 1.0, atol=1e-5)
+    assert np.allclose(_unit(vectors[:, :16]), truncated, atol=1e-6)
+    assert truncate_embeddings(vectors, 0) is vectors
+
+
+def test_int8_preselection_follows_l2_for_vectors_of_any_norm():
+    # Normas muy distintas: el producto escalar y L2 ordenan distinto
+    vectors = _vectors(500, 32) * np.random.default_rng(1).uniform(0.1, 10, size=(500, 1)).astype(np.float32)
+    ids = [f"doc{i}" for i in range(len(vectors))]
+    query = _vectors(1, 32, seed=2)[0]
+
+    index = QuantizedVectorIndex(QUANTIZATION_INT8)
+    index.add(ids, vectors, [None] * len(ids))
+    candidates = set(index.search(query, 20))
+
+    exact = [doc_id for doc_id, _ in rescore(query, ids, vectors, 10)]
+    assert set(exact) <= candidates
+
+
+def test_binary_preselection_with_unit_vectors():
+    vectors = _unit(_vectors(500, 64))
+    ids = [f"doc{i}" for i in range(len(vectors))]
+    query = vectors[42] + 0.01 * _vectors(1, 64, seed=3)[0]
+
+    index = QuantizedVectorIndex(QUANTIZATION_BINARY)
+    index.add(ids, vectors, [None] * len(ids))
+    assert "doc42" in index.search(query, 5)
+
+
+def test_search_filters_by_group_and_skips_removed():
+    vectors = _unit(_vectors(6, 16))
+    ids = [f"doc{i}" for i in range(6)]
+    groups = ["a", "a", "a", "b", "b", None]
+
+    index = QuantizedVectorIndex(QUANTIZATION_INT8)
+    index.add(ids, vectors, groups)
+    assert set(index.search(vectors[0], 10, group="a")) == {"doc0", "doc1", "doc2"}
+
+    index.remove(["doc1"])
+    assert set(index.search(vectors[0], 10, group="a")) == {"doc0", "doc2"}
+    assert index.get_stats()["vectors"] == 5
+
+
+def test_mismatched_dimensions_are_rejected():
+    index = QuantizedVectorIndex(QUANTIZATION_INT8)
+    index.add(["doc0"], _vectors(1, 16), [None])
+
+    with pytest.raises(ValueError, match="dimensiones"):
+        index.add(["doc1"], _vectors(1, 32), [None])
+    with pytest.raises(ValueError, match="dimensiones"):
+        index.search(_vectors(1, 32)[0], 1)
+    assert index.get_stats()["vectors"] == 1
+
+    # Vaciado el índice, admite la nueva dimensión
+    index.clear()
+    index.add(["doc1"], _vectors(1, 32), [None])
+    assert index.get_stats()["dimensions"] == 32
@@ -10,6 +10,9 @@ import time
 import requests
 from typing import Optional
 
+# Sesión HTTP reutilizada por todas las comprobaciones (conexiones keep-alive)
+http_session = requests.Session()
+
 
 def check_ollama_running() -> bool:
     """
@@ -19,7 +22,7 @@ def check_ollama_running() -> bool:
         True si Ollama está ejecutándose, False en caso contrario
     """
     try:
-        response = requests.get("http://localhost:11434/api/tags", timeout=5)
+        response = http_session.get("http://localhost:11434/api/tags", timeout=5)
         return response.status_code == 200
     except requests.RequestException:
         return False
@@ -33,7 +36,7 @@ def check_models_available() -> dict:
         Diccionario con el estado de los modelos
     """
     try:
-        response = requests.get("http://localhost:11434/api/tags", timeout=5)
+        response = http_session.get("http://localhost:11434/api/tags", timeout=5)
         if response.status_code == 200:
             models = response.json()
             model_names = [model["name"] for model in models.get("models", [])]
@@ -175,12 +178,12 @@ def test_server():
     
     try:
         # Verificar que el servidor esté ejecutándose
-        response = requests.get("http://localhost:8000/health/", timeout=10)
+        response = http_session.get("http://localhost:8000/health/", timeout=10)
         if response.status_code == 200:
             print("✅ Servidor respondiendo correctamente")
             
             # Probar chat
-            chat_response = requests.post(
+            chat_response = http_session.post(
                 "http://localhost:8000/chat/",
                 json={
                     "message": "Hola, ¿cómo estás?",